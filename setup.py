@@ -37,6 +37,7 @@ INSTALL_REQUIRES = [
     "pygifsicle",
     "bilby",
     "statsmodels",
+    "threadpoolctl",
 ]
 EXTRA_REQUIRE = {
     "dev": [
@@ -46,7 +47,8 @@ EXTRA_REQUIRE = {
         "flake8>=5.0.4",
         "black>=22.12.0",
         "jupyter-book",
-    ]
+    ],
+    "zarr": ["zarr", "dask"],
 }
 
 HERE = os.path.dirname(os.path.realpath(__file__))
@@ -94,5 +96,5 @@ if __name__ == "__main__":
         extras_require=EXTRA_REQUIRE,
         classifiers=CLASSIFIERS,
         zip_safe=True,
-        entry_points={"console_scripts": []},
+        entry_points={"console_scripts": ["slipper=slipper.cli:main"]},
     )
@@ -0,0 +1,188 @@
+"""A queryable SQLite catalog of result files.
+
+Answering questions across thousands of fits ("which had acceptance < 0.2
+or took more than an hour?") would otherwise mean opening every result
+file. Instead, a summary row per result is registered in a local SQLite
+database, either explicitly or by passing `catalog=` to `Result.save` (or the
+`catalog` sampler kwarg)::
+
+    catalog = Catalog("fits.sqlite")
+    catalog.scan("campaign/**/result.nc")  # register existing results
+    for entry in catalog.query("acceptance < ? OR runtime > ?", (0.2, 3600)):
+        with entry.load() as result:  # lazily opened
+            ...
+"""
+import glob
+import hashlib
+import json
+import os
+import sqlite3
+import time
+from contextlib import closing, contextmanager
+from typing import Iterator, List, NamedTuple, Optional, Sequence
+
+import arviz as az
+import numpy as np
+
+from .sample.sampling_result import Result
+
+COLUMNS = [
+    ("path", "TEXT PRIMARY KEY"),
+    ("registered_at", "REAL"),
+    ("data_hash", "TEXT"),
+    ("n", "INTEGER"),
+    ("k", "INTEGER"),
+    ("degree", "INTEGER"),
+    ("diffMatrixOrder", "INTEGER"),
+    ("n_draws", "INTEGER"),
+    ("burn_in", "INTEGER"),
+    ("runtime", "REAL"),
+    ("acceptance", "REAL"),
+    ("ess_tau", "REAL"),
+    ("lp_mean", "REAL"),
+    ("summary_plot", "TEXT"),
+    ("attrs", "TEXT"),  # JSON of the sample_stats attrs (sampler config, layout...)
+]
+COLUMN_NAMES = [name for name, _ in COLUMNS]
+
+
+class CatalogEntry(NamedTuple):
+    path: str
+    registered_at: float
+    data_hash: str
+    n: int
+    k: int
+    degree: Optional[int]
+    diffMatrixOrder: Optional[int]
+    n_draws: int
+    burn_in: int
+    runtime: float
+    acceptance: float
+    ess_tau: float
+    lp_mean: float
+    summary_plot: Optional[str]
+    attrs: str
+
+    def load(self, lazy: bool = True) -> Result:
+        """Open the result (lazily by default, see Result.load)"""
+        return Result.load(self.path, lazy=lazy)
+
+
+class Catalog:
+    def __init__(self, path: str):
+        """
+        Parameters
+        ----------
+        path : str
+            SQLite database file (created if missing)
+        """
+        self.path = path
+        with self._connect() as conn:
+            columns = ", ".join(f"{name} {kind}" for name, kind in COLUMNS)
+            conn.execute(f"CREATE TABLE IF NOT EXISTS results ({columns})")
+            for column in ["acceptance", "runtime", "data_hash"]:
+                conn.execute(
+                    f"CREATE INDEX IF NOT EXISTS idx_{column} ON results ({column})"
+                )
+
+    @contextmanager
+    def _connect(self) -> Iterator[sqlite3.Connection]:
+        """A connection in a transaction, closed afterwards"""
+        # many fits may register at once, so wait for the lock
+        with closing(sqlite3.connect(self.path, timeout=60)) as conn, conn:
+            yield conn
+
+    def register(self, result: Result, path: str) -> CatalogEntry:
+        """Add (or update) the summary row of `result`, saved at `path`"""
+        entry = summarise(result, path)
+        placeholders = ", ".join("?" for _ in COLUMNS)
+        with self._connect() as conn:
+            conn.execute(
+                f"INSERT OR REPLACE INTO results VALUES ({placeholders})", entry
+            )
+        return entry
+
+    def scan(self, pattern: str) -> int:
+        """Register all results matching the glob `pattern`; returns their number"""
+        paths = sorted(glob.glob(pattern, recursive=True))
+        for path in paths:
+            with Result.load(path, lazy=True) as result:
+                self.register(result, path)
+        return len(paths)
+
+    def query(
+        self,
+        where: Optional[str] = None,
+        params: Sequence = (),
+        order_by: Optional[str] = None,
+        limit: Optional[int] = None,
+    ) -> List[CatalogEntry]:
+        """Entries matching the SQL condition `where` (eg 'runtime > ?')
+
+        Use `entry.load()` to open the corresponding results lazily.
+        """
+        sql = f"SELECT {', '.join(COLUMN_NAMES)} FROM results"
+        if where:
+            sql += f" WHERE {where}"
+        if order_by:
+            sql += f" ORDER BY {order_by}"
+        if limit is not None:
+            sql += f" LIMIT {int(limit)}"
+        with self._connect() as conn:
+            rows = conn.execute(sql, tuple(params)).fetchall()
+        return [CatalogEntry(*row) for row in rows]
+
+    def remove_missing(self) -> int:
+        """Drop the entries whose result no longer exists; returns their number"""
+        missing = [e.path for e in self.query() if not os.path.exists(e.path)]
+        with self._connect() as conn:
+            conn.executemany(
+                "DELETE FROM results WHERE path = ?", [(p,) for p in missing]
+            )
+        return len(missing)
+
+    def __len__(self) -> int:
+        with self._connect() as conn:
+            return conn.execute("SELECT COUNT(*) FROM results").fetchone()[0]
+
+
+def summarise(result: Result, path: str) -> CatalogEntry:
+    """Catalog row of `result` (only small arrays are read)"""
+    idata = result.idata
+    stats = idata.sample_stats
+    attrs = stats.attrs
+    post_stats = result.sample_stats
+    tau = idata.posterior["tau"].sel(draws=slice(result.burn_in, None))
+    ess_tau = float(az.ess(tau.values)) if tau.size > 1 else float("nan")
+    data = np.ascontiguousarray(result.data.values)
+    summary_plot = os.path.join(os.path.dirname(path), "summary.png")
+    spline_config = idata.constant_data.attrs
+    return CatalogEntry(
+        path=os.path.abspath(path),
+        registered_at=time.time(),
+        data_hash=hashlib.sha256(data.tobytes()).hexdigest(),
+        n=len(data),
+        k=int(idata.posterior.sizes["v_idx"]) + 1,
+        degree=_get_int(spline_config, "degree"),
+        diffMatrixOrder=_get_int(spline_config, "diffMatrixOrder"),
+        n_draws=int(idata.posterior.sizes["draws"]),
+        burn_in=int(result.burn_in),
+        runtime=float(attrs.get("runtime", np.nan)),
+        acceptance=float(post_stats["acceptance_rate"].mean()),
+        ess_tau=ess_tau,
+        lp_mean=float(post_stats["lp"].mean()),
+        summary_plot=summary_plot if os.path.exists(summary_plot) else None,
+        attrs=json.dumps({key: _jsonable(val) for key, val in attrs.items()}),
+    )
+
+
+def _get_int(attrs, key: str) -> Optional[int]:
+    return int(attrs[key]) if key in attrs else None
+
+
+def _jsonable(val):
+    if isinstance(val, np.generic):
+        return val.item()
+    if isinstance(val, np.ndarray):
+        return val.tolist()
+    return val
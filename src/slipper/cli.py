@@ -0,0 +1,211 @@
+"""Command line interface
+
+`slipper fit "data/*.npy" --outdir out`: fit many files in parallel
+`slipper serve --address /tmp/slipper.sock`: run a resident fit service
+"""
+import argparse
+import glob
+import json
+import os
+import sys
+import time
+from typing import List
+
+from .logger import logger
+from .parallel.pool import fit_files
+from .sample.plot_policy import PLOT_POLICIES, render_deferred
+from .sample.storage import STORAGE_OPTIONS
+
+
+def main(args=None) -> int:
+    """Run the command line interface; returns the exit status"""
+    parser = argparse.ArgumentParser(prog="slipper", description="P-spline PSD")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    _add_fit_parser(subparsers)
+    _add_serve_parser(subparsers)
+    _add_plot_parser(subparsers)
+    args = parser.parse_args(args)
+    if args.command == "fit":
+        # non-zero if any fit failed
+        return int(fit(args)["n_failed"] > 0)
+    elif args.command == "serve":
+        serve(args)
+    elif args.command == "plot":
+        plot(args)
+    return 0
+
+
+def _add_fit_parser(subparsers):
+    p = subparsers.add_parser(
+        "fit",
+        help="Fit P-spline PSDs to many data files in parallel",
+        description="Fit P-spline PSDs to every file matching the patterns. "
+        "Files (.npy/.txt/.csv) hold periodograms, or timeseries with "
+        "--timeseries. Each file's result is written to OUTDIR/<file stem>/.",
+    )
+    p.add_argument("patterns", nargs="+", help="Glob patterns of data files")
+    p.add_argument("--outdir", default="slipper_out", help="Output directory")
+    p.add_argument(
+        "--timeseries",
+        action="store_true",
+        help="Files are timeseries (their periodograms are fitted)",
+    )
+    p.add_argument("--n-cores", type=int, default=None, help="Cores to use")
+    p.add_argument(
+        "--overwrite", action="store_true", help="Re-run fits with existing results"
+    )
+    p.add_argument("--seed", type=int, default=None, help="Seed of the first fit")
+    sampler = p.add_argument_group("sampler arguments")
+    sampler.add_argument("--Ntotal", type=int, default=1000)
+    sampler.add_argument("--burnin", type=int, default=None)
+    sampler.add_argument("--thin", type=int, default=1)
+    sampler.add_argument(
+        "--storage",
+        choices=STORAGE_OPTIONS,
+        default="memory",
+        help="Keep the traces in RAM, in memory-mapped files in the outdir, "
+        "or choose depending on their size and the free memory",
+    )
+    sampler.add_argument(
+        "--plots",
+        choices=PLOT_POLICIES,
+        default="now",
+        help="Render summary plots now, never, later (`slipper plot`) "
+        "or in background processes",
+    )
+    sampler.add_argument(
+        "--retain",
+        choices=["all", "post_burnin"],
+        default="all",
+        help="Store every draw, or only those after the burn-in",
+    )
+    spline = p.add_argument_group("spline arguments")
+    spline.add_argument("--k", type=int, default=30, help="Number of basis elements")
+    spline.add_argument("--degree", type=int, default=3)
+    spline.add_argument("--diffMatrixOrder", type=int, default=2)
+    spline.add_argument("--eqSpaced", action="store_true")
+
+
+def _add_serve_parser(subparsers):
+    p = subparsers.add_parser(
+        "serve",
+        help="Run a resident fit service (see slipper.parallel.service)",
+    )
+    p.add_argument(
+        "--address",
+        default=os.path.expanduser("~/.slipper.sock"),
+        help="Unix socket path (only accessible to you) or localhost:PORT "
+        "to listen on",
+    )
+    p.add_argument(
+        "--authkey",
+        default=None,
+        help="Shared secret clients must present (default: $SLIPPER_AUTHKEY, "
+        "or a random key that is logged)",
+    )
+
+
+def _add_plot_parser(subparsers):
+    p = subparsers.add_parser(
+        "plot",
+        help="Render the summary plots of saved results (eg fits with --plots deferred)",
+    )
+    p.add_argument("patterns", nargs="+", help="Glob patterns of result files")
+    p.add_argument(
+        "--overwrite", action="store_true", help="Re-render existing summary plots"
+    )
+
+
+def plot(args: argparse.Namespace):
+    n_rendered = sum(render_deferred(p, args.overwrite) for p in args.patterns)
+    logger.info(f"Rendered {n_rendered} summary plots")
+
+
+def serve(args: argparse.Namespace):
+    from .parallel.service import FitService, parse_address
+
+    authkey = None if args.authkey is None else args.authkey.encode()
+    service = FitService(parse_address(args.address), authkey=authkey)
+    service.serve_forever()
+
+
+def fit(args: argparse.Namespace) -> dict:
+    """Run the `fit` command and return its throughput summary"""
+    t0 = time.time()
+    files = _expand_patterns(args.patterns)
+    if len(files) == 0:
+        raise FileNotFoundError(f"No data files match {args.patterns}")
+
+    outdirs = {f: os.path.join(args.outdir, _stem(f)) for f in files}
+    if len(set(outdirs.values())) != len(files):
+        raise ValueError("Data files must have unique names (file stems)")
+    todo = [f for f in files if args.overwrite or not _is_done(outdirs[f])]
+    n_skipped = len(files) - len(todo)
+    if n_skipped:
+        logger.info(f"Skipping {n_skipped} files with existing results")
+
+    results = []
+    if todo:
+        seeds = None if args.seed is None else [args.seed + i for i in range(len(todo))]
+        results = fit_files(
+            paths=todo,
+            outdirs=[outdirs[f] for f in todo],
+            timeseries=args.timeseries,
+            sampler_kwargs=dict(
+                Ntotal=args.Ntotal,
+                burnin=args.burnin,
+                thin=args.thin,
+                storage=args.storage,
+                retain=args.retain,
+                plots=args.plots,
+            ),
+            spline_kwargs=dict(
+                k=args.k,
+                degree=args.degree,
+                diffMatrixOrder=args.diffMatrixOrder,
+                eqSpaced=args.eqSpaced,
+            ),
+            n_cores=args.n_cores,
+            seeds=seeds,
+            raise_errors=False,
+        )
+
+    wall_time = time.time() - t0
+    n_done = sum(r is not None for r in results)
+    summary = dict(
+        n_files=len(files),
+        n_skipped=n_skipped,
+        n_fitted=n_done,
+        n_failed=len(todo) - n_done,
+        failed=[f for f, r in zip(todo, results) if r is None],
+        wall_time=wall_time,
+        fits_per_hour=3600 * n_done / wall_time,
+        steps_per_second=n_done * args.Ntotal / wall_time,
+    )
+    os.makedirs(args.outdir, exist_ok=True)
+    with open(os.path.join(args.outdir, "throughput.json"), "w") as f:
+        json.dump(summary, f, indent=2)
+    logger.info(
+        f"Fitted {n_done}/{len(todo)} files in {wall_time:.1f}s "
+        f"({summary['fits_per_hour']:.1f} fits/hour, {n_skipped} skipped)"
+    )
+    return summary
+
+
+def _expand_patterns(patterns: List[str]) -> List[str]:
+    files = set()
+    for pattern in patterns:
+        files.update(glob.glob(pattern))
+    return sorted(files)
+
+
+def _stem(path: str) -> str:
+    return os.path.splitext(os.path.basename(path))[0]
+
+
+def _is_done(outdir: str) -> bool:
+    return os.path.exists(os.path.join(outdir, "result.nc"))
+
+
+if __name__ == "__main__":
+    sys.exit(main())
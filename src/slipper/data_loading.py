@@ -0,0 +1,35 @@
+"""Read data files for batch fitting."""
+import os
+
+import numpy as np
+
+from .fourier_methods import get_periodogram
+
+SUPPORTED_EXTENSIONS = [".npy", ".txt", ".csv"]
+
+
+def load_data(path: str, timeseries: bool = False) -> np.ndarray:
+    """Load a 1D array from a .npy, .txt or .csv file
+
+    Parameters
+    ----------
+    path : str
+        The file to load
+    timeseries : bool
+        If True, the file holds a timeseries and its periodogram is returned
+    """
+    ext = os.path.splitext(path)[1].lower()
+    if ext == ".npy":
+        data = np.load(path)
+    elif ext == ".txt":
+        data = np.loadtxt(path)
+    elif ext == ".csv":
+        data = np.loadtxt(path, delimiter=",")
+    else:
+        raise ValueError(
+            f"Unsupported data file {path} (supported: {SUPPORTED_EXTENSIONS})"
+        )
+    data = np.asarray(data, dtype=float).ravel()
+    if timeseries:
+        data = get_periodogram(timeseries=data)
+    return data
@@ -0,0 +1,9 @@
+from .async_fit import AsyncSamplerPool, fit_async
+from .pool import fit_batch, fit_chains, fit_files
+from .scheduler import ResourceLayout, plan_layout
+from .shared_memory import (
+    SharedArrayHandle,
+    SharedArrays,
+    attach_array,
+    attach_psplines,
+)
@@ -0,0 +1,255 @@
+"""asyncio front-end for the PsplineSampler.
+
+Sampling is CPU bound, so it runs in a thread or process executor while the
+event loop stays responsive. Jobs can be cancelled mid-run (the sampler
+checks a stop event between MCMC steps) and report progress through an async
+iterator::
+
+    async with AsyncSamplerPool(max_workers=4, use_processes=True) as pool:
+        job = pool.submit(pdgrm, sampler_kwargs=dict(Ntotal=5000))
+        async for itr, n_steps in job.progress():
+            print(f"{itr}/{n_steps}")
+        result = await job
+
+The sampler draws from the global numpy and bilby RNGs, which threads
+share. With threads, a seeded fit therefore runs alone (fits without a seed
+may run together), so that it gives the same result as a serial run. Use
+processes to run seeded fits in parallel.
+"""
+import asyncio
+import multiprocessing
+import queue
+import threading
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from contextlib import contextmanager
+from typing import AsyncIterator, Dict, Optional, Tuple
+
+import numpy as np
+
+from ..sample.checkpoint import seed_rngs
+from ..sample.pspline_sampler import PsplineSampler
+from ..sample.sampling_result import Result
+
+
+class FitJob:
+    """Handle on a fit submitted to an AsyncSamplerPool (await it for the Result)"""
+
+    def __init__(self, future: asyncio.Future, stop_event, progress_queue, get):
+        self._future = future
+        self._stop_event = stop_event
+        self._progress_queue = progress_queue
+        self._get = get
+
+    def cancel(self):
+        """Stop the sampler before its next MCMC step"""
+        self._stop_event.set()
+
+    def done(self) -> bool:
+        return self._future.done()
+
+    async def result(self) -> Result:
+        try:
+            return await asyncio.shield(self._future)
+        except asyncio.CancelledError:
+            # the awaiting task was cancelled: stop the sampler too
+            self.cancel()
+            raise
+
+    def __await__(self):
+        return self.result().__await__()
+
+    async def progress(self) -> AsyncIterator[Tuple[int, int]]:
+        """Yield (iteration, n_steps) as sampling proceeds"""
+        while True:
+            item = await self._get(self._progress_queue)
+            if item is None:
+                return
+            if item is _NO_PROGRESS:
+                # a dead worker process (BrokenProcessPool) never sends the end
+                if self._future.done():
+                    return
+                continue
+            yield item
+
+
+class AsyncSamplerPool:
+    def __init__(
+        self,
+        max_workers: Optional[int] = None,
+        use_processes: bool = False,
+        progress_every: int = 10,
+    ):
+        """
+        Parameters
+        ----------
+        max_workers : int
+            Number of fits that run at the same time
+        use_processes : bool
+            Run fits in worker processes (true parallelism) instead of threads
+        progress_every : int
+            Report progress every this many MCMC steps
+        """
+        self.use_processes = use_processes
+        self.progress_every = progress_every
+        if use_processes:
+            self._manager = multiprocessing.Manager()
+            self.executor: Executor = ProcessPoolExecutor(max_workers)
+        else:
+            self._manager = None
+            self.executor = ThreadPoolExecutor(max_workers)
+
+    def submit(
+        self,
+        data: np.ndarray,
+        sampler_kwargs: Dict = {},
+        spline_kwargs: Dict = {},
+        outdir: str = ".",
+        seed: Optional[int] = None,
+    ) -> FitJob:
+        """Start a fit; must be called from a running event loop"""
+        loop = asyncio.get_running_loop()
+        if self.use_processes:
+            stop_event = self._manager.Event()
+            progress_queue = self._manager.Queue()
+            sink = progress_queue
+
+            async def get(progress_queue):
+                # time out, so that `progress` notices if the worker died
+                try:
+                    return await loop.run_in_executor(
+                        None, progress_queue.get, True, _PROGRESS_TIMEOUT
+                    )
+                except queue.Empty:
+                    return _NO_PROGRESS
+
+        else:
+            stop_event = threading.Event()
+            progress_queue = asyncio.Queue()
+            sink = _LoopQueueSink(loop, progress_queue)
+
+            async def get(progress_queue):
+                return await progress_queue.get()
+
+        future = loop.run_in_executor(
+            self.executor,
+            _run_sampler,
+            data,
+            outdir,
+            sampler_kwargs,
+            spline_kwargs,
+            seed,
+            stop_event,
+            sink,
+            self.progress_every,
+        )
+        return FitJob(future, stop_event, progress_queue, get)
+
+    def shutdown(self):
+        self.executor.shutdown(wait=True)
+        if self._manager is not None:
+            self._manager.shutdown()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *args):
+        await asyncio.get_running_loop().run_in_executor(None, self.shutdown)
+
+
+async def fit_async(
+    data: np.ndarray,
+    sampler_kwargs: Dict = {},
+    spline_kwargs: Dict = {},
+    outdir: str = ".",
+    seed: Optional[int] = None,
+    pool: Optional[AsyncSamplerPool] = None,
+) -> Result:
+    """Fit `data` without blocking the event loop (cancelling the task stops sampling)
+
+    Uses a single-thread pool for the call unless a `pool` is given.
+    """
+    if pool is not None:
+        return await pool.submit(data, sampler_kwargs, spline_kwargs, outdir, seed)
+    async with AsyncSamplerPool(max_workers=1) as pool:
+        return await pool.submit(data, sampler_kwargs, spline_kwargs, outdir, seed)
+
+
+# seconds between checks that a worker process is alive
+_PROGRESS_TIMEOUT = 1.0
+_NO_PROGRESS = object()
+
+
+class _RngLock:
+    """Lock on the global RNGs: exclusive for seeded fits, shared otherwise
+
+    Waiting seeded fits go first, so they are not starved by unseeded ones.
+    """
+
+    def __init__(self):
+        self._condition = threading.Condition()
+        self._n_shared = 0
+        self._exclusive = False
+        self._n_waiting = 0
+
+    @contextmanager
+    def hold(self, exclusive: bool):
+        with self._condition:
+            if exclusive:
+                self._n_waiting += 1
+                self._condition.wait_for(
+                    lambda: not self._exclusive and not self._n_shared
+                )
+                self._n_waiting -= 1
+                self._exclusive = True
+            else:
+                self._condition.wait_for(
+                    lambda: not self._exclusive and not self._n_waiting
+                )
+                self._n_shared += 1
+        try:
+            yield
+        finally:
+            with self._condition:
+                if exclusive:
+                    self._exclusive = False
+                else:
+                    self._n_shared -= 1
+                self._condition.notify_all()
+
+
+_RNG_LOCK = _RngLock()
+
+
+class _LoopQueueSink:
+    """Thread-safe `put` into an asyncio.Queue owned by `loop`"""
+
+    def __init__(self, loop: asyncio.AbstractEventLoop, queue: asyncio.Queue):
+        self.loop = loop
+        self.queue = queue
+
+    def put(self, item):
+        self.loop.call_soon_threadsafe(self.queue.put_nowait, item)
+
+
+def _run_sampler(
+    data, outdir, sampler_kwargs, spline_kwargs, seed, stop_event, sink, every
+) -> Result:
+    def callback(itr: int, n_steps: int):
+        if itr % every == 0 or itr == n_steps - 1:
+            sink.put((itr, n_steps))
+
+    try:
+        with _RNG_LOCK.hold(exclusive=seed is not None):
+            seed_rngs(seed)
+            sampler = PsplineSampler(
+                data=data,
+                outdir=outdir,
+                sampler_kwargs=sampler_kwargs,
+                spline_kwargs=spline_kwargs,
+            )
+            sampler.run(
+                verbose=False, stop_event=stop_event, progress_callback=callback
+            )
+    finally:
+        sink.put(None)
+    return sampler.result
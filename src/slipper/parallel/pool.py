@@ -0,0 +1,226 @@
+"""Run many independent P-spline fits in a process pool."""
+import os
+from concurrent.futures import ProcessPoolExecutor
+from typing import List, Optional
+
+import numpy as np
+
+from ..data_loading import load_data
+from ..logger import logger
+from ..sample.checkpoint import seed_rngs
+from ..sample.pspline_sampler import PsplineSampler
+from ..splines.p_splines import PSplines
+from .scheduler import ResourceLayout, apply_layout, plan_layout
+from .shared_memory import SharedArrays, attach_array, attach_psplines
+
+# layout of the pool this worker process belongs to (set by the initializer)
+_WORKER_LAYOUT: Optional[ResourceLayout] = None
+
+
+def fit_batch(
+    datasets: List[np.ndarray],
+    outdirs: List[str],
+    sampler_kwargs: Optional[dict] = {},
+    spline_kwargs: Optional[dict] = {},
+    spline_model: Optional[PSplines] = None,
+    n_cores: Optional[int] = None,
+    seeds: Optional[List[int]] = None,
+    raise_errors: bool = True,
+) -> List[Optional[str]]:
+    """Fit each dataset with a PsplineSampler in a pool of worker processes.
+
+    The datasets (and the `spline_model`, if one is shared by all fits) are
+    placed in shared memory once, and workers attach to them without copying.
+    Passing the same array object several times (eg multiple chains on one
+    periodogram) shares a single copy.
+
+    The number of processes and BLAS threads per process is chosen by
+    `plan_layout`, and recorded in each result's sample_stats attrs.
+
+    Parameters
+    ----------
+    datasets : list of np.ndarray
+        The data (periodograms) to fit
+    outdirs : list of str
+        One output directory per dataset
+    sampler_kwargs, spline_kwargs : dict
+        Passed to every PsplineSampler
+    spline_model : PSplines
+        Optional prebuilt spline model used for every fit
+    n_cores : int
+        Number of cores to use (defaults to all available cores)
+    seeds : list of int
+        Optional numpy seed for each fit
+    raise_errors : bool
+        If False, failed fits are logged and their result path is None
+
+    Returns
+    -------
+    result_paths : list of str
+        Path of the result (`result.nc`, or `result.zarr`) written for each dataset
+    """
+    if len(datasets) != len(outdirs):
+        raise ValueError("Need one outdir per dataset")
+    seeds = [None] * len(datasets) if seeds is None else seeds
+    n = max(len(d) for d in datasets)
+    if spline_model is not None:
+        k = spline_model.n_basis
+    else:
+        k = spline_kwargs.get("k", min(round(n / 4), 40))
+    layout = plan_layout(len(datasets), n=n, k=k, n_cores=n_cores)
+    logger.info(f"Resource layout: {layout}")
+
+    with SharedArrays() as shared, ProcessPoolExecutor(
+        layout.n_processes, initializer=_init_worker, initargs=(layout,)
+    ) as pool:
+        spline_handle = None
+        if spline_model is not None:
+            spline_handle = shared.share_psplines(spline_model)
+        tasks = [
+            dict(
+                data=shared.share(data),
+                outdir=outdir,
+                sampler_kwargs=sampler_kwargs,
+                spline_kwargs=spline_kwargs,
+                spline_model=spline_handle,
+                seed=seed,
+            )
+            for data, outdir, seed in zip(datasets, outdirs, seeds)
+        ]
+        logger.info(
+            f"Fitting {len(tasks)} datasets with {layout.n_processes} workers "
+            f"({shared.nbytes / 1e6:.1f} MB shared)"
+        )
+        futures = [pool.submit(_fit_task, task) for task in tasks]
+        return [_get_result(f, task, raise_errors) for f, task in zip(futures, tasks)]
+
+
+def fit_files(
+    paths: List[str],
+    outdirs: List[str],
+    timeseries: bool = False,
+    sampler_kwargs: Optional[dict] = {},
+    spline_kwargs: Optional[dict] = {},
+    n_cores: Optional[int] = None,
+    seeds: Optional[List[int]] = None,
+    raise_errors: bool = True,
+) -> List[Optional[str]]:
+    """Fit the data in each file (see `fit_batch` and `load_data`)
+
+    Each worker loads its own file, so the parent process never holds more
+    than one dataset (the largest file is loaded to plan the layout).
+    """
+    if len(paths) != len(outdirs):
+        raise ValueError("Need one outdir per data file")
+    seeds = [None] * len(paths) if seeds is None else seeds
+    n = _largest_data_length(paths, timeseries)
+    k = spline_kwargs.get("k", min(round(n / 4), 40))
+    layout = plan_layout(len(paths), n=n, k=k, n_cores=n_cores)
+    logger.info(f"Resource layout: {layout}")
+
+    with ProcessPoolExecutor(
+        layout.n_processes, initializer=_init_worker, initargs=(layout,)
+    ) as pool:
+        tasks = [
+            dict(
+                path=path,
+                timeseries=timeseries,
+                outdir=outdir,
+                sampler_kwargs=sampler_kwargs,
+                spline_kwargs=spline_kwargs,
+                seed=seed,
+            )
+            for path, outdir, seed in zip(paths, outdirs, seeds)
+        ]
+        logger.info(f"Fitting {len(tasks)} files with {layout.n_processes} workers")
+        futures = [pool.submit(_fit_file_task, task) for task in tasks]
+        return [_get_result(f, task, raise_errors) for f, task in zip(futures, tasks)]
+
+
+def _largest_data_length(paths: List[str], timeseries: bool) -> int:
+    """Length of the data in the largest readable file"""
+    for path in sorted(paths, key=os.path.getsize, reverse=True):
+        try:
+            return len(load_data(path, timeseries=timeseries))
+        except Exception as e:
+            logger.warning(f"Could not load {path}: {e!r}")
+    return 0
+
+
+def fit_chains(
+    data: np.ndarray,
+    n_chains: int,
+    outdir: str = ".",
+    seed: int = 0,
+    **kwargs,
+) -> List[str]:
+    """Run `n_chains` independent chains on the same data (see `fit_batch`)"""
+    return fit_batch(
+        datasets=[data] * n_chains,
+        outdirs=[os.path.join(outdir, f"chain_{i}") for i in range(n_chains)],
+        seeds=[seed + i for i in range(n_chains)],
+        **kwargs,
+    )
+
+
+def _get_result(future, task: dict, raise_errors: bool) -> Optional[str]:
+    try:
+        return future.result()
+    except Exception as e:
+        if raise_errors:
+            raise
+        logger.error(f"Fit for {task['outdir']} failed: {e!r}")
+        return None
+
+
+def _init_worker(layout: ResourceLayout):
+    global _WORKER_LAYOUT
+    _WORKER_LAYOUT = layout
+    apply_layout(layout)
+
+
+def run_fit(
+    data: np.ndarray,
+    outdir: str,
+    sampler_kwargs: Optional[dict] = {},
+    spline_kwargs: Optional[dict] = {},
+    spline_model: Optional[PSplines] = None,
+    seed: Optional[int] = None,
+    run_metadata: Optional[dict] = None,
+) -> str:
+    """Run a single PsplineSampler fit and return the path of its result file"""
+    seed_rngs(seed)
+    sampler = PsplineSampler(
+        data=data,
+        outdir=outdir,
+        sampler_kwargs=sampler_kwargs,
+        spline_kwargs=spline_kwargs,
+        spline_model=spline_model,
+    )
+    sampler.run_metadata.update(run_metadata or {})
+    sampler.run(verbose=False)
+    return sampler.result_path
+
+
+def _fit_file_task(task: dict) -> str:
+    return run_fit(
+        data=load_data(task["path"], timeseries=task["timeseries"]),
+        outdir=task["outdir"],
+        sampler_kwargs=task["sampler_kwargs"],
+        spline_kwargs=task["spline_kwargs"],
+        seed=task["seed"],
+        run_metadata=None if _WORKER_LAYOUT is None else _WORKER_LAYOUT.as_attrs(),
+    )
+
+
+def _fit_task(task: dict) -> str:
+    spline_model = task["spline_model"]
+    return run_fit(
+        data=attach_array(task["data"]),
+        outdir=task["outdir"],
+        sampler_kwargs=task["sampler_kwargs"],
+        spline_kwargs=task["spline_kwargs"],
+        spline_model=None if spline_model is None else attach_psplines(spline_model),
+        seed=task["seed"],
+        run_metadata=None if _WORKER_LAYOUT is None else _WORKER_LAYOUT.as_attrs(),
+    )
@@ -0,0 +1,92 @@
+"""Split the available cores between sampler processes and BLAS threads.
+
+Chains are sequential Metropolis-within-Gibbs loops, so the cheapest way to
+use more cores is to run more chains at once. BLAS threads only pay off once
+the per-step linear algebra (`_vPv` is k x k, the spline mixture is
+k x n_grid_points) is large, so they are handed out only to the cores left
+over after every chain has a process, and only as many as the problem can use.
+The same goes for the threads of the chunked Whittle likelihood, which only
+kicks in for very long periodograms. Post-processing (the PSD bands) runs
+once per fit and can use all of a process's share of the cores.
+"""
+import math
+import os
+from typing import NamedTuple, Optional
+
+from threadpoolctl import threadpool_limits
+
+from ..sample.post_processing import set_band_threads
+from ..sample.pspline_sampler.whittle import (
+    CHUNK_SIZE,
+    CHUNKED_LLIKE_THRESHOLD,
+    set_likelihood_threads,
+)
+
+# number of k x k matrix elements needed to keep one extra BLAS thread busy
+_BLAS_WORK_PER_THREAD = 2500
+
+
+class ResourceLayout(NamedTuple):
+    n_cores: int
+    n_processes: int
+    chains_per_process: int
+    blas_threads: int
+    likelihood_threads: int
+
+    @property
+    def threads_per_process(self) -> int:
+        """Cores of each sampler process"""
+        return max(1, self.n_cores // self.n_processes)
+
+    def as_attrs(self) -> dict:
+        """Layout in a form that can be stored as netCDF attributes"""
+        return {f"layout_{key}": val for key, val in self._asdict().items()}
+
+
+def plan_layout(
+    n_chains: int, n: int, k: int, n_cores: Optional[int] = None
+) -> ResourceLayout:
+    """Decide how to run `n_chains` fits of length-`n` data with `k` basis elements
+
+    Parameters
+    ----------
+    n_chains : int
+        Number of independent sampler runs
+    n : int
+        Length of the data (periodogram)
+    k : int
+        Number of spline basis elements
+    n_cores : int
+        Cores available (defaults to the cores this process may use)
+    """
+    n_cores = n_cores or _available_cores()
+    n_processes = max(1, min(n_chains, n_cores))
+    chains_per_process = math.ceil(n_chains / n_processes)
+
+    spare_threads = max(1, n_cores // n_processes)
+    useful_threads = max(1, (k * k) // _BLAS_WORK_PER_THREAD)
+    blas_threads = min(spare_threads, useful_threads)
+
+    likelihood_threads = 1
+    if n >= CHUNKED_LLIKE_THRESHOLD:
+        likelihood_threads = min(spare_threads, math.ceil(n / CHUNK_SIZE))
+    return ResourceLayout(
+        n_cores=n_cores,
+        n_processes=n_processes,
+        chains_per_process=chains_per_process,
+        blas_threads=blas_threads,
+        likelihood_threads=likelihood_threads,
+    )
+
+
+def apply_layout(layout: ResourceLayout):
+    """Limit the BLAS and likelihood threads of the current process to the layout"""
+    set_likelihood_threads(layout.likelihood_threads)
+    set_band_threads(layout.threads_per_process)
+    return threadpool_limits(limits=layout.blas_threads, user_api="blas")
+
+
+def _available_cores() -> int:
+    if hasattr(os, "sched_getaffinity"):
+        return len(os.sched_getaffinity(0))
+    return os.cpu_count() or 1
@@ -0,0 +1,223 @@
+"""A resident fit service that keeps imports and spline matrices warm.
+
+Small, frequent fits are dominated by start-up costs (importing arviz, skfda
+and bilby, building the B-spline basis and penalty matrices). `FitService`
+pays these once and then serves fit jobs over a local Unix socket or a
+localhost TCP port. The basis and penalty matrices of earlier jobs stay in
+the process-wide spline matrix cache (slipper.splines.cache)::
+
+    # server (eg `slipper serve --address /tmp/slipper.sock`)
+    FitService("/tmp/slipper.sock", authkey=key).serve_forever()
+
+    # client
+    with FitClient("/tmp/slipper.sock", authkey=key) as client:
+        result = client.fit(pdgrm, sampler_kwargs=dict(Ntotal=2000))
+
+Requests are pickled, so whoever can connect can run code as the service:
+clients must present the service's secret authkey (by default
+$SLIPPER_AUTHKEY, or a random key generated and logged by the service),
+Unix sockets are only accessible to their owner and TCP ports are only
+opened on the loopback interface.
+"""
+import os
+import secrets
+import tempfile
+import time
+import traceback
+from multiprocessing import AuthenticationError
+from multiprocessing.connection import Client, Listener
+from typing import Dict, Optional, Tuple, Union
+
+import numpy as np
+
+from ..logger import logger
+from ..sample.checkpoint import seed_rngs
+from ..sample.pspline_sampler import PsplineSampler
+from ..sample.sampling_result import Result
+from ..splines.cache import get_default_cache
+
+Address = Union[str, Tuple[str, int]]
+AUTHKEY_ENV = "SLIPPER_AUTHKEY"
+LOOPBACK_HOSTS = ["localhost", "127.0.0.1", "::1"]
+
+
+def parse_address(address: str) -> Address:
+    """'host:port' -> (host, port), anything else is a Unix socket path"""
+    host, _, port = address.rpartition(":")
+    if host and port.isdigit():
+        return host.strip("[]"), int(port)
+    return address
+
+
+class FitService:
+    def __init__(
+        self,
+        address: Address = ("localhost", 0),
+        authkey: Optional[bytes] = None,
+    ):
+        """
+        Parameters
+        ----------
+        address : str or (host, port)
+            Unix socket path or localhost (host, port); port 0 picks a free port
+        authkey : bytes
+            Shared secret that clients must present (defaults to
+            $SLIPPER_AUTHKEY, or a random key, see `authkey`)
+        """
+        if not isinstance(address, str) and address[0] not in LOOPBACK_HOSTS:
+            raise ValueError(
+                f"FitService only listens on localhost ({LOOPBACK_HOSTS}), "
+                f"not {address[0]}"
+            )
+        if authkey is None and os.environ.get(AUTHKEY_ENV):
+            authkey = os.environ[AUTHKEY_ENV].encode()
+        self.authkey = authkey or secrets.token_hex(16).encode()
+        # the socket file is created readable and writable by its owner only
+        umask = os.umask(0o177)
+        try:
+            self.listener = Listener(address, authkey=self.authkey)
+        finally:
+            os.umask(umask)
+        self.stats = dict(n_jobs=0, n_failed=0, busy_time=0.0)
+
+    @property
+    def address(self) -> Address:
+        return self.listener.address
+
+    def serve_forever(self):
+        # the listener's address is gone once it is closed
+        address = self.address
+        logger.info(f"Fit service listening on {address}")
+        if os.environ.get(AUTHKEY_ENV, "").encode() != self.authkey:
+            logger.info(f"Fit service authkey: {self.authkey.decode()}")
+        try:
+            while True:
+                try:
+                    conn = self.listener.accept()
+                except AuthenticationError:
+                    logger.warning("Rejected a client with a wrong authkey")
+                    continue
+                with conn:
+                    if not self._handle_connection(conn):
+                        break
+        finally:
+            self.listener.close()
+            if isinstance(address, str) and os.path.exists(address):
+                os.remove(address)
+
+    def _handle_connection(self, conn) -> bool:
+        """Serve requests until the client disconnects; False means shut down"""
+        while True:
+            try:
+                request, payload = conn.recv()
+            except EOFError:
+                return True
+            if request == "shutdown":
+                conn.send(("ok", None))
+                return False
+            elif request == "stats":
+                cache_stats = get_default_cache().stats
+                conn.send(("ok", dict(self.stats, matrix_cache=dict(cache_stats))))
+            elif request == "fit":
+                conn.send(self._fit(**payload))
+            else:
+                conn.send(("error", f"Unknown request {request}"))
+
+    def _fit(
+        self,
+        data: np.ndarray,
+        sampler_kwargs: Dict = {},
+        spline_kwargs: Dict = {},
+        outdir: Optional[str] = None,
+        seed: Optional[int] = None,
+    ):
+        t0 = time.time()
+        self.stats["n_jobs"] += 1
+        try:
+            seed_rngs(seed)
+            if outdir is None:
+                # the result is sent back, its files are not kept
+                with tempfile.TemporaryDirectory(prefix="slipper_") as tmpdir:
+                    result = self._run(data, sampler_kwargs, spline_kwargs, tmpdir)
+            else:
+                result = self._run(data, sampler_kwargs, spline_kwargs, outdir)
+            response = ("ok", result)
+        except Exception:
+            self.stats["n_failed"] += 1
+            response = ("error", traceback.format_exc())
+        self.stats["busy_time"] += time.time() - t0
+        return response
+
+    @staticmethod
+    def _run(
+        data: np.ndarray, sampler_kwargs: Dict, spline_kwargs: Dict, outdir: str
+    ) -> Result:
+        sampler = PsplineSampler(
+            data=data,
+            outdir=outdir,
+            sampler_kwargs=sampler_kwargs,
+            spline_kwargs=spline_kwargs,
+        )
+        sampler.run(verbose=False)
+        return sampler.result
+
+
+class FitClient:
+    """Submit fit jobs to a running FitService"""
+
+    def __init__(self, address: Address, authkey: Optional[bytes] = None):
+        """
+        Parameters
+        ----------
+        address : str or (host, port)
+            Address of the service
+        authkey : bytes
+            The service's authkey (defaults to $SLIPPER_AUTHKEY)
+        """
+        if authkey is None:
+            if not os.environ.get(AUTHKEY_ENV):
+                raise ValueError(f"Pass the service's authkey or set ${AUTHKEY_ENV}")
+            authkey = os.environ[AUTHKEY_ENV].encode()
+        self.conn = Client(address, authkey=authkey)
+
+    def _request(self, request: str, payload=None):
+        self.conn.send((request, payload))
+        status, response = self.conn.recv()
+        if status == "error":
+            raise RuntimeError(f"Fit service error:\n{response}")
+        return response
+
+    def fit(
+        self,
+        data: np.ndarray,
+        sampler_kwargs: Dict = {},
+        spline_kwargs: Dict = {},
+        outdir: Optional[str] = None,
+        seed: Optional[int] = None,
+    ) -> Result:
+        return self._request(
+            "fit",
+            dict(
+                data=np.asarray(data),
+                sampler_kwargs=sampler_kwargs,
+                spline_kwargs=spline_kwargs,
+                outdir=outdir,
+                seed=seed,
+            ),
+        )
+
+    def stats(self) -> Dict:
+        return self._request("stats")
+
+    def shutdown(self):
+        self._request("shutdown")
+        self.close()
+
+    def close(self):
+        self.conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
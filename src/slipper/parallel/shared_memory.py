@@ -0,0 +1,130 @@
+"""Zero-copy sharing of large read-only arrays with worker processes.
+
+The parent process copies each array once into a `multiprocessing.shared_memory`
+segment and sends workers a small picklable handle. Workers reattach the
+segment as a read-only NumPy view, so the dense basis and periodograms are
+never pickled per task.
+"""
+from multiprocessing import resource_tracker, shared_memory
+from typing import Dict, NamedTuple, Tuple
+
+import numpy as np
+
+from ..splines.p_splines import PSplines
+
+
+class SharedArrayHandle(NamedTuple):
+    """Picklable reference to an array stored in shared memory"""
+
+    name: str
+    shape: Tuple[int, ...]
+    dtype: str
+    order: str = "C"
+
+
+class SharedPSplinesHandle(NamedTuple):
+    """Picklable reference to a PSplines whose matrices live in shared memory"""
+
+    knots: np.ndarray
+    degree: int
+    diffMatrixOrder: int
+    basis: SharedArrayHandle
+    penalty_matrix: SharedArrayHandle
+
+
+class SharedArrays:
+    """Owner of the shared memory segments created for a batch of tasks.
+
+    Use as a context manager: the segments are unlinked on exit, so the
+    block must outlive every worker that attaches to them.
+
+    >>> with SharedArrays() as shared:
+    ...     handle = shared.share(data)
+    ...     pool.submit(task, handle)
+    """
+
+    def __init__(self):
+        self._segments: Dict[str, shared_memory.SharedMemory] = {}
+        # keep the shared source arrays alive so `id` is not recycled
+        self._handles: Dict[int, Tuple[np.ndarray, SharedArrayHandle]] = {}
+
+    def share(self, array: np.ndarray) -> SharedArrayHandle:
+        """Copy `array` into shared memory (once per array object)"""
+        if id(array) in self._handles:
+            return self._handles[id(array)][1]
+        # keep the memory layout so reductions give bit-identical results
+        order = "F" if np.isfortran(array) else "C"
+        arr = np.asarray(array, order=order)
+        shm = shared_memory.SharedMemory(create=True, size=max(arr.nbytes, 1))
+        np.ndarray(arr.shape, arr.dtype, buffer=shm.buf, order=order)[...] = arr
+        handle = SharedArrayHandle(shm.name, arr.shape, arr.dtype.str, order)
+        self._segments[shm.name] = shm
+        self._handles[id(array)] = (array, handle)
+        _ATTACHED[shm.name] = shm  # forked workers inherit the mapping
+        return handle
+
+    def share_psplines(self, psplines: PSplines) -> SharedPSplinesHandle:
+        return SharedPSplinesHandle(
+            knots=np.asarray(psplines.knots),
+            degree=psplines.degree,
+            diffMatrixOrder=psplines.diffMatrixOrder,
+            basis=self.share(psplines.basis),
+            penalty_matrix=self.share(psplines.penalty_matrix),
+        )
+
+    @property
+    def nbytes(self) -> int:
+        return sum(shm.size for shm in self._segments.values())
+
+    def close(self):
+        for name, shm in self._segments.items():
+            _ATTACHED.pop(name, None)
+            try:
+                shm.close()
+            except BufferError:  # views still alive, unmapped once collected
+                pass
+            shm.unlink()
+        self._segments.clear()
+        self._handles.clear()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+# segments attached by this process, kept open for the lifetime of the process
+_ATTACHED: Dict[str, shared_memory.SharedMemory] = {}
+
+
+def _open_segment(name: str) -> shared_memory.SharedMemory:
+    if name not in _ATTACHED:
+        try:
+            shm = shared_memory.SharedMemory(name=name, track=False)
+        except TypeError:  # python < 3.13 always registers with the tracker
+            shm = shared_memory.SharedMemory(name=name)
+            # the owner unlinks the segment, not the attaching worker
+            resource_tracker.unregister(shm._name, "shared_memory")
+        _ATTACHED[name] = shm
+    return _ATTACHED[name]
+
+
+def attach_array(handle: SharedArrayHandle) -> np.ndarray:
+    """Return a read-only view onto a shared array (no copy)"""
+    shm = _open_segment(handle.name)
+    arr = np.ndarray(
+        handle.shape, np.dtype(handle.dtype), buffer=shm.buf, order=handle.order
+    )
+    arr.flags.writeable = False
+    return arr
+
+
+def attach_psplines(handle: SharedPSplinesHandle) -> PSplines:
+    return PSplines.from_matrices(
+        knots=handle.knots,
+        degree=handle.degree,
+        diffMatrixOrder=handle.diffMatrixOrder,
+        basis=attach_array(handle.basis),
+        penalty_matrix=attach_array(handle.penalty_matrix),
+    )
@@ -0,0 +1,314 @@
+"""A work queue on a shared filesystem, for sharding fit campaigns across nodes.
+
+A campaign manifest is split into one JSON file per task. Tasks move between
+the sub-directories of the queue with atomic `os.rename` calls, so any number
+of workers (on any node that sees the filesystem) can claim them without a
+broker::
+
+    queue_dir/
+        queue.json   <- lease and retry settings
+        pending/     <- tasks waiting for a worker
+        running/     <- claimed tasks (file mtime is the lease heartbeat)
+        done/
+        failed/
+
+A worker that crashes stops refreshing its lease; once the lease expires the
+task is moved back to `pending/` by the next worker that looks.
+
+Creating a queue that already exists (queue.json is written last) does
+nothing, so every worker can be started with the same manifest.
+
+Manifest format (dict or JSON file)::
+
+    {
+        "outdir": "campaign_out",           # optional, default: queue_dir/results
+        "sampler_kwargs": {"Ntotal": 5000},   # defaults for every task
+        "spline_kwargs": {"k": 30},
+        "tasks": [
+            {"data": "path/to/pdgrm.npy"},
+            {"data": "path/to/ts.txt", "timeseries": true, "name": "ts"},
+        ],
+    }
+"""
+import json
+import os
+import socket
+import threading
+import time
+import traceback
+from typing import Dict, Optional, Union
+
+from ..data_loading import load_data
+from ..logger import logger
+from .pool import run_fit
+
+STATES = ["pending", "running", "done", "failed"]
+# held (as a directory) while a queue is being created
+_CREATING = ".creating"
+# seconds to wait for another worker to finish creating the queue
+CREATE_TIMEOUT = 600
+# seconds a reclaiming worker may hold a running task file
+_RECLAIM_GRACE = 1.0
+
+
+class Task:
+    def __init__(self, queue: "WorkQueue", task_id: str, spec: Dict):
+        self.queue = queue
+        self.id = task_id
+        self.spec = spec
+
+    @property
+    def path(self) -> str:
+        return self.queue._path("running", self.id)
+
+    def heartbeat(self):
+        """Extend the lease of this (running) task"""
+        os.utime(self.path)
+
+    def __repr__(self):
+        return f"Task({self.id})"
+
+
+class WorkQueue:
+    def __init__(self, queue_dir: str):
+        self.queue_dir = queue_dir
+        with open(os.path.join(queue_dir, "queue.json")) as f:
+            self.config = json.load(f)
+
+    @classmethod
+    def create(
+        cls,
+        queue_dir: str,
+        manifest: Union[str, Dict],
+        lease: float = 3600,
+        max_attempts: int = 3,
+    ) -> "WorkQueue":
+        """Split a campaign manifest into tasks in `queue_dir`
+
+        If the queue already exists it is opened as it is (its tasks are not
+        re-enqueued). If another process is creating it, this waits for it.
+
+        Parameters
+        ----------
+        queue_dir : str
+            Directory (on the shared filesystem) holding the queue
+        manifest : str or dict
+            The campaign manifest (or path to its JSON file)
+        lease : float
+            Seconds without a heartbeat before a running task is reclaimed
+        max_attempts : int
+            Number of claims before a task is moved to `failed/`
+        """
+        config_path = os.path.join(queue_dir, "queue.json")
+        os.makedirs(queue_dir, exist_ok=True)
+        try:
+            os.mkdir(os.path.join(queue_dir, _CREATING))
+        except FileExistsError:
+            return cls._wait_for(queue_dir)
+        try:
+            if os.path.exists(config_path):
+                logger.info(f"Queue {queue_dir} already exists, not recreating it")
+                return cls(queue_dir)
+            cls._write_tasks(queue_dir, manifest)
+            _write_json(config_path, dict(lease=lease, max_attempts=max_attempts))
+        finally:
+            os.rmdir(os.path.join(queue_dir, _CREATING))
+        return cls(queue_dir)
+
+    @classmethod
+    def _wait_for(cls, queue_dir: str) -> "WorkQueue":
+        """Open the queue once the process creating it has finished"""
+        deadline = time.time() + CREATE_TIMEOUT
+        while os.path.isdir(os.path.join(queue_dir, _CREATING)):
+            if time.time() > deadline:
+                raise TimeoutError(
+                    f"Queue {queue_dir} is still being created, remove "
+                    f"{os.path.join(queue_dir, _CREATING)} if its creator died"
+                )
+            time.sleep(1)
+        return cls(queue_dir)
+
+    @staticmethod
+    def _write_tasks(queue_dir: str, manifest: Union[str, Dict]):
+        if isinstance(manifest, str):
+            with open(manifest) as f:
+                manifest = json.load(f)
+        for state in STATES:
+            os.makedirs(os.path.join(queue_dir, state), exist_ok=True)
+        # tasks left by an interrupted creation are not enqueued twice
+        existing = {
+            f for state in STATES for f in os.listdir(os.path.join(queue_dir, state))
+        }
+        outdir = manifest.get("outdir", os.path.join(queue_dir, "results"))
+        for i, task in enumerate(manifest["tasks"]):
+            name = task.get("name", f"task_{i:06d}")
+            spec = dict(
+                data=os.path.abspath(task["data"]),
+                timeseries=task.get("timeseries", False),
+                outdir=os.path.abspath(task.get("outdir", os.path.join(outdir, name))),
+                sampler_kwargs={
+                    **manifest.get("sampler_kwargs", {}),
+                    **task.get("sampler_kwargs", {}),
+                },
+                spline_kwargs={
+                    **manifest.get("spline_kwargs", {}),
+                    **task.get("spline_kwargs", {}),
+                },
+                seed=task.get("seed"),
+                attempts=0,
+            )
+            if f"{name}.json" not in existing:
+                _write_json(os.path.join(queue_dir, "pending", f"{name}.json"), spec)
+        logger.info(f"Created queue {queue_dir} with {len(manifest['tasks'])} tasks")
+
+    def _path(self, state: str, task_id: str) -> str:
+        return os.path.join(self.queue_dir, state, f"{task_id}.json")
+
+    def _ids(self, state: str):
+        files = os.listdir(os.path.join(self.queue_dir, state))
+        return sorted(f[: -len(".json")] for f in files if f.endswith(".json"))
+
+    def status(self) -> Dict[str, int]:
+        return {state: len(self._ids(state)) for state in STATES}
+
+    def claim(self) -> Optional[Task]:
+        """Atomically claim the next pending task (None if there are none)"""
+        for task_id in self._ids("pending"):
+            pending = self._path("pending", task_id)
+            try:
+                # start the lease before the file becomes visible in running/
+                os.utime(pending)
+                os.rename(pending, self._path("running", task_id))
+            except FileNotFoundError:
+                continue  # claimed by another worker
+            task = Task(self, task_id, _read_json(self._path("running", task_id)))
+            task.spec["attempts"] += 1
+            task.spec["worker"] = f"{socket.gethostname()}:{os.getpid()}"
+            _write_json(task.path, task.spec)
+            if task.spec["attempts"] > self.config["max_attempts"]:
+                self._move(task, "failed")
+                continue
+            return task
+        return None
+
+    def complete(self, task: Task):
+        self._move(task, "done")
+
+    def fail(self, task: Task, error: str = ""):
+        task.spec["error"] = error
+        _write_json(task.path, task.spec)
+        self._move(task, "failed")
+
+    def _move(self, task: Task, state: str):
+        deadline = time.time() + _RECLAIM_GRACE
+        while True:
+            try:
+                return os.rename(task.path, self._path(state, task.id))
+            except FileNotFoundError:
+                # another worker may be checking the lease (see reclaim_expired)
+                if time.time() > deadline:
+                    break
+                time.sleep(0.05)
+        logger.warning(f"{task} lost its lease before finishing ({state})")
+
+    def reclaim_expired(self) -> int:
+        """Move running tasks whose lease expired back to pending
+
+        The task is first renamed to a name private to this worker and its
+        lease checked again, so a task claimed afresh (after another worker
+        reclaimed it) between the two checks is put back, not reclaimed.
+        """
+        n = 0
+        for task_id in self._ids("running"):
+            running = self._path("running", task_id)
+            held = f"{running}.{socket.gethostname()}.{os.getpid()}.reclaim"
+            try:
+                if not self._expired(running):
+                    continue
+                os.rename(running, held)
+            except FileNotFoundError:
+                continue  # finished or reclaimed by someone else
+            if self._expired(held):
+                os.rename(held, self._path("pending", task_id))
+                logger.warning(f"Reclaimed expired task {task_id}")
+                n += 1
+            else:
+                os.rename(held, running)
+        return n
+
+    def _expired(self, path: str) -> bool:
+        return time.time() - os.path.getmtime(path) > self.config["lease"]
+
+
+def run_worker(queue_dir: str, max_tasks: Optional[int] = None) -> int:
+    """Claim and run tasks until the queue is empty (or `max_tasks` are done)
+
+    Returns the number of tasks completed by this worker.
+    """
+    queue = WorkQueue(queue_dir)
+    n_done = 0
+    while max_tasks is None or n_done < max_tasks:
+        queue.reclaim_expired()
+        task = queue.claim()
+        if task is None:
+            break
+        logger.info(f"Running {task}")
+        with _Heartbeat(task, interval=queue.config["lease"] / 4):
+            try:
+                _run_task(task.spec)
+            except Exception:
+                logger.error(f"{task} failed")
+                queue.fail(task, traceback.format_exc())
+                continue
+        queue.complete(task)
+        n_done += 1
+    logger.info(f"Worker finished {n_done} tasks, queue status: {queue.status()}")
+    return n_done
+
+
+def _run_task(spec: Dict) -> str:
+    return run_fit(
+        data=load_data(spec["data"], timeseries=spec["timeseries"]),
+        outdir=spec["outdir"],
+        sampler_kwargs=spec["sampler_kwargs"],
+        spline_kwargs=spec["spline_kwargs"],
+        seed=spec["seed"],
+    )
+
+
+class _Heartbeat:
+    """Refresh the lease of a task from a background thread"""
+
+    def __init__(self, task: Task, interval: float):
+        self.task = task
+        self.interval = interval
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._beat, daemon=True)
+
+    def _beat(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.task.heartbeat()
+            except FileNotFoundError:
+                # finished, or held for a moment by a reclaiming worker
+                continue
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *args):
+        self._stop.set()
+        self._thread.join()
+
+
+def _read_json(path: str) -> Dict:
+    with open(path) as f:
+        return json.load(f)
+
+
+def _write_json(path: str, obj: Dict):
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, "w") as f:
+        json.dump(obj, f, indent=2)
+    os.replace(tmp, path)
@@ -22,14 +22,17 @@ def plot_metadata(
     burn_in,
     fname=None,
     max_it=None,
+    draw_idx=None,
 ):
     φδτ_samples[φδτ_samples == 0] = np.nan
     frac_accepted[frac_accepted == 0] = np.nan
 
     fig = plt.figure(figsize=(5, 8), layout="constrained")
     gs = plt.GridSpec(5, 2, figure=fig)
-    draw_idx = np.arange(len(φδτ_samples))
-    max_it = len(φδτ_samples) if max_it is None else max_it
+    # iteration of each sample (the burn-in may not have been stored)
+    draw_idx = np.arange(len(φδτ_samples)) if draw_idx is None else draw_idx
+    post_burn_in = draw_idx >= burn_in
+    max_it = draw_idx[-1] + 1 if max_it is None else max_it
     for i, p in enumerate(["φ", "δ", "τ"]):
         # TRACE
         ax = fig.add_subplot(gs[i, 0])
@@ -42,17 +45,17 @@ def plot_metadata(
         # HISTOGRAM
         ax = fig.add_subplot(gs[i, 1])
         samps = φδτ_samples[:, i]
-        samps = samps[~np.isnan(samps)]
-        if len(samps[burn_in:]) > 0:
-            ax.hist(samps[burn_in:], bins=50, color=f"C{i}", density=True)
+        kept = ~np.isnan(samps)
+        if np.any(kept & post_burn_in):
+            ax.hist(samps[kept & post_burn_in], bins=50, color=f"C{i}", density=True)
         else:
-            ax.hist(samps[0:], bins=50, color=f"C{i}", density=True)
+            ax.hist(samps[kept], bins=50, color=f"C{i}", density=True)
         ax.set_yticks([])
         ax.set_xlabel(LATEX_LABELS[p])
 
     # FRAC ACCEPTED TRACE
     ax = fig.add_subplot(gs[3, 0])
-    ax.plot(frac_accepted, color="C3")
+    ax.plot(draw_idx, frac_accepted, color="C3")
     ax.axvline(burn_in, color="k", linestyle="--")
     ax.set_ylabel("Accepted %")
     ax.set_xlabel("Iteration")
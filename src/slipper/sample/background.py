@@ -0,0 +1,42 @@
+"""Run a function of slipper in a fresh Python process.
+
+Plots are rendered in separate processes so that they do not hold up
+sampling. These are new interpreters rather than multiprocessing children:
+forking is unsafe once the sampler runs threads (BLAS, the chunked
+likelihood), and fork is not the default start method on every platform
+(spawn on macOS, forkserver from Python 3.14), while spawn and forkserver
+re-import the user's `__main__`, re-running any script without an
+`if __name__ == "__main__"` guard.
+"""
+import os
+import subprocess
+import sys
+from typing import Optional, Sequence
+
+# directory slipper is imported from, appended to the child's sys.path in case
+# it is not on the default path (eg a source checkout added to sys.path by a
+# script); appending keeps it behind the stdlib and site-packages
+_PACKAGE_ROOT = os.path.dirname(os.path.dirname(os.path.dirname(__file__)))
+
+
+def start_function(
+    module: str, function: str, args: Sequence[str] = (), stdin: Optional[int] = None
+) -> subprocess.Popen:
+    """Start `module.function(*args)` in a new Python process
+
+    Parameters
+    ----------
+    module : str
+        Absolute name of the module defining the function
+    function : str
+        Name of the function, called with the string arguments `args`
+    args : sequence of str
+        Arguments of the function
+    stdin : int
+        Standard input of the process (eg subprocess.PIPE)
+    """
+    code = (
+        f"import sys; sys.path.append({_PACKAGE_ROOT!r}); "
+        f"from {module} import {function}; {function}(*sys.argv[1:])"
+    )
+    return subprocess.Popen([sys.executable, "-c", code, *args], stdin=stdin)
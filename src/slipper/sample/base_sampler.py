@@ -1,16 +1,43 @@
+import json
 import os
+import shutil
 import time
 from abc import ABC, abstractmethod
 from pprint import pformat
-from typing import Dict, List, Optional, Tuple, Union
+from typing import Callable, Dict, Iterator, List, Optional, Tuple, Union
 
 import numpy as np
 from tqdm.auto import trange
 
-from slipper.plotting.gif_creator import create_gif
 from slipper.sample.sampling_result import Result
 
+from ..catalog import Catalog
 from ..logger import logger
+from ..splines.p_splines import PSplines
+from .checkpoint import (
+    load_checkpoint,
+    remove_checkpoint,
+    save_checkpoint,
+    set_rng_state,
+)
+from .checkpoint_renderer import CheckpointRenderer
+from .checkpoint_summary import CheckpointSummary
+from .planner import RunPlan, plan_run
+from .plot_policy import PLOT_POLICIES, render_in_background
+from .psd_products import PRODUCTS_GROUP
+from .storage import (
+    RETAIN_OPTIONS,
+    allocate_traces,
+    copy_rows,
+    n_trace_rows,
+    remove_traces,
+    window_rows,
+)
+from .zarr_store import ZarrResultStore
+
+
+class SamplingCancelled(Exception):
+    """Raised by BaseSampler.run when its stop_event is set"""
 
 
 class BaseSampler(ABC):
@@ -20,16 +47,33 @@ class BaseSampler(ABC):
         outdir: str = ".",
         sampler_kwargs: Optional[dict] = {},
         spline_kwargs: Optional[dict] = {},
+        spline_model=None,
     ):
         self.data = data
         self.outdir = _mkdir(outdir)
         self.result: Union[Result, None] = None
         self.sampler_kwargs = sampler_kwargs
+        if spline_model is not None:
+            # a prebuilt model (eg shared between workers) fixes the spline config
+            spline_kwargs = dict(
+                spline_kwargs,
+                k=spline_model.n_basis,
+                degree=spline_model.degree,
+                diffMatrixOrder=spline_model.diffMatrixOrder,
+            )
         self.spline_kwargs = spline_kwargs
 
         assert (self.n_steps - self.burnin) / self.thin > self.n_basis
-        self.spline_model = None
+        self.spline_model = spline_model
         self.samples = None
+        # memory-mapped traces the checkpoints refer to, and their filled rows
+        self._checkpoint_traces: Optional[Dict[str, np.ndarray]] = None
+        self._n_saved_rows = 0
+        self._store: Optional[ZarrResultStore] = None
+        self._summary: Optional[CheckpointSummary] = None
+        self._renderer: Optional[CheckpointRenderer] = None
+        # extra run information stored in the result's sample_stats attrs
+        self.run_metadata: Dict = {}
 
     def __check_to_make_chkpt_plt(self, step_num) -> bool:
         n_plts = self.sampler_kwargs["n_checkpoint_plts"]
@@ -39,27 +83,310 @@ class BaseSampler(ABC):
             )
         return n_plts > 0 and step_num in self._checkpoint_plt_idx
 
-    def run(self, verbose: bool = True):
+    def run(
+        self,
+        verbose: bool = True,
+        stop_event=None,
+        progress_callback: Optional[Callable[[int, int], None]] = None,
+    ):
+        """Run the MCMC, then compile and save the result
+
+        Parameters
+        ----------
+        verbose : bool
+            Show a progress bar
+        stop_event : threading.Event or multiprocessing.Event
+            If set, sampling stops before the next step (raising SamplingCancelled)
+        progress_callback : callable
+            Called as progress_callback(itr, n_steps) after every step
+        """
+        self._start_run()
+        self._sample(1, verbose, stop_event, progress_callback)
+
+    def iter_samples(
+        self,
+        chunk_size: int = 100,
+        retain: bool = True,
+        verbose: bool = False,
+        stop_event=None,
+    ) -> Iterator[Dict[str, np.ndarray]]:
+        """Run the MCMC, yielding blocks of draws as they are produced
+
+        Each block is a dict of copies of the draws of (up to) `chunk_size`
+        consecutive iterations: 'draws' (iteration numbers), 'V', 'φ', 'δ',
+        'τ' and 'lp'.
+
+        Parameters
+        ----------
+        chunk_size : int
+            Number of iterations per block
+        retain : bool
+            Keep the traces, and compile and save the result at the end (as
+            `run`). If False only a rolling window of chunk_size + 1 draws is
+            kept and nothing is saved.
+        verbose : bool
+            Show a progress bar
+        stop_event : threading.Event or multiprocessing.Event
+            If set, sampling stops before the next step (raising SamplingCancelled)
+        """
+        # the rows of a block must not be overwritten before it is yielded
+        window = chunk_size + 1
+        # the overrides only apply to this iteration (not to a later `run`)
+        sampler_kwargs = self.sampler_kwargs
+        if not retain:
+            self.sampler_kwargs = dict(
+                self.sampler_kwargs, retain="none", burnin_window=window
+            )
+        elif self.sampler_kwargs["retain"] == "post_burnin":
+            burnin_window = max(self.sampler_kwargs["burnin_window"], window)
+            self.sampler_kwargs = dict(self.sampler_kwargs, burnin_window=burnin_window)
+
+        try:
+            self._start_run()
+            block_start = 0
+            for itr in self._iter_steps(1, verbose, stop_event, None):
+                if itr + 1 - block_start == chunk_size or itr == self.n_steps - 1:
+                    yield self._draws_block(block_start, itr)
+                    block_start = itr + 1
+            if retain:
+                self._finish_run()
+            else:
+                remove_traces(self.samples)
+                self.samples = None
+                self._join_renderer()
+                remove_checkpoint(self.outdir)
+        finally:
+            self.sampler_kwargs = sampler_kwargs
+
+    def _draws_block(self, start: int, stop: int) -> Dict[str, np.ndarray]:
+        """Copies of the draws of iterations start..stop"""
+        rows = [self._row(itr) for itr in range(start, stop + 1)]
+        block = dict(draws=np.arange(start, stop + 1))
+        for key in ["V", "φ", "δ", "τ"]:
+            block[key] = self.samples[key][rows]
+        block["lp"] = self.samples["lpost_trace"][rows]
+        return block
+
+    def _start_run(self):
         msg = f"Running sampler with the following arguments:\n"
         msg += f"Sampler arguments:\n{pformat(self.sampler_kwargs)}\n"
         msg += f"Spline arguments:\n{pformat(self.spline_kwargs)}\n"
         logger.info(msg)
 
+        plan = self.plan()
+        logger.info(plan.summary())
+        for warning in plan.warnings:
+            logger.warning(warning)
+        self.sampler_kwargs["storage"] = plan.storage
+
         self.t0 = time.process_time()
         self._init_mcmc()
-        for itr in trange(1, self.n_steps, desc="MCMC sampling", disable=not verbose):
+        self._itr = 0
+        self._init_store(resume=False)
+        self._init_summary()
+
+    def plan(self, memory_limit: Optional[int] = None) -> RunPlan:
+        """Predicted memory use and runtime of this run (see slipper.sample.planner)"""
+        return plan_run(
+            len(self.data), self.sampler_kwargs, self.spline_kwargs, memory_limit
+        )
+
+    @classmethod
+    def resume(
+        cls,
+        outdir: str,
+        verbose: bool = True,
+        stop_event=None,
+        progress_callback: Optional[Callable[[int, int], None]] = None,
+    ) -> "BaseSampler":
+        """Continue the run checkpointed in `outdir` (see `checkpoint_every`)
+
+        The chain continues exactly where the checkpoint left it, so the
+        final result matches that of an uninterrupted run.
+        """
+        ckpt = load_checkpoint(outdir)
+        spline_model = PSplines(
+            knots=ckpt["knots"],
+            degree=ckpt["spline_kwargs"]["degree"],
+            diffMatrixOrder=ckpt["spline_kwargs"]["diffMatrixOrder"],
+        )
+        sampler = cls(
+            data=ckpt["data"],
+            outdir=outdir,
+            sampler_kwargs=ckpt["sampler_kwargs"],
+            spline_kwargs=ckpt["spline_kwargs"],
+            spline_model=spline_model,
+        )
+        sampler.run_metadata.update(ckpt["run_metadata"])
+        itr = ckpt["itr"]
+        traces = ckpt["traces"]
+        if sampler.sampler_kwargs["storage"] == "memmap":
+            # carry on with the traces of the interrupted run
+            sampler.samples = traces
+        else:
+            shapes = {key: val.shape[1:] for key, val in traces.items()}
+            sampler.samples = sampler._allocate_samples(shapes)
+            for key, val in traces.items():
+                copy_rows(val, sampler.samples[key], 0, ckpt["n_rows"])
+        for key, rows in ckpt["window"].items():
+            sampler.samples[key][: len(rows)] = rows
+        sampler._checkpoint_traces = traces
+        sampler._n_saved_rows = ckpt["n_rows"]
+        sampler._itr = itr
+        sampler._init_store(resume=True)
+        sampler._init_summary()
+        set_rng_state(ckpt["rng_state"])
+        sampler.t0 = time.process_time() - ckpt["runtime"]
+        logger.info(f"Resuming from iteration {itr} of {sampler.n_steps}")
+        sampler._sample(itr + 1, verbose, stop_event, progress_callback)
+        return sampler
+
+    def _sample(self, start: int, verbose: bool, stop_event, progress_callback):
+        """Run the MCMC loop from iteration `start`, then compile and save"""
+        for _ in self._iter_steps(start, verbose, stop_event, progress_callback):
+            pass
+        self._finish_run()
+
+    def _iter_steps(
+        self, start: int, verbose: bool, stop_event, progress_callback
+    ) -> Iterator[int]:
+        """Run the MCMC loop from iteration `start`, yielding after every step"""
+        if self._summary is not None:
+            self._renderer = CheckpointRenderer(self._summary.plot_kwargs)
+        try:
+            yield from self._steps(start, verbose, stop_event, progress_callback)
+        except BaseException:
+            # memory-mapped traces are kept if a checkpoint refers to them
+            if self._checkpoint_traces is not self.samples:
+                remove_traces(self.samples)
+            self._join_renderer()
+            raise
+        if self._renderer is not None:
+            # the GIF is made while the result is compiled and saved
+            self._renderer.close(
+                f"{self.outdir}/checkpoint*.png", f"{self.outdir}/checkpoint.gif"
+            )
+
+    def _steps(
+        self, start: int, verbose: bool, stop_event, progress_callback
+    ) -> Iterator[int]:
+        checkpoint_every = self.sampler_kwargs["checkpoint_every"]
+        for itr in trange(
+            start,
+            self.n_steps,
+            initial=start - 1,
+            total=self.n_steps - 1,
+            desc="MCMC sampling",
+            disable=not verbose,
+        ):
+            if stop_event is not None and stop_event.is_set():
+                raise SamplingCancelled(f"Sampling cancelled at iteration {itr}")
             self._mcmc_step(itr)
+            self._itr = itr
+            if progress_callback is not None:
+                progress_callback(itr, self.n_steps)
+            if self._summary is not None:
+                self._add_to_summary(itr)
             if self.__check_to_make_chkpt_plt(itr):
                 logger.info("<<Plotting checkpoint>>")
                 self.__plot_checkpoint(itr)
+            if checkpoint_every and itr % checkpoint_every == 0:
+                self._save_checkpoint(itr)
+            if self._store and itr + 1 - self._next_flush >= self._store.chunk_draws:
+                self._flush_to_store(itr)
+            yield itr
+
+    def _finish_run(self):
+        """Compile and save the result, then clean up"""
+        if self._store:
+            self._flush_to_store(self._itr)
         self._comile_sampling_result()
-        self.samples = None
+        traces, self.samples = self.samples, None
         self.save()
-        if self.sampler_kwargs["n_checkpoint_plts"]:
-            logger.info("<<Creating gif>>")
-            create_gif(
-                f"{self.outdir}/checkpoint*.png", f"{self.outdir}/checkpoint.gif"
-            )
+        remove_traces(traces)
+        self._join_renderer()
+        remove_checkpoint(self.outdir)
+
+    def _save_checkpoint(self, itr: int):
+        if self._checkpoint_traces is None:
+            if self.sampler_kwargs["storage"] == "memmap":
+                self._checkpoint_traces = self.samples
+            else:
+                shapes = {key: val.shape[1:] for key, val in self.samples.items()}
+                self._checkpoint_traces = allocate_traces(
+                    shapes, self._n_rows, "memmap", self.outdir
+                )
+        n_rows = self._n_rows_filled(itr)
+        save_checkpoint(
+            self.outdir,
+            itr,
+            self.samples,
+            self._checkpoint_traces,
+            n_rows=n_rows,
+            n_window_rows=0 if self.sampler_kwargs["retain"] == "all" else self._window,
+            n_saved_rows=self._n_saved_rows,
+            data=np.asarray(self.data),
+            knots=np.asarray(self.spline_model.knots),
+            sampler_kwargs=self.sampler_kwargs,
+            spline_kwargs=self.spline_kwargs,
+            run_metadata=self.run_metadata,
+            runtime=time.process_time() - self.t0,
+        )
+        self._n_saved_rows = n_rows
+
+    def _allocate_samples(self, shapes: Dict[str, Tuple[int, ...]]) -> Dict:
+        """Allocate the traces (of the given per-draw shapes) in the chosen storage"""
+        return allocate_traces(
+            shapes, self._n_rows, self.sampler_kwargs["storage"], self.outdir
+        )
+
+    @property
+    def _window(self) -> int:
+        """Rows of the rolling window (see `_row`)"""
+        sk = self.sampler_kwargs
+        return window_rows(self.burnin, sk["retain"], sk["burnin_window"])
+
+    def _in_window(self, itr: int) -> bool:
+        retain = self.sampler_kwargs["retain"]
+        return retain == "none" or (retain == "post_burnin" and itr < self.burnin)
+
+    @property
+    def _n_rows(self) -> int:
+        """Rows allocated for each trace"""
+        sk = self.sampler_kwargs
+        return n_trace_rows(
+            self.n_steps, self.burnin, sk["retain"], sk["burnin_window"]
+        )
+
+    def _row(self, itr: int) -> int:
+        """Row of the traces that holds iteration `itr`
+
+        With retain='post_burnin', burn-in iterations cycle through the first
+        `burnin_window` rows and the retained iterations follow them. With
+        retain='none' all iterations cycle through the window.
+        """
+        if self.sampler_kwargs["retain"] == "all":
+            return itr
+        if self._in_window(itr):
+            return itr % self._window
+        return self._window + itr - self.burnin
+
+    def _n_rows_filled(self, itr: int) -> int:
+        """Number of rows written once iteration `itr` is done"""
+        if self._in_window(itr):
+            return min(itr + 1, self._window)
+        return self._row(itr) + 1
+
+    def _stored_draws(self, itr: int) -> Tuple[Union[slice, np.ndarray], np.ndarray]:
+        """Rows with the draws of iterations up to `itr` that are kept, and their
+        iteration numbers (in order)"""
+        if self.sampler_kwargs["retain"] == "all":
+            return slice(0, itr + 1), np.arange(itr + 1)
+        if not self._in_window(itr):
+            rows = slice(self._window, self._row(itr) + 1)
+            return rows, np.arange(self.burnin, itr + 1)
+        draws = np.arange(max(0, itr - self._window + 1), itr + 1)
+        return draws % self._window, draws
 
     @abstractmethod
     def _init_mcmc(self) -> None:
@@ -74,18 +401,118 @@ class BaseSampler(ABC):
         """
         raise NotImplementedError
 
+    @property
+    def result_path(self) -> str:
+        if self.sampler_kwargs["result_store"] == "zarr":
+            return os.path.join(self.outdir, "result.zarr")
+        return os.path.join(self.outdir, "result.nc")
+
     def save(self):
         assert self.result is not None, "No result to save"
-        self.result.save(f"{self.outdir}/result.nc")
+        plots = self.sampler_kwargs["plots"]
+        if self._store is None:
+            self.result.save(
+                self.result_path,
+                catalog=self.sampler_kwargs["catalog"],
+                plot=plots == "now",
+                **self._save_kwargs,
+            )
+        else:
+            # the draws were appended while sampling, only the final attrs are missing
+            attrs = self.result.idata.sample_stats.attrs
+            self._store.update_attrs("sample_stats", attrs)
+            if plots == "now":
+                self.result.make_summary_plot(os.path.join(self.outdir, "summary.png"))
+                # the plot computed the PSD quantiles, store them with the draws
+                products = self.result.idata[PRODUCTS_GROUP]
+                self._store.write_group(PRODUCTS_GROUP, products)
+            self._register_in_catalog()
+        if plots == "background":
+            render_in_background(self.result_path)
+
+    @property
+    def _save_kwargs(self) -> Dict:
+        sk = self.sampler_kwargs
+        return dict(compact=sk["compact_result"], float32=sk["float32_result"])
+
+    def _register_in_catalog(self):
+        if self.sampler_kwargs["catalog"]:
+            Catalog(self.sampler_kwargs["catalog"]).register(
+                self.result, self.result_path
+            )
+
+    def _init_store(self, resume: bool):
+        """Open the Zarr store that draws are appended to (if result_store='zarr')"""
+        self._store = None
+        if self.sampler_kwargs["result_store"] != "zarr":
+            return
+        if self.sampler_kwargs["retain"] == "none":
+            raise ValueError("retain='none' keeps no draws to store")
+        self._store = ZarrResultStore(
+            self.result_path, chunk_draws=self.sampler_kwargs["flush_every"]
+        )
+        first_draw = 0 if self.sampler_kwargs["retain"] == "all" else self.burnin
+        last_draw = self._store.last_draw() if resume else None
+        if not resume and self._store.exists:
+            shutil.rmtree(self._store.path)
+        # draws already in the store (eg from before a crash) are not re-appended
+        self._next_flush = first_draw if last_draw is None else last_draw + 1
+
+    def _flush_to_store(self, itr: int):
+        """Append the kept draws from self._next_flush up to `itr` to the store"""
+        start = self._next_flush
+        if start > itr:
+            return
+        rows = slice(self._row(start), self._row(itr) + 1)
+        block = self._compile_result(rows, np.arange(start, itr + 1))
+        self._store.append(block.export_idata(**self._save_kwargs))
+        self._next_flush = itr + 1
+
+    def _init_summary(self):
+        """Start the checkpoint summary (with the draws kept so far)"""
+        if not self.sampler_kwargs["n_checkpoint_plts"]:
+            return
+        self._summary = CheckpointSummary(
+            self.n_steps,
+            self.burnin,
+            basis=self.spline_model.basis,
+            data=self.data,
+            knots=self.spline_model.knots,
+        )
+        _, draws = self._stored_draws(self._itr)
+        for itr in draws:
+            self._add_to_summary(itr)
+
+    def _add_to_summary(self, itr: int):
+        row = self._row(itr)
+        self._summary.add(itr, self.samples["τ"][row], self.samples["V"][row])
 
     def __plot_checkpoint(self, i: int):
+        # only the draws since the last checkpoint are processed here, the
+        # plot is rendered in the background
         fname = f"{self.outdir}/checkpoint_{i}.png"
-        self._comile_sampling_result()
-        self.result.make_summary_plot(fn=fname, use_cached=False, max_it=self.n_steps)
+        rows, draws = self._stored_draws(i)
+        φδτ = np.stack([self.samples[key][rows] for key in ["φ", "δ", "τ"]], axis=1)
+        snapshot = self._summary.snapshot(
+            φδτ, self.samples["acceptance_fraction"][rows], draws
+        )
+        self._renderer.submit(fname, snapshot)
+
+    def _join_renderer(self):
+        if self._renderer is not None:
+            self._renderer.join()
+            self._renderer = None
 
     def _comile_sampling_result(self):
-        idx = np.where(self.samples["τ"] != 0)[0]
-        self.result = Result.compile_idata_from_sampling_results(
+        # the kept rows are a slice (unless still in the burn-in window), so
+        # the traces are not copied
+        self.result = self._compile_result(*self._stored_draws(self._itr))
+
+    def _compile_result(
+        self, idx: Union[slice, np.ndarray], draw_idx: np.ndarray
+    ) -> Result:
+        """Result with the trace rows `idx`, labelled as iterations `draw_idx`"""
+        return Result.compile_idata_from_sampling_results(
             posterior_samples=np.array(
                 [
                     self.samples["φ"][idx],
@@ -101,6 +528,17 @@ class BaseSampler(ABC):
             data=self.data,
             runtime=time.process_time() - self.t0,
             burn_in=self.sampler_kwargs["burnin"],
+            draw_idx=draw_idx,
+            attrs=dict(
+                self.run_metadata,
+                sampler_kwargs=json.dumps(self.sampler_kwargs),
+                spline_kwargs=json.dumps(self.spline_kwargs),
+            ),
+            spline_config=dict(
+                degree=self.spline_model.degree,
+                diffMatrixOrder=self.spline_model.diffMatrixOrder,
+                n_grid_points=self.spline_model.n_grid_points,
+            ),
         )
 
     @property
@@ -113,11 +551,19 @@ class BaseSampler(ABC):
         kwgs.update(kwargs)
         if kwgs["burnin"] == None:
             kwgs["burnin"] = kwgs["Ntotal"] // 3
-        self._sampler_kwargs = kwgs
-        if self._sampler_kwargs["n_checkpoint_plts"]:
-            logger.warning(
-                "Checkpoint plotting is enabled. This will slow down the sampling process."
+        if kwgs["retain"] not in RETAIN_OPTIONS:
+            raise ValueError(
+                f"retain must be one of {RETAIN_OPTIONS}, not {kwgs['retain']}"
+            )
+        if kwgs["plots"] not in PLOT_POLICIES:
+            raise ValueError(
+                f"plots must be one of {PLOT_POLICIES}, not {kwgs['plots']}"
             )
+        if kwgs["result_store"] not in ["netcdf", "zarr"]:
+            raise ValueError(
+                f"result_store must be 'netcdf' or 'zarr', not {kwgs['result_store']}"
+            )
+        self._sampler_kwargs = kwgs
 
     @property
     def spline_kwargs(self):
@@ -141,6 +587,16 @@ class BaseSampler(ABC):
             δα=1e-04,
             δβ=1e-04,
             n_checkpoint_plts=0,
+            checkpoint_every=0,
+            storage="memory",
+            retain="all",
+            burnin_window=100,
+            result_store="netcdf",
+            flush_every=1000,
+            compact_result=False,
+            float32_result=False,
+            catalog=None,
+            plots="now",
         )
 
     def _default_spline_kwargs(self):
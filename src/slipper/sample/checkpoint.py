@@ -0,0 +1,151 @@
+"""Sampler checkpoints, so long runs can be resumed after being killed.
+
+A checkpoint holds everything the MCMC loop depends on: the sample arrays
+filled so far, the current iteration, the data, the spline/sampler settings
+and the state of both random number generators used while sampling (numpy's
+global RandomState and bilby's Generator). Resuming from it continues the
+chain exactly as if it had never stopped.
+
+The rows of the traces past the rolling burn-in window (see
+BaseSampler._row) are written once and never changed, so they are not
+copied into the checkpoint file. They are kept in memory-mapped traces (see
+slipper.sample.storage) that the checkpoint refers to: the traces
+themselves with 'memmap' storage, or a copy on disk to which each checkpoint
+only appends the rows filled since the previous one. Only the window rows,
+which the chain keeps overwriting, are stored in the checkpoint file. The
+cost of a checkpoint therefore does not grow with the length of the run,
+and resuming maps the traces rather than reading them into memory.
+"""
+import json
+import os
+from typing import Dict, Optional
+
+import numpy as np
+from bilby.core.utils import random as bilby_random
+
+from .storage import open_traces, remove_traces, traces_dir
+
+CHECKPOINT_FNAME = "checkpoint.npz"
+
+
+def checkpoint_path(outdir: str) -> str:
+    return os.path.join(outdir, CHECKPOINT_FNAME)
+
+
+def seed_rngs(seed: Optional[int]):
+    """Seed every random number generator used by the samplers"""
+    if seed is not None:
+        np.random.seed(seed)
+        bilby_random.seed(seed)
+
+
+def get_rng_state() -> Dict:
+    name, keys, pos, has_gauss, cached_gaussian = np.random.get_state()
+    return dict(
+        np_rng_keys=keys,
+        np_rng_meta=json.dumps([name, pos, has_gauss, cached_gaussian]),
+        bilby_rng=json.dumps(bilby_random.rng.bit_generator.state),
+    )
+
+
+def set_rng_state(state: Dict):
+    name, pos, has_gauss, cached_gaussian = json.loads(str(state["np_rng_meta"]))
+    np.random.set_state((name, state["np_rng_keys"], pos, has_gauss, cached_gaussian))
+    bilby_random.rng.bit_generator.state = json.loads(str(state["bilby_rng"]))
+
+
+def save_checkpoint(
+    outdir: str,
+    itr: int,
+    samples: Dict[str, np.ndarray],
+    traces: Dict[str, np.ndarray],
+    n_rows: Optional[int] = None,
+    n_window_rows: int = 0,
+    n_saved_rows: int = 0,
+    **kwargs,
+):
+    """Atomically write the checkpoint of iteration `itr` to `outdir`
+
+    Parameters
+    ----------
+    samples : dict
+        The sampler's traces
+    traces : dict
+        Memory-mapped traces that keep the rows past the window (`samples`
+        itself with 'memmap' storage)
+    n_rows : int
+        Number of rows filled (by default itr + 1)
+    n_window_rows : int
+        Number of leading rows that are rewritten as the chain runs (stored
+        in the checkpoint file)
+    n_saved_rows : int
+        Rows already in `traces` (from the previous checkpoint)
+    kwargs
+        Arrays or JSON-serialisable values to store with the checkpoint
+    """
+    n_rows = itr + 1 if n_rows is None else n_rows
+    n_window_rows = min(n_window_rows, n_rows)
+    for key, val in samples.items():
+        if traces[key] is not val:
+            new = slice(max(n_saved_rows, n_window_rows), n_rows)
+            traces[key][new] = val[new]
+        traces[key].flush()
+    arrays = {f"window/{key}": val[:n_window_rows] for key, val in samples.items()}
+    meta = {key: val for key, val in kwargs.items() if not isinstance(val, np.ndarray)}
+    meta.update(n_rows=n_rows, traces_dir=os.path.basename(traces_dir(traces)))
+    arrays.update({k: v for k, v in kwargs.items() if isinstance(v, np.ndarray)})
+    fname = checkpoint_path(outdir)
+    previous = _checkpoint_traces_dir(outdir)
+    tmp = f"{fname}.tmp"
+    with open(tmp, "wb") as f:
+        np.savez(f, itr=itr, meta=json.dumps(meta), **arrays, **get_rng_state())
+    os.replace(tmp, fname)
+    if previous is not None and os.path.basename(previous) != meta["traces_dir"]:
+        # left by an earlier run in this outdir
+        remove_traces(_open_or_none(previous))
+
+
+def load_checkpoint(outdir: str) -> Dict:
+    """Read a checkpoint (the RNG states are kept under 'rng_state')
+
+    The kept rows are under 'traces' (memory-mapped, read-write, with the
+    window rows not yet restored), the window rows under 'window'.
+    """
+    with np.load(checkpoint_path(outdir)) as f:
+        ckpt = {key: f[key] for key in f.files}
+    ckpt.update(json.loads(str(ckpt.pop("meta"))))
+    ckpt["itr"] = int(ckpt["itr"])
+    ckpt["window"] = {
+        key[len("window/") :]: ckpt.pop(key)
+        for key in list(ckpt)
+        if key.startswith("window/")
+    }
+    ckpt["traces"] = open_traces(os.path.join(outdir, ckpt.pop("traces_dir")))
+    ckpt["rng_state"] = {
+        key: ckpt.pop(key) for key in ["np_rng_keys", "np_rng_meta", "bilby_rng"]
+    }
+    return ckpt
+
+
+def remove_checkpoint(outdir: str):
+    """Delete the checkpoint in `outdir` and the traces it refers to"""
+    dirname = _checkpoint_traces_dir(outdir)
+    if dirname is not None:
+        remove_traces(_open_or_none(dirname))
+    if os.path.exists(checkpoint_path(outdir)):
+        os.remove(checkpoint_path(outdir))
+
+
+def _checkpoint_traces_dir(outdir: str) -> Optional[str]:
+    try:
+        with np.load(checkpoint_path(outdir)) as f:
+            meta = json.loads(str(f["meta"]))
+    except (OSError, KeyError, ValueError):
+        return None
+    if "traces_dir" not in meta:
+        return None
+    return os.path.join(os.path.abspath(outdir), meta["traces_dir"])
+
+
+def _open_or_none(dirname: str) -> Optional[Dict[str, np.ndarray]]:
+    return open_traces(dirname) if os.path.isdir(dirname) else None
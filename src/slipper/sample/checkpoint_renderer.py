@@ -0,0 +1,117 @@
+"""Render checkpoint plots in a separate process.
+
+Rendering a checkpoint plot with matplotlib takes far longer than an MCMC
+step. The sampler instead hands snapshots of its `CheckpointSummary` (copies
+of the traces and the PSD quantiles) to a `CheckpointRenderer`, which writes
+the PNGs, and finally the GIF, while sampling continues. The renderer is a
+new interpreter (see slipper.sample.background) reading pickled snapshots
+from its stdin. The queue is bounded: if the renderer falls behind, new
+snapshots are skipped rather than blocking the chain.
+"""
+import pickle
+import queue
+import subprocess
+import sys
+import threading
+from typing import Dict, Optional
+
+from ..logger import logger
+from .background import start_function
+
+MAX_PENDING = 8
+
+
+class CheckpointRenderer:
+    def __init__(self, plot_kwargs: Dict, max_pending: int = MAX_PENDING):
+        """
+        Parameters
+        ----------
+        plot_kwargs : dict
+            The plot_metadata kwargs that are the same for every checkpoint
+            (see CheckpointSummary.plot_kwargs)
+        max_pending : int
+            Number of snapshots that may wait to be rendered
+        """
+        self._queue = queue.Queue(max_pending)
+        self._process = start_function(__name__, "_render_loop", stdin=subprocess.PIPE)
+        # writes to the pipe block while the renderer is busy, so they are
+        # made by a thread and `submit` only has to check the queue
+        self._feeder = threading.Thread(
+            target=self._feed,
+            args=(plot_kwargs,),
+            name="slipper-checkpoints",
+            daemon=True,
+        )
+        self._feeder.start()
+        self._closed = False
+
+    def _feed(self, plot_kwargs: Dict):
+        try:
+            with self._process.stdin as pipe:
+                pickle.dump(plot_kwargs, pipe)
+                for task in iter(self._queue.get, None):
+                    pickle.dump(task, pipe)
+                    pipe.flush()
+                pickle.dump(None, pipe)
+        except OSError as e:
+            logger.warning(f"Checkpoint renderer stopped: {e}")
+
+    def submit(self, fname: str, snapshot: Dict) -> bool:
+        """Queue a snapshot to be rendered to `fname` (False if skipped)"""
+        try:
+            self._queue.put_nowait(("plot", fname, snapshot))
+        except queue.Full:
+            logger.warning(f"Checkpoint renderer is busy, skipping {fname}")
+            return False
+        return True
+
+    def close(self, gif_pattern: Optional[str] = None, gif_path: str = ""):
+        """Stop once the queued plots (and the GIF of `gif_pattern`) are rendered"""
+        if self._closed:
+            return
+        if gif_pattern:
+            self._put(("gif", gif_pattern, gif_path))
+        self._put(None)
+        self._closed = True
+
+    def _put(self, task):
+        # a dead renderer would never make room in the queue
+        while self._feeder.is_alive():
+            try:
+                return self._queue.put(task, timeout=1)
+            except queue.Full:
+                pass
+
+    def join(self):
+        """Wait for the renderer to finish (see `close`)"""
+        self.close()
+        self._feeder.join()
+        if self._process.wait() != 0:
+            logger.warning(
+                f"Checkpoint renderer exited with code {self._process.returncode}"
+            )
+
+
+def _render_loop():
+    """Render the tasks pickled to stdin (run in the renderer process)"""
+    from ..plotting.gif_creator import create_gif
+    from ..plotting.plot_sampling_metadata import plot_metadata
+
+    def tasks():
+        # ends at the None sent by `close`, or when the sampler is gone
+        try:
+            yield from iter(lambda: pickle.load(sys.stdin.buffer), None)
+        except EOFError:
+            logger.warning("Checkpoint renderer lost the sampler")
+
+    plot_kwargs = pickle.load(sys.stdin.buffer)
+    for kind, *args in tasks():
+        try:
+            if kind == "plot":
+                fname, snapshot = args
+                plot_metadata(**plot_kwargs, **snapshot, fname=fname)
+            else:
+                logger.info("<<Creating gif>>")
+                create_gif(*args)
+        except Exception as e:
+            logger.warning(f"Checkpoint rendering failed ({kind}): {e}")
@@ -0,0 +1,203 @@
+"""Incremental summary of a run for the checkpoint plots.
+
+Rebuilding the InferenceData and recomputing the PSD quantiles from all
+draws at every checkpoint makes the total cost of `n_checkpoint_plts` grow
+quadratically with the run length. `CheckpointSummary` instead keeps
+running quantile sketches of the PSD on the spline grid (`P2Quantiles`),
+fed with the draws made since the last update in batches of at most
+`SKETCH_BATCH` draws. The scalar traces (φ, δ, τ, acceptance) in the plots
+are those the sampler keeps (see the `retain` sampler kwarg), so the summary
+does not hold a copy of them.
+
+The sketches track the draws after the burn-in (or all draws so far while
+still in the burn-in). Checkpoint plots show the median and the pointwise
+90% interval; the final summary plot keeps the exact uniform band.
+"""
+from typing import Dict, List, Sequence
+
+import numpy as np
+
+from ..splines.utils import convert_v_samples_to_weights, unroll_index_map
+
+CHECKPOINT_QUANTILES = (0.5, 0.05, 0.95)
+# draws buffered before they are added to the sketches
+SKETCH_BATCH = 256
+
+
+class P2Quantiles:
+    """Streaming estimates of quantiles of each column of a stream of rows
+
+    The P² algorithm (Jain & Chlamtac, 1985) keeps five markers per quantile
+    and column, so memory and the cost per row do not grow with the number
+    of rows. It is vectorised over the quantiles and columns.
+    """
+
+    def __init__(self, probs: Sequence[float], n_columns: int):
+        p = np.asarray(probs, dtype=float)[:, None]
+        self.probs = p.ravel()
+        self.n_columns = n_columns
+        self.count = 0
+        self._first: List[np.ndarray] = []
+        # desired marker positions and their increments
+        self._desired = np.hstack([0 * p, 2 * p, 4 * p, 2 + 2 * p, 4 + 0 * p])
+        self._increments = np.hstack([0 * p, p / 2, p, (1 + p) / 2, 1 + 0 * p])
+        self._q = self._n = None
+
+    def update(self, rows: np.ndarray):
+        """Add rows (n_rows x n_columns)"""
+        for x in np.atleast_2d(rows):
+            self.count += 1
+            if self._q is None:
+                self._first.append(np.array(x, dtype=float))
+                if self.count == 5:
+                    first = np.sort(self._first, axis=0)
+                    shape = (len(self.probs), 5, self.n_columns)
+                    self._q = np.broadcast_to(first, shape).copy()
+                    self._n = np.broadcast_to(np.arange(5.0)[:, None], shape).copy()
+                    self._first = []
+            else:
+                self._add(x)
+
+    def _add(self, x: np.ndarray):
+        q, n = self._q, self._n
+        np.minimum(q[:, 0], x, out=q[:, 0])
+        np.maximum(q[:, 4], x, out=q[:, 4])
+        # markers above x move right (the last one always does)
+        n[:, 1:4] += x < q[:, 1:4]
+        n[:, 4] += 1
+        self._desired += self._increments
+        for i in [1, 2, 3]:
+            d = self._desired[:, i, None] - n[:, i]
+            up = (d >= 1) & (n[:, i + 1] - n[:, i] > 1)
+            down = (d <= -1) & (n[:, i - 1] - n[:, i] < -1)
+            move = up | down
+            if not move.any():
+                continue
+            s = np.where(up, 1.0, -1.0)
+            dq_up = (q[:, i + 1] - q[:, i]) / (n[:, i + 1] - n[:, i])
+            dq_down = (q[:, i] - q[:, i - 1]) / (n[:, i] - n[:, i - 1])
+            parabolic = q[:, i] + s / (n[:, i + 1] - n[:, i - 1]) * (
+                (n[:, i] - n[:, i - 1] + s) * dq_up
+                + (n[:, i + 1] - n[:, i] - s) * dq_down
+            )
+            linear = q[:, i] + s * np.where(up, dq_up, dq_down)
+            ok = (q[:, i - 1] < parabolic) & (parabolic < q[:, i + 1])
+            q[:, i] = np.where(move, np.where(ok, parabolic, linear), q[:, i])
+            n[:, i] += np.where(move, s, 0.0)
+
+    @property
+    def quantiles(self) -> np.ndarray:
+        """Current estimates (n_probs x n_columns)"""
+        if self._q is None:
+            return np.quantile(self._first, self.probs, axis=0)
+        return self._q[:, 2].copy()
+
+
+class CheckpointSummary:
+    def __init__(
+        self,
+        n_steps: int,
+        burn_in: int,
+        basis: np.ndarray,
+        data: np.ndarray,
+        knots: np.ndarray,
+    ):
+        """
+        Parameters
+        ----------
+        n_steps : int
+            Number of iterations of the run
+        burn_in : int
+            Iterations before the draws used for the PSD quantiles
+        basis : np.ndarray
+            Spline basis on its grid (n_grid_points x k)
+        data : np.ndarray
+            Data (periodogram) the PSD is plotted against
+        knots : np.ndarray
+            Knots of the spline model
+        """
+        self.n_steps = n_steps
+        self.burn_in = burn_in
+        self.basis = basis
+        self.data = data
+        self.knots = knots
+        # iteration, τ and V of the draws not yet in the sketch
+        self._n_pending = 0
+        self._pending_itr = np.empty(SKETCH_BATCH, dtype=int)
+        self._pending_τ = np.empty(SKETCH_BATCH)
+        self._pending_v = np.empty((SKETCH_BATCH, basis.shape[1] - 1))
+        self._sketch = self._new_sketch()
+        self._sketch_post_burn_in = False
+
+    def _new_sketch(self) -> P2Quantiles:
+        return P2Quantiles(CHECKPOINT_QUANTILES, len(self.basis))
+
+    def add(self, itr: int, τ: float, v):
+        """Record the draw of iteration `itr` (cheap: the sketch is updated
+        once `SKETCH_BATCH` draws are buffered, or at the next `update`)"""
+        i = self._n_pending
+        self._pending_itr[i], self._pending_τ[i], self._pending_v[i] = itr, τ, v
+        self._n_pending += 1
+        if self._n_pending == SKETCH_BATCH:
+            self.update()
+
+    def update(self):
+        """Add the draws recorded since the last update to the sketch"""
+        if not self._n_pending:
+            return
+        n, self._n_pending = self._n_pending, 0
+        itr, τ, v = self._pending_itr[:n], self._pending_τ[:n], self._pending_v[:n]
+        post = itr >= self.burn_in
+        if post.any() and not self._sketch_post_burn_in:
+            # drop the burn-in draws
+            self._sketch = self._new_sketch()
+            self._sketch_post_burn_in = True
+        if self._sketch_post_burn_in:
+            itr, τ, v = itr[post], τ[post], v[post]
+        if len(itr):
+            self._sketch.update(np.log(self._grid_psds(τ, v)))
+
+    def _grid_psds(self, τ: np.ndarray, v: np.ndarray) -> np.ndarray:
+        weights = convert_v_samples_to_weights(v)
+        splines = np.maximum(weights @ self.basis.T, 1e-20)
+        return splines * τ[:, None]
+
+    @property
+    def psd_quantiles(self) -> np.ndarray:
+        """Median, 5% and 95% PSD at the data frequencies (3 x n)"""
+        self.update()
+        quantiles = np.exp(self._sketch.quantiles)
+        return quantiles[:, unroll_index_map(len(self.basis), len(self.data))]
+
+    @property
+    def plot_kwargs(self) -> Dict:
+        """The plot_metadata kwargs that are the same for every checkpoint"""
+        return dict(
+            data=self.data,
+            db_list=self.basis,
+            knots=self.knots,
+            burn_in=self.burn_in,
+            max_it=self.n_steps,
+        )
+
+    def snapshot(
+        self, φδτ: np.ndarray, frac_accepted: np.ndarray, draw_idx: np.ndarray
+    ) -> Dict:
+        """Copies of the given traces and the current PSD quantiles (the
+        remaining plot_metadata kwargs, see `plot_kwargs`)
+
+        Parameters
+        ----------
+        φδτ : np.ndarray
+            φ, δ and τ of the draws kept by the sampler (n_draws x 3)
+        frac_accepted : np.ndarray
+            Acceptance fraction of these draws
+        draw_idx : np.ndarray
+            Their iteration numbers
+        """
+        return dict(
+            φδτ_samples=np.array(φδτ, dtype=float),
+            frac_accepted=np.array(frac_accepted, dtype=float),
+            model_quants=self.psd_quantiles,
+            draw_idx=np.array(draw_idx),
+        )
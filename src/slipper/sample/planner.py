@@ -0,0 +1,239 @@
+"""Predict the memory use and runtime of a run before starting it.
+
+Out-of-memory kills tend to happen in post-processing (the spline posterior
+is n_draws x n and the PSD bands are computed from it), hours after
+sampling started. `plan_run` estimates the size of everything a run
+allocates (traces, dense basis, spline posterior, netCDF file), the time it
+will take, picks the trace storage when `storage='auto'`, and lists warnings
+for whatever will not fit. `BaseSampler.run` logs these before sampling.
+
+Runtime coefficients were measured on a single core of a laptop-class CPU
+and are only meant to give the order of magnitude.
+"""
+import os
+from typing import NamedTuple, Optional, Tuple
+
+from ..splines.p_splines import default_n_grid_points
+from .post_processing import BAND_BLOCK_BYTES, BAND_COPIES
+from .storage import n_trace_rows
+
+_FLOAT_BYTES = 8
+
+# seconds per log-posterior evaluation: overhead, per basis x grid element,
+# per data point
+_LPOST_OVERHEAD = 5e-5
+_LPOST_PER_BASIS_ELEMENT = 1.5e-9
+_LPOST_PER_DATA_POINT = 7e-9
+# seconds per draw and grid point to compute the PSD quantiles
+_QUANTILE_PER_ELEMENT = 1e-7
+# seconds per draw and grid point to update the checkpoint quantile sketches
+_SKETCH_PER_ELEMENT = 7e-7
+# temporaries of length n in each likelihood evaluation
+_LIKELIHOOD_TEMPORARIES = 4
+# use memory-mapped traces above this fraction of the available memory
+_MEMMAP_FRACTION = 0.25
+
+
+class RunPlan(NamedTuple):
+    n: int
+    k: int
+    n_grid_points: int
+    n_rows: int  # rows allocated per trace
+    n_draws: int  # draws stored in the result
+    n_post: int  # post burn-in draws used for the PSD quantiles
+    trace_bytes: int
+    basis_bytes: int
+    posterior_bytes: int  # spline posterior (n_post x n)
+    sampling_peak_bytes: int
+    postprocessing_peak_bytes: int
+    netcdf_bytes: int
+    sampling_seconds: float
+    postprocessing_seconds: float
+    memory_limit: Optional[int]
+    storage: str
+    warnings: Tuple[str, ...]
+
+    @property
+    def peak_bytes(self) -> int:
+        return max(self.sampling_peak_bytes, self.postprocessing_peak_bytes)
+
+    def summary(self) -> str:
+        limit = "unknown" if self.memory_limit is None else _fmt(self.memory_limit)
+        return (
+            f"Run plan (n={self.n}, k={self.k}, {self.n_rows} trace rows):\n"
+            f"  traces: {_fmt(self.trace_bytes)} ({self.storage})\n"
+            f"  basis: {_fmt(self.basis_bytes)}\n"
+            f"  spline posterior: {_fmt(self.posterior_bytes)}\n"
+            f"  peak memory: {_fmt(self.peak_bytes)} (available: {limit})\n"
+            f"  netCDF: {_fmt(self.netcdf_bytes)}\n"
+            f"  runtime: ~{self.sampling_seconds:.0f}s sampling, "
+            f"~{self.postprocessing_seconds:.0f}s post-processing"
+        )
+
+
+def plan_run(
+    n: int,
+    sampler_kwargs: dict,
+    spline_kwargs: dict,
+    memory_limit: Optional[int] = None,
+) -> RunPlan:
+    """Estimate the resources of fitting length-`n` data
+
+    Parameters
+    ----------
+    n : int
+        Length of the data (periodogram)
+    sampler_kwargs : dict
+        Complete sampler kwargs (as in BaseSampler.sampler_kwargs)
+    spline_kwargs : dict
+        Complete spline kwargs (as in BaseSampler.spline_kwargs)
+    memory_limit : int
+        Bytes of memory available to the run (defaults to the available RAM,
+        within the memory limit of the process's cgroup)
+    """
+    sk = sampler_kwargs
+    k = spline_kwargs["k"]
+    n_steps, burnin = sk["Ntotal"], sk["burnin"]
+    n_grid_points = default_n_grid_points(k)
+    memory_limit = memory_limit or _available_memory()
+
+    n_rows = n_trace_rows(n_steps, burnin, sk["retain"], sk["burnin_window"])
+    n_draws = dict(all=n_steps, post_burnin=n_steps - burnin, none=0)[sk["retain"]]
+    n_post = n_steps - burnin
+    # V plus the six scalar traces
+    trace_bytes = n_rows * (k - 1 + 6) * _FLOAT_BYTES
+    basis_bytes = (n_grid_points * k + k * k) * _FLOAT_BYTES
+    data_bytes = n * _FLOAT_BYTES
+    posterior_bytes = n_post * n * _FLOAT_BYTES
+
+    storage = sk["storage"]
+    if storage == "auto":
+        too_big = memory_limit and trace_bytes > _MEMMAP_FRACTION * memory_limit
+        storage = "memmap" if too_big else "memory"
+    resident_traces = trace_bytes if storage == "memory" else 0
+    sampling_peak = (
+        resident_traces + basis_bytes + data_bytes * (1 + _LIKELIHOOD_TEMPORARIES)
+    )
+    # the quantiles are computed from blocks of grid points (see
+    # generate_spline_quantiles), and the weights of all post burn-in draws
+    band_bytes = min(n_post * min(n, n_grid_points) * _FLOAT_BYTES, BAND_BLOCK_BYTES)
+    postprocessing_peak = (
+        resident_traces
+        + basis_bytes
+        + data_bytes
+        + n_post * k * _FLOAT_BYTES
+        + band_bytes * BAND_COPIES
+    )
+    netcdf_bytes = (
+        n_draws * (k - 1 + 5) * _FLOAT_BYTES
+        + basis_bytes
+        + data_bytes
+        + (k + 1) * _FLOAT_BYTES
+    )
+
+    lpost_seconds = (
+        _LPOST_OVERHEAD
+        + _LPOST_PER_BASIS_ELEMENT * k * n_grid_points
+        + _LPOST_PER_DATA_POINT * n
+    )
+    sampling_seconds = n_steps * sk["thin"] * k * lpost_seconds
+    # the summary plot (and its quantiles) is only made in the run with plots='now'
+    postprocessing_seconds = (
+        n_post * min(n, n_grid_points) * _QUANTILE_PER_ELEMENT
+    ) * int(sk.get("plots", "now") == "now")
+    if sk["n_checkpoint_plts"]:
+        # checkpoint quantiles are updated incrementally (see checkpoint_summary)
+        postprocessing_seconds += n_steps * n_grid_points * _SKETCH_PER_ELEMENT
+
+    warnings = []
+    if memory_limit and sampling_peak > memory_limit:
+        warnings.append(
+            f"Sampling needs ~{_fmt(sampling_peak)} but only "
+            f"{_fmt(memory_limit)} is available; use storage='memmap'."
+        )
+    if memory_limit and postprocessing_peak > memory_limit:
+        warnings.append(
+            f"Computing the PSD quantiles of {n_post} draws x {n} frequencies "
+            f"needs ~{_fmt(postprocessing_peak)} but only {_fmt(memory_limit)} "
+            f"is available; reduce Ntotal - burnin or increase thin."
+        )
+    return RunPlan(
+        n=n,
+        k=k,
+        n_grid_points=n_grid_points,
+        n_rows=n_rows,
+        n_draws=n_draws,
+        n_post=n_post,
+        trace_bytes=trace_bytes,
+        basis_bytes=basis_bytes,
+        posterior_bytes=posterior_bytes,
+        sampling_peak_bytes=sampling_peak,
+        postprocessing_peak_bytes=postprocessing_peak,
+        netcdf_bytes=netcdf_bytes,
+        sampling_seconds=sampling_seconds,
+        postprocessing_seconds=postprocessing_seconds,
+        memory_limit=memory_limit,
+        storage=storage,
+        warnings=tuple(warnings),
+    )
+
+
+_MEMINFO = "/proc/meminfo"
+_CGROUP_ROOT = "/sys/fs/cgroup"
+
+
+def _available_memory() -> Optional[int]:
+    """Bytes the run can allocate: MemAvailable (free RAM plus reclaimable
+    caches), capped by the room left under the cgroup's memory limit"""
+    available = _meminfo_available()
+    if available is None:
+        try:
+            available = os.sysconf("SC_AVPHYS_PAGES") * os.sysconf("SC_PAGE_SIZE")
+        except (ValueError, OSError, AttributeError):
+            available = None
+    cgroup = _cgroup_available()
+    if available is None or cgroup is None:
+        return cgroup if available is None else available
+    return min(available, cgroup)
+
+
+def _meminfo_available() -> Optional[int]:
+    try:
+        with open(_MEMINFO) as f:
+            for line in f:
+                if line.startswith("MemAvailable:"):
+                    return int(line.split()[1]) * 1024
+    except (OSError, ValueError, IndexError):
+        pass
+    return None
+
+
+def _cgroup_available() -> Optional[int]:
+    """memory.max - memory.current (cgroup v2) or its v1 equivalent"""
+    for limit_file, usage_file in [
+        ("memory.max", "memory.current"),
+        ("memory/memory.limit_in_bytes", "memory/memory.usage_in_bytes"),
+    ]:
+        limit = _read_int(os.path.join(_CGROUP_ROOT, limit_file))
+        # no limit is 'max' (v2) or a huge number (v1)
+        if limit is None or limit >= 2**60:
+            continue
+        usage = _read_int(os.path.join(_CGROUP_ROOT, usage_file)) or 0
+        return max(limit - usage, 0)
+    return None
+
+
+def _read_int(path: str) -> Optional[int]:
+    try:
+        with open(path) as f:
+            return int(f.read().strip())
+    except (OSError, ValueError):
+        return None
+
+
+def _fmt(n_bytes: float) -> str:
+    for unit in ["B", "KB", "MB", "GB"]:
+        if n_bytes < 1024:
+            return f"{n_bytes:.1f}{unit}"
+        n_bytes /= 1024
+    return f"{n_bytes:.1f}TB"
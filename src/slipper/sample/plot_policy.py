@@ -0,0 +1,87 @@
+"""When to render the summary plot of a result.
+
+Rendering the summary plot (PSD quantiles through the per-draw loop, then
+matplotlib) can take a large share of a small fit's wall time. The `plots`
+sampler kwarg decouples it from sampling:
+
+- 'now': render before saving, as part of `run` (default)
+- 'none': never render
+- 'deferred': skip it; render later, eg with `slipper plot "out/**/result.nc"`
+  (see `render_deferred`)
+- 'background': render from the saved file in a separate process (see
+  slipper.sample.background), so the next fit can start right away.
+  At most `MAX_BACKGROUND_PLOTS` renderers run at once per process (the
+  cores are budgeted for the samplers, see slipper.parallel.scheduler): a
+  fit that finishes while they are busy waits for the oldest one.
+  `wait_for_background_plots` waits for them (this is also done when the
+  interpreter exits).
+"""
+import atexit
+import glob
+import os
+import subprocess
+from typing import List
+
+from ..logger import logger
+from .background import start_function
+
+PLOT_POLICIES = ["now", "none", "deferred", "background"]
+SUMMARY_FNAME = "summary.png"
+MAX_BACKGROUND_PLOTS = 1
+
+_BACKGROUND: List[subprocess.Popen] = []
+
+
+def summary_path(result_path: str) -> str:
+    return os.path.join(os.path.dirname(os.path.abspath(result_path)), SUMMARY_FNAME)
+
+
+def render_summary(result_path: str):
+    """Render the summary plot of a saved result next to it, and write the
+    PSD products it computes back to the result"""
+    from .sampling_result import Result
+
+    with Result.load(result_path, lazy=True) as result:
+        result.make_summary_plot(summary_path(result_path))
+        if result.new_products:
+            result.save_products(result_path)
+
+
+def render_in_background(result_path: str) -> subprocess.Popen:
+    """Render the summary plot of a saved result in a separate process
+
+    Waits for the oldest renderer first if `MAX_BACKGROUND_PLOTS` are running.
+    """
+    for process in [p for p in _BACKGROUND if p.poll() is not None]:
+        _BACKGROUND.remove(process)
+        _check(process)
+    while len(_BACKGROUND) >= MAX_BACKGROUND_PLOTS:
+        _check(_BACKGROUND.pop(0))
+    process = start_function(__name__, "render_summary", [os.path.abspath(result_path)])
+    _BACKGROUND.append(process)
+    return process
+
+
+@atexit.register
+def wait_for_background_plots():
+    """Wait for the background renderers started by this process"""
+    while _BACKGROUND:
+        _check(_BACKGROUND.pop(0))
+
+
+def _check(process: subprocess.Popen):
+    if process.wait() != 0:
+        logger.warning(f"Background plot of {process.args[-1]} failed")
+
+
+def render_deferred(pattern: str, overwrite: bool = False) -> int:
+    """Render the missing summary plots of results matching the glob `pattern`
+
+    Returns the number of plots rendered.
+    """
+    n_rendered = 0
+    for path in sorted(glob.glob(pattern, recursive=True)):
+        if overwrite or not os.path.exists(summary_path(path)):
+            render_summary(path)
+            n_rendered += 1
+    return n_rendered
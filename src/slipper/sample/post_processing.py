@@ -1,8 +1,48 @@
+import os
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional
+
 import numpy as np
-from scipy.stats import median_abs_deviation
-from tqdm.auto import trange
+from scipy import sparse
+from tqdm.auto import tqdm, trange
+
+from ..splines.utils import convert_v_samples_to_weights, unroll_index_map
+
+# draws per block (bounds the temporaries on the spline grid)
+POSTERIOR_BLOCK_SIZE = 4096
+# bytes of the blocks of PSDs the quantiles are computed from
+BAND_BLOCK_BYTES = 64 * 2**20
+# copies of a block alive while computing its statistics
+BAND_COPIES = 4
+
+# threads of the band statistics (None: the cores this process may use)
+_N_THREADS: Optional[int] = None
+
+
+def set_band_threads(n_threads: Optional[int]):
+    """Set the number of threads used for the PSD bands (see
+    slipper.parallel.scheduler.apply_layout)"""
+    global _N_THREADS
+    _N_THREADS = n_threads
 
-from ..splines import build_spline_model
+
+def _band_threads() -> int:
+    if _N_THREADS:
+        return _N_THREADS
+    if hasattr(os, "sched_getaffinity"):
+        return len(os.sched_getaffinity(0))
+    return os.cpu_count() or 1
+
+
+def _grid_splines(weights: np.ndarray, tau: np.ndarray, db_rows) -> np.ndarray:
+    """PSDs (n_draws x n_rows) on the grid points of the basis rows `db_rows`"""
+    if sparse.issparse(db_rows):
+        grid = np.asarray((db_rows @ weights.T).T)
+    else:
+        grid = weights @ db_rows.T
+    np.maximum(grid, 1e-20, out=grid)
+    grid *= tau[:, None]
+    return grid
 
 
 def generate_spline_posterior(
@@ -12,11 +52,28 @@ def generate_spline_posterior(
     v_samples,
     verbose: bool = False,
 ):
+    """PSD of each draw, unrolled to `spline_len` (n_draws x spline_len)
+
+    Same as build_spline_model(v, db_list, spline_len) * tau for each draw,
+    but the draws are converted to weights and multiplied by the basis
+    (dense, or a scipy.sparse matrix) in blocks.
+    """
     n = len(tau_samples)
-    splines = np.zeros((n, spline_len))
-    kwargs = dict(db_list=db_list, n=spline_len)
-    for i in trange(n, desc="Generating Spline posterior", disable=not verbose):
-        splines[i, :] = build_spline_model(v=v_samples[i, :], **kwargs) * tau_samples[i]
+    tau_samples = np.asarray(tau_samples, dtype=float)
+    splines = np.empty((n, spline_len))
+    idx = unroll_index_map(db_list.shape[0], spline_len)
+    for start in trange(
+        0,
+        n,
+        POSTERIOR_BLOCK_SIZE,
+        desc="Generating Spline posterior",
+        disable=not verbose,
+    ):
+        block = slice(start, start + POSTERIOR_BLOCK_SIZE)
+        weights = convert_v_samples_to_weights(v_samples[block])
+        grid = _grid_splines(weights, tau_samples[block], db_list)
+        # unroll straight into the output (the gather dominates the cost)
+        np.take(grid, idx, axis=1, out=splines[block])
     return splines
 
 
@@ -27,20 +84,58 @@ def generate_spline_quantiles(
     v_samples,
     uniform_bands=True,
     verbose: bool = False,
+    max_bytes: int = BAND_BLOCK_BYTES,
+    n_threads: Optional[int] = None,
 ):
-    splines = generate_spline_posterior(
-        spline_len, db_list, tau_samples, v_samples, verbose
-    )
-    splines_median = np.quantile(splines, 0.5, axis=0)
-    splines_quants = np.quantile(splines, [0.05, 0.95], axis=0)
+    """Median and 90% band of the PSD, at `spline_len` points (3 x spline_len)
 
-    # TBH I don't understand this part -- taken from @patricio's code
-    # See internal_gibs_utils and line 395 of gibs-sample-simple
-    lnsplines = __logfuller(splines)
-    lnsplines_median = np.median(lnsplines, axis=0)
-    lnsplines_mad = median_abs_deviation(lnsplines, axis=0)
-    lnsplines_uniform_max = __uniformmax(lnsplines)
-    lnsplines_c_value = np.quantile(lnsplines_uniform_max, 0.9) * lnsplines_mad
+    The band is either uniform (from the MAD of the log PSDs) or pointwise
+    (5% and 95% quantiles).
+
+    The PSD at each of the `spline_len` points is that of the nearest grid
+    point of the basis, so the statistics are computed on the grid points
+    that are used and unrolled afterwards. They are computed for blocks of
+    grid points holding all draws (at most ~`max_bytes` at a time, over all
+    threads), so the full n_draws x spline_len posterior is never
+    materialised. The blocks are spread over `n_threads` threads (default:
+    the per-process budget of the worker layout, or the cores this process
+    may use). The results are exact.
+    """
+    tau_samples = np.asarray(tau_samples, dtype=float)
+    n_draws = len(tau_samples)
+    idx = unroll_index_map(db_list.shape[0], spline_len)
+    columns, unroll = np.unique(idx, return_inverse=True)
+    weights = convert_v_samples_to_weights(v_samples)
+    n_threads = n_threads or _band_threads()
+    block_size = max(1, max_bytes // (BAND_COPIES * 8 * n_draws * n_threads))
+    block_size = min(block_size, -(-len(columns) // n_threads))
+    blocks = [
+        slice(start, start + block_size) for start in range(0, len(columns), block_size)
+    ]
+
+    def block_stats(block: slice) -> np.ndarray:
+        splines = _grid_splines(weights, tau_samples, db_list[columns[block]])
+        return _band_statistics(splines)
+
+    stats = np.empty((len(_BAND_STATISTICS), len(columns)))
+    with ThreadPoolExecutor(min(n_threads, len(blocks))) as pool:
+        for block, values in tqdm(
+            zip(blocks, pool.map(block_stats, blocks)),
+            total=len(blocks),
+            desc="Computing PSD quantiles",
+            disable=not verbose,
+        ):
+            stats[:, block] = values
+    (
+        splines_median,
+        splines_p05,
+        splines_p95,
+        lnsplines_median,
+        lnsplines_mad,
+        lnsplines_uniform_max,
+    ) = stats
+    # quantile over all spline_len points (grid points count once per use)
+    lnsplines_c_value = np.quantile(lnsplines_uniform_max[unroll], 0.9) * lnsplines_mad
 
     uniform_psd_quants = np.array(
         [
@@ -52,17 +147,56 @@ def generate_spline_quantiles(
     if uniform_bands:
         psd_with_unc = np.vstack([splines_median, uniform_psd_quants])
     else:
-        psd_with_unc = np.vstack([splines_median, splines_quants])
+        psd_with_unc = np.vstack([splines_median, splines_p05, splines_p95])
+    psd_with_unc = psd_with_unc[:, unroll]
 
     assert psd_with_unc.shape == (3, spline_len)
     assert np.all(psd_with_unc > 0)
     return psd_with_unc
 
 
-def __uniformmax(sample):
-    mad = median_abs_deviation(sample, nan_policy="omit", axis=0)
-    mad[mad == 0] = 1e-10  # replace 0 with very small number
-    return np.max(np.abs(sample - np.median(sample, axis=0)) / mad, axis=0)
+_BAND_STATISTICS = [
+    "median",
+    "p05",
+    "p95",
+    "ln_median",
+    "ln_mad",
+    "ln_uniform_max",
+]
+
+
+def _band_statistics(splines: np.ndarray) -> np.ndarray:
+    """Statistics of each column of `splines` (see _BAND_STATISTICS)
+
+    These are np.quantile(splines, [0.5, 0.05, 0.95]) and, for the log
+    PSDs lnsplines = __logfuller(splines), their median, MAD
+    (scipy.stats.median_abs_deviation) and largest absolute deviation from
+    the median in units of the MAD. As __logfuller is increasing, the order
+    statistics of lnsplines are those of splines, so each column is
+    partitioned once (in place) for all of them, and once more for the MAD.
+    """
+    n = len(splines)
+    # linear interpolation between order statistics, as np.quantile
+    h = np.array([0.5, 0.05, 0.95]) * (n - 1)
+    lo = np.floor(h).astype(int)
+    hi = np.minimum(lo + 1, n - 1)
+    t = (h - lo)[:, None]
+    splines.partition(np.unique(np.concatenate([[0, n - 1], lo, hi])), axis=0)
+    quants = splines[lo] + (splines[hi] - splines[lo]) * t
+
+    # TBH I don't understand this part -- taken from @patricio's code
+    # See internal_gibs_utils and line 395 of gibs-sample-simple
+    ln_lo, ln_hi = __logfuller(splines[lo[0]]), __logfuller(splines[hi[0]])
+    ln_median = ln_lo + (ln_hi - ln_lo) * t[0]
+    deviation = np.abs(__logfuller(splines) - ln_median)
+    deviation.partition(np.unique([lo[0], hi[0]]), axis=0)
+    ln_mad = deviation[lo[0]] + (deviation[hi[0]] - deviation[lo[0]]) * t[0]
+    # the largest deviation is at an extreme
+    ln_extremes = __logfuller(splines[[0, n - 1]])
+    max_deviation = np.maximum(ln_extremes[1] - ln_median, ln_median - ln_extremes[0])
+    # replace a MAD of 0 with a very small number
+    ln_uniform_max = max_deviation / np.where(ln_mad == 0, 1e-10, ln_mad)
+    return np.vstack([quants, ln_median, ln_mad, ln_uniform_max])
 
 
 def __logfuller(x, xi=0.001):
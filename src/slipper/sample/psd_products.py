@@ -0,0 +1,72 @@
+"""Derived PSD products (quantiles, spline posterior) stored with the result.
+
+Computing the PSD posterior and its quantiles loops over every draw, so
+doing it each time a result is loaded is slow. The products are kept in a
+'psd_products' group of the InferenceData (and so written to the result
+file). Each product is stored under a name derived from what it depends on
+(kind, burn-in, quantile levels, band type). It also records a fingerprint
+of the posterior draws, so products computed from different draws (eg a
+Zarr store that has since grown) are ignored and recomputed.
+"""
+import hashlib
+import json
+from typing import Dict, List, Optional
+
+import numpy as np
+import xarray as xr
+from arviz import InferenceData
+
+PRODUCTS_GROUP = "psd_products"
+
+
+def product_name(kind: str, params: Dict) -> str:
+    key = json.dumps(params, sort_keys=True)
+    return f"{kind}_{hashlib.sha256(key.encode()).hexdigest()[:12]}"
+
+
+def posterior_fingerprint(idata: InferenceData) -> str:
+    """Hash of the draws (their iteration numbers and τ values)"""
+    h = hashlib.sha256()
+    h.update(np.ascontiguousarray(idata.posterior["draws"].values).tobytes())
+    h.update(np.ascontiguousarray(idata.posterior["tau"].values).tobytes())
+    return h.hexdigest()[:16]
+
+
+def load_product(
+    idata: InferenceData, kind: str, params: Dict, fingerprint: str
+) -> Optional[np.ndarray]:
+    """The stored product, or None if missing or out of date"""
+    if PRODUCTS_GROUP not in idata.groups():
+        return None
+    name = product_name(kind, params)
+    products = idata[PRODUCTS_GROUP]
+    if name not in products or products[name].attrs["fingerprint"] != fingerprint:
+        return None
+    return products[name].values
+
+
+def store_product(
+    idata: InferenceData,
+    kind: str,
+    params: Dict,
+    fingerprint: str,
+    values: np.ndarray,
+    dims: List[str],
+):
+    """Add (or replace) a product in the 'psd_products' group of `idata`"""
+    name = product_name(kind, params)
+    array = xr.DataArray(
+        values,
+        dims=[f"{name}_{dim}" for dim in dims],
+        attrs=dict(kind=kind, params=json.dumps(params), fingerprint=fingerprint),
+    )
+    if PRODUCTS_GROUP not in idata.groups():
+        idata.add_groups({PRODUCTS_GROUP: xr.Dataset({name: array})})
+    else:
+        products = idata[PRODUCTS_GROUP]
+        if name in products:
+            # the dims of an out-of-date product may have a different length
+            products = products.drop_vars(name).drop_dims(
+                list(array.dims), errors="ignore"
+            )
+        idata[PRODUCTS_GROUP] = products.assign({name: array})
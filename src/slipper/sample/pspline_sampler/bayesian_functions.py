@@ -1,6 +1,8 @@
 import numpy as np
 from bilby.core.prior import ConditionalPriorDict, Gamma
 
+from .whittle import CHUNKED_LLIKE_THRESHOLD, chunked_whittle_sum
+
 
 def _vPv(v, P):
     return np.dot(np.dot(v.T, P), v)
@@ -64,13 +66,25 @@ def sample_φδτ(k, v, τ, τα, τβ, φ, φα, φβ, δ, δα, δβ, data, sp
 
 
 def llike(v, τ, data, spline_model):
-    """Whittle log likelihood"""
+    """Whittle log likelihood
+
+    Periodograms longer than CHUNKED_LLIKE_THRESHOLD use a chunked,
+    multithreaded kernel (see whittle.py).
+    """
     # TODO: Move to using bilby likelihood
     # TODO: the parameters to this function should
     #  be the sampling parameters, not the matrix itself!
     # todo: V should be computed in here
 
     n = len(data)
+    if n >= CHUNKED_LLIKE_THRESHOLD:
+        idx = spline_model.unroll_index(n)
+        trim = slice(1, None) if n % 2 == 0 else slice(1, -1)
+        lnlike = -chunked_whittle_sum(spline_model(v=v), idx[trim], τ, data[trim]) / 2
+        if not np.isfinite(lnlike):
+            raise ValueError(f"lnlike is not finite: {lnlike}")
+        return lnlike
+
     _spline = spline_model(v=v, n=n) * τ
 
     is_even = n % 2 == 0
@@ -11,44 +11,49 @@ class PsplineSampler(BaseSampler):
     def _init_mcmc(self) -> None:
         """Initialises the self.samples with the itial values of the MCMC"""
 
-        # init model
-        sk = self.spline_kwargs
-        knots = knot_locator(self.data, self.n_basis, sk["degree"], sk["eqSpaced"])
-        self.spline_model = PSplines(
-            knots=knots,
-            degree=sk["degree"],
-            diffMatrixOrder=sk["diffMatrixOrder"],
-        )
+        # init model (unless a prebuilt one was provided)
+        if self.spline_model is None:
+            sk = self.spline_kwargs
+            knots = knot_locator(self.data, self.n_basis, sk["degree"], sk["eqSpaced"])
+            self.spline_model = PSplines(
+                knots=knots,
+                degree=sk["degree"],
+                diffMatrixOrder=sk["diffMatrixOrder"],
+            )
 
         # init samples
-        self.samples = dict(
-            V=np.zeros((self.n_steps, self.n_basis - 1)),
-            φ=np.zeros(self.n_steps),
-            δ=np.zeros(self.n_steps),
-            τ=np.zeros(self.n_steps),
-            proposal_sigma=np.zeros(self.n_steps),
-            acceptance_fraction=np.zeros(self.n_steps),
+        self.samples = self._allocate_samples(
+            dict(
+                V=(self.n_basis - 1,),
+                φ=(),
+                δ=(),
+                τ=(),
+                proposal_sigma=(),
+                acceptance_fraction=(),
+                lpost_trace=(),
+            )
         )
 
         sk = self.sampler_kwargs
-        self.samples["τ"][0] = np.var(self.data) / (2 * np.pi)
-        self.samples["δ"][0] = sk["δα"] / sk["δβ"]
-        self.samples["φ"][0] = sk["φα"] / (sk["φβ"] * self.samples["δ"][0])
-        self.samples["V"][0, :] = self.spline_model.guess_initial_v(self.data).ravel()
-        self.samples["proposal_sigma"][0] = 1
-        self.samples["acceptance_fraction"][0] = 0.4
-        self.samples["lpost_trace"] = np.zeros(self.n_steps)
+        # with retain="post_burnin" and no burn-in the window precedes row 0
+        row = self._row(0)
+        self.samples["τ"][row] = np.var(self.data) / (2 * np.pi)
+        self.samples["δ"][row] = sk["δα"] / sk["δβ"]
+        self.samples["φ"][row] = sk["φα"] / (sk["φβ"] * self.samples["δ"][row])
+        self.samples["V"][row, :] = self.spline_model.guess_initial_v(self.data).ravel()
+        self.samples["proposal_sigma"][row] = 1
+        self.samples["acceptance_fraction"][row] = 0.4
 
         self.args = [
             self.n_basis,
-            self.samples["V"][0],
-            self.samples["τ"][0],
+            self.samples["V"][row],
+            self.samples["τ"][row],
             self.sampler_kwargs["τα"],
             self.sampler_kwargs["τβ"],
-            self.samples["φ"][0],
+            self.samples["φ"][row],
             self.sampler_kwargs["φα"],
             self.sampler_kwargs["φβ"],
-            self.samples["δ"][0],
+            self.samples["δ"][row],
             self.sampler_kwargs["δα"],
             self.sampler_kwargs["δβ"],
             self.data,
@@ -57,21 +62,23 @@ class PsplineSampler(BaseSampler):
 
     def _mcmc_step(self, itr):
         k = self.n_basis
+        prev, cur = self._row(itr - 1), self._row(itr)
         aux = np.arange(0, k - 1)
-        accept_frac = self.samples["acceptance_fraction"][itr - 1]
-        sigma = self.samples["proposal_sigma"][itr - 1]
+        accept_frac = self.samples["acceptance_fraction"][prev]
+        sigma = self.samples["proposal_sigma"][prev]
         np.random.shuffle(aux)
 
         self.args = [
             self.n_basis,
-            self.samples["V"][itr - 1, :],
-            self.samples["τ"][itr - 1],
+            # copy, as V is updated in place (the stored draw must not change)
+            self.samples["V"][prev, :].copy(),
+            self.samples["τ"][prev],
             self.sampler_kwargs["τα"],
             self.sampler_kwargs["τβ"],
-            self.samples["φ"][itr - 1],
+            self.samples["φ"][prev],
             self.sampler_kwargs["φα"],
             self.sampler_kwargs["φβ"],
-            self.samples["δ"][itr - 1],
+            self.samples["δ"][prev],
             self.sampler_kwargs["δα"],
             self.sampler_kwargs["δβ"],
             self.data,
@@ -95,13 +102,13 @@ class PsplineSampler(BaseSampler):
             self.args[8] = δ
 
         # 3. store the new values
-        self.samples["φ"][itr] = φ
-        self.samples["δ"][itr] = δ
-        self.samples["τ"][itr] = τ
-        self.samples["V"][itr, :] = V
-        self.samples["proposal_sigma"][itr] = sigma
-        self.samples["acceptance_fraction"][itr] = accept_frac
-        self.samples["lpost_trace"][itr] = lpost_store
+        self.samples["φ"][cur] = φ
+        self.samples["δ"][cur] = δ
+        self.samples["τ"][cur] = τ
+        self.samples["V"][cur, :] = V
+        self.samples["proposal_sigma"][cur] = sigma
+        self.samples["acceptance_fraction"][cur] = accept_frac
+        self.samples["lpost_trace"][cur] = lpost_store
 
 
 def _tune_proposal_distribution(
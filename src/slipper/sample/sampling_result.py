@@ -8,21 +8,111 @@ from arviz import InferenceData
 from scipy.fft import fft
 
 from ..plotting import plot_metadata
+from ..splines.p_splines import PSplines
 from .post_processing import generate_spline_posterior, generate_spline_quantiles
+from .psd_products import (
+    PRODUCTS_GROUP,
+    load_product,
+    posterior_fingerprint,
+    store_product,
+)
+from .zarr_store import ZarrResultStore, is_zarr_path
+
+# spline settings stored in the constant_data attrs, to rebuild the basis
+SPLINE_CONFIG = ["degree", "diffMatrixOrder", "n_grid_points"]
 
 
 class Result:
     def __init__(self, idata):
         self.idata = idata
+        # set when a PSD product is computed that is not in the saved file
+        self.new_products = False
 
     @classmethod
-    def load(cls, fname: str):
-        return cls(az.from_netcdf(fname))
+    def load(cls, fname: str, lazy: bool = False):
+        """Load a netCDF result, or lazily open a Zarr store ('*.zarr')
+
+        Parameters
+        ----------
+        fname : str
+            Path of the result
+        lazy : bool
+            Only open the netCDF file: metadata (attrs, coords, knots) is
+            available immediately and the arrays are read when used (as dask
+            arrays, chunked as stored, if dask is installed). Call `close()`
+            once done.
+        """
+        if is_zarr_path(fname):
+            return cls(ZarrResultStore(fname).load())
+        if not lazy:
+            return cls(az.from_netcdf(fname))
+        group_kwargs = {".*": dict(chunks={})} if _has_dask() else None
+        with az.rc_context({"data.load": "lazy"}):
+            idata = az.from_netcdf(fname, group_kwargs=group_kwargs, regex=True)
+        return cls(idata)
+
+    def close(self):
+        """Close the files of a lazily loaded result"""
+        for group in self.idata.groups():
+            self.idata[group].close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def save(
+        self,
+        fname: str,
+        compact: bool = False,
+        float32: bool = False,
+        catalog: Optional[str] = None,
+        plot: bool = True,
+    ):
+        """Save as (compressed) netCDF, or as a Zarr store if `fname` ends in '.zarr'
+
+        Parameters
+        ----------
+        fname : str
+            Path of the result
+        compact : bool
+            Do not store the dense basis, it is rebuilt from the knots and
+            the spline config when needed
+        float32 : bool
+            Store the traces in single precision
+        catalog : str
+            SQLite catalog to register the result in (see slipper.catalog)
+        plot : bool
+            Render summary.png next to the result first (which also computes
+            the PSD quantiles that are saved with it)
+        """
+        if plot:
+            self.make_summary_plot(os.path.join(os.path.dirname(fname), "summary.png"))
+        idata = self.export_idata(compact, float32)
+        if is_zarr_path(fname):
+            ZarrResultStore(fname).write(idata)
+        else:
+            _write_netcdf(idata, fname)
+        if catalog:
+            from ..catalog import Catalog
+
+            Catalog(catalog).register(self, fname)
 
-    def save(self, fname: str):
-        outdir = os.path.dirname(fname)
-        self.make_summary_plot(os.path.join(outdir, "summary.png"))
-        self.idata.to_netcdf(fname)
+    def export_idata(self, compact: bool = False, float32: bool = False):
+        """The InferenceData to serialise (see `save`)"""
+        if not (compact or float32):
+            return self.idata
+        groups = {group: self.idata[group] for group in self.idata.groups()}
+        if compact and "basis" in groups["constant_data"]:
+            missing = set(SPLINE_CONFIG) - set(groups["constant_data"].attrs)
+            if missing:
+                raise ValueError(f"Cannot drop the basis, the {missing} are not known")
+            groups["constant_data"] = groups["constant_data"].drop_vars("basis")
+        if float32:
+            for group in ["posterior", "sample_stats"]:
+                groups[group] = groups[group].astype(np.float32)
+        return InferenceData(**groups)
 
     @classmethod
     def create_idata(
@@ -62,13 +152,17 @@ class Result:
         data,
         burn_in,
         runtime,
+        draw_idx: Optional[np.ndarray] = None,
+        attrs: Optional[Dict] = None,
+        spline_config: Optional[Dict] = None,
     ) -> "Result":
         nsamp, n_basis_minus_1 = v_samples.shape
 
         n_knots = len(knots)
         n_gridpoints, n_basis = basis.shape
 
-        draw_idx = np.arange(nsamp)
+        # iteration number of each draw (not contiguous from 0 if burn-in was dropped)
+        draw_idx = np.arange(nsamp) if draw_idx is None else np.asarray(draw_idx)
         knots_idx = np.arange(n_knots)
         v_idx = np.arange(n_basis_minus_1)
         basis_idx = np.arange(n_basis)
@@ -93,13 +187,14 @@ class Result:
         )
         sample_stats = az.dict_to_dataset(
             dict(
-                acceptance_rate=frac_accept[draw_idx],
-                lp=lpost_trace[draw_idx],
+                acceptance_rate=frac_accept,
+                lp=lpost_trace,
             ),
             coords=dict(draws=draw_idx),
             attrs=dict(
                 burn_in=burn_in,
                 runtime=runtime,
+                **(attrs or {}),
             ),
             dims=dict(
                 acceptance_rate=["draws"],
@@ -128,7 +223,8 @@ class Result:
             },
             dims={"knots": ["location"], "basis": ["grid_point", "basis_idx"]},
             default_dims=[],
-            attrs={},
+            # what is needed to rebuild the basis from the knots
+            attrs=spline_config or {},
             index_origin=None,
         )
 
@@ -189,7 +285,13 @@ class Result:
 
     @property
     def basis(self):
-        return self.idata.constant_data["basis"]
+        constant_data = self.idata.constant_data
+        if "basis" not in constant_data:
+            # saved compactly: rebuild the basis (cached, see slipper.splines.cache)
+            config = {key: int(constant_data.attrs[key]) for key in SPLINE_CONFIG}
+            spline_model = PSplines(knots=constant_data["knots"].values, **config)
+            constant_data["basis"] = (("grid_point", "basis_idx"), spline_model.basis)
+        return constant_data["basis"]
 
     @property
     def knots(self):
@@ -226,11 +328,12 @@ class Result:
             all_samples.acceptance_rate.values,
             model_quants=psd_quants,
             data=data,
-            db_list=self.basis,
-            knots=self.knots,
+            db_list=self.basis.values,
+            knots=self.knots.values,
             burn_in=self.burn_in,
             fname=fn,
             max_it=max_it,
+            draw_idx=self.idata.posterior.coords["draws"].values,
         )
 
     def get_model_quantiles(self, start=None, end=None):
@@ -247,7 +350,7 @@ class Result:
         tau_samples = tau_samples[plot_idx]
         v_samples = v_samples[plot_idx]
         return generate_spline_quantiles(
-            self.data_length, self.basis, tau_samples, v_samples
+            self.data_length, self.basis.values, tau_samples, v_samples
         )
 
     @property
@@ -255,13 +358,70 @@ class Result:
         """return quants if present, else compute cache and return"""
         # if attribute exists return
         if not hasattr(self, "_psd_quant"):
-            self._psd_quant = self.get_model_quantiles(self.burn_in)
+            # median and 90% uniform band (see generate_spline_quantiles)
+            params = dict(burn_in=int(self.burn_in), band="uniform", level=0.9)
+            self._psd_quant = self._stored_product(
+                "quantiles",
+                params,
+                lambda: self.get_model_quantiles(self.burn_in),
+                dims=["quantile", "freq"],
+            )
         return self._psd_quant
 
     @property
     def psd_posterior(self):
         if not hasattr(self, "_psds"):
-            self._psds = generate_spline_posterior(
-                self.data_length, self.basis, self.post_samples[:, 2], self.v
+            self._psds = self._stored_product(
+                "posterior",
+                dict(burn_in=int(self.burn_in)),
+                lambda: generate_spline_posterior(
+                    self.data_length,
+                    self.basis.values,
+                    self.post_samples[:, 2],
+                    self.v.values,
+                ),
+                dims=["draw", "freq"],
             )
         return self._psds
+
+    def _stored_product(self, kind: str, params: Dict, compute, dims: List[str]):
+        """Product from the 'psd_products' group, computed and stored if missing"""
+        fingerprint = posterior_fingerprint(self.idata)
+        values = load_product(self.idata, kind, params, fingerprint)
+        if values is None:
+            values = compute()
+            store_product(self.idata, kind, params, fingerprint, values, dims)
+            self.new_products = True
+        return values
+
+    def save_products(self, fname: str):
+        """Write the 'psd_products' group back to the result saved at `fname`"""
+        if is_zarr_path(fname):
+            ZarrResultStore(fname).write_group(
+                PRODUCTS_GROUP, self.idata[PRODUCTS_GROUP]
+            )
+        else:
+            _write_netcdf(self.idata, fname)
+
+
+def _has_dask() -> bool:
+    try:
+        import dask  # noqa
+    except ImportError:
+        return False
+    return True
+
+
+def _write_netcdf(idata: InferenceData, fname: str):
+    """Write to a temporary file next to `fname` and move it into place, so
+    that `fname` is never a partly written file (eg if the job is killed)"""
+    tmp = os.path.join(
+        os.path.dirname(os.path.abspath(fname)),
+        f".{os.path.basename(fname)}.{os.getpid()}.tmp",
+    )
+    try:
+        idata.to_netcdf(tmp, compress=True)
+        os.replace(tmp, fname)
+    finally:
+        if os.path.exists(tmp):
+            os.remove(tmp)
@@ -21,6 +21,9 @@ def fit_data_with_pspline_model(
     diffMatrixOrder: int = 2,
     outdir: str = ".",
     n_checkpoint_plts: int = 0,
+    checkpoint_every: int = 0,
+    storage: str = "memory",
+    retain: str = "all",
 ) -> Result:
     sampler = PsplineSampler(
         data=data,
@@ -36,6 +39,9 @@ def fit_data_with_pspline_model(
             δα=δα,
             δβ=δβ,
             n_checkpoint_plts=n_checkpoint_plts,
+            checkpoint_every=checkpoint_every,
+            storage=storage,
+            retain=retain,
         ),
         spline_kwargs=dict(
             k=k, eqSpaced=eqSpaced, degree=degree, diffMatrixOrder=diffMatrixOrder
@@ -43,3 +49,9 @@ def fit_data_with_pspline_model(
     )
     sampler.run()
     return sampler.result
+
+
+def resume(outdir: str) -> Result:
+    """Finish a run that was checkpointed (`checkpoint_every`) in `outdir`"""
+    sampler = PsplineSampler.resume(outdir)
+    return sampler.result
@@ -0,0 +1,135 @@
+"""Storage backends for the sampler's traces.
+
+The sampler preallocates one row per iteration for every traced quantity.
+With 'memory' storage these are plain in-RAM arrays. With 'memmap' storage
+they are .npy files in a directory of `outdir` created for (and owned by)
+the run, memory-mapped so that only the pages being written (and the OS page
+cache) need to be resident. This allows runs whose traces do not fit in RAM
+(eg Ntotal=10^7, k=200). The Result is built on views of the traces, so they
+are not copied before being written out.
+"""
+import os
+import tempfile
+from typing import Dict, Optional, Tuple
+
+import numpy as np
+
+from ..logger import logger
+
+STORAGE_BACKENDS = ["memory", "memmap"]
+RETAIN_OPTIONS = ["all", "post_burnin", "none"]
+# 'auto' lets the run planner choose (see slipper.sample.planner)
+STORAGE_OPTIONS = STORAGE_BACKENDS + ["auto"]
+# prefix of the run-owned directories of memory-mapped traces
+TRACES_PREFIX = ".slipper_traces_"
+
+# ascii file names for the traces
+_FNAMES = {"φ": "phi", "δ": "delta", "τ": "tau"}
+
+
+def traces_dir(traces: Optional[Dict[str, np.ndarray]]) -> Optional[str]:
+    """Directory of memory-mapped traces (None for in-memory traces)"""
+    for trace in (traces or {}).values():
+        if isinstance(trace, np.memmap):
+            return os.path.dirname(trace.filename)
+    return None
+
+
+def n_trace_rows(n_steps: int, burnin: int, retain: str, burnin_window: int) -> int:
+    """Rows allocated per trace for the given sampler settings
+
+    With retain='post_burnin' the burn-in only uses a rolling window of rows,
+    with retain='none' (see BaseSampler.iter_samples) every iteration does.
+    """
+    if retain == "all":
+        return n_steps
+    window = window_rows(burnin, retain, burnin_window)
+    if retain == "none":
+        return window
+    return window + n_steps - burnin
+
+
+def window_rows(burnin: int, retain: str, burnin_window: int) -> int:
+    """Rows of the rolling window"""
+    if retain == "none":
+        # each step reads the previous row
+        return max(2, burnin_window)
+    return max(1, min(burnin_window, burnin))
+
+
+def allocate_traces(
+    shapes: Dict[str, Tuple[int, ...]],
+    n_steps: int,
+    storage: str = "memory",
+    outdir: str = ".",
+) -> Dict[str, np.ndarray]:
+    """Zero-initialised (n_steps, *shape) arrays for each trace in `shapes`
+
+    Parameters
+    ----------
+    shapes : dict
+        Shape of one draw of each trace (eg dict(V=(k - 1,), τ=()))
+    n_steps : int
+        Number of rows to allocate
+    storage : str
+        'memory' or 'memmap' (files in a new directory of `outdir`)
+    outdir : str
+        Output directory of the run
+    """
+    if storage not in STORAGE_BACKENDS:
+        raise ValueError(f"Unknown storage {storage}, use one of {STORAGE_BACKENDS}")
+    if storage == "memory":
+        return {key: np.zeros((n_steps, *shape)) for key, shape in shapes.items()}
+
+    os.makedirs(outdir, exist_ok=True)
+    dirname = tempfile.mkdtemp(prefix=TRACES_PREFIX, dir=outdir)
+    traces = {}
+    for key, shape in shapes.items():
+        fname = os.path.join(dirname, f"{_FNAMES.get(key, key)}.npy")
+        traces[key] = np.lib.format.open_memmap(
+            fname, mode="w+", dtype=float, shape=(n_steps, *shape)
+        )
+    return traces
+
+
+def open_traces(dirname: str) -> Dict[str, np.ndarray]:
+    """Memory-map (read-write) the traces that `allocate_traces` made in `dirname`"""
+    keys = {fname: key for key, fname in _FNAMES.items()}
+    traces = {}
+    for fname in sorted(os.listdir(dirname)):
+        stem, ext = os.path.splitext(fname)
+        if ext == ".npy":
+            traces[keys.get(stem, stem)] = np.load(
+                os.path.join(dirname, fname), mmap_mode="r+"
+            )
+    return traces
+
+
+def copy_rows(
+    src: np.ndarray, dst: np.ndarray, start: int, stop: int, block_bytes: int = 2**26
+):
+    """dst[start:stop] = src[start:stop], a block of rows (~`block_bytes`) at a
+    time, so that copying from a memory map does not read it all at once"""
+    block = max(1, block_bytes // max(1, src[:1].nbytes))
+    for i in range(start, stop, block):
+        dst[i : min(i + block, stop)] = src[i : min(i + block, stop)]
+
+
+def remove_traces(traces: Optional[Dict[str, np.ndarray]]):
+    """Delete the files of memory-mapped traces (once the result is saved)
+
+    Only the files made by `allocate_traces` and their directory are removed,
+    in-memory traces are left alone. Existing maps of the traces stay valid
+    on POSIX systems.
+    """
+    dirname = traces_dir(traces)
+    if dirname is None:
+        return
+    try:
+        for key in traces:
+            fname = os.path.join(dirname, f"{_FNAMES.get(key, key)}.npy")
+            if os.path.exists(fname):
+                os.remove(fname)
+        os.rmdir(dirname)
+    except OSError as e:
+        logger.warning(f"Could not remove {dirname}: {e}")
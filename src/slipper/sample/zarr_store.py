@@ -0,0 +1,132 @@
+"""Chunked, appendable Zarr store for sampling results.
+
+A netCDF result is only written once sampling has finished. A Zarr store
+(a directory, eg `outdir/result.zarr`) holds the same InferenceData groups
+as chunked, compressed arrays. The sampler can append blocks of draws to it
+while it runs, so partial results survive crashes and can be read mid-run.
+Reading it is lazy: only the chunks that are used are loaded.
+
+Needs the optional `zarr` package (`pip install zarr`).
+"""
+import os
+import shutil
+from typing import Dict, Optional
+
+import numpy as np
+import xarray as xr
+from arviz import InferenceData
+
+ZARR_EXTENSION = ".zarr"
+GROUPS = ["posterior", "sample_stats", "observed_data", "constant_data"]
+# optional groups (see slipper.sample.psd_products)
+EXTRA_GROUPS = ["psd_products"]
+# groups that grow along the draws dimension
+DRAW_GROUPS = ["posterior", "sample_stats"]
+DRAWS_DIM = "draws"
+
+
+def _require_zarr():
+    try:
+        import zarr  # noqa
+    except ImportError as e:
+        raise ImportError(
+            "Zarr result stores need the zarr package (pip install zarr)"
+        ) from e
+
+
+def is_zarr_path(path: str) -> bool:
+    return str(path).rstrip("/").endswith(ZARR_EXTENSION)
+
+
+class ZarrResultStore:
+    def __init__(self, path: str, chunk_draws: int = 1000):
+        """
+        Parameters
+        ----------
+        path : str
+            Directory of the store (eg 'outdir/result.zarr')
+        chunk_draws : int
+            Number of draws per chunk (fixed when the store is created)
+        """
+        _require_zarr()
+        self.path = str(path)
+        self.chunk_draws = chunk_draws
+
+    @property
+    def exists(self) -> bool:
+        return os.path.isdir(self.path)
+
+    def write(self, idata: InferenceData):
+        """(Over)write the store with all groups of `idata`"""
+        if self.exists:
+            shutil.rmtree(self.path)
+        for group in idata.groups():
+            self.write_group(group, idata[group])
+
+    def write_group(self, group: str, ds: xr.Dataset):
+        """(Over)write one group of the store"""
+        ds.to_zarr(
+            self.path,
+            group=group,
+            mode="w",
+            encoding=self._encoding(ds),
+            consolidated=False,
+        )
+
+    def append(self, idata: InferenceData):
+        """Append the draws of `idata` (creating the store on first use)"""
+        if not self.exists:
+            return self.write(idata)
+        for group in DRAW_GROUPS:
+            idata[group].to_zarr(
+                self.path, group=group, append_dim=DRAWS_DIM, consolidated=False
+            )
+
+    def update_attrs(self, group: str, attrs: Dict):
+        import zarr
+
+        zarr.open_group(self.path, mode="a", path=group).attrs.update(
+            _serialisable(attrs)
+        )
+
+    def n_draws(self) -> int:
+        if not self.exists:
+            return 0
+        with self.open_group("posterior") as ds:
+            return ds.sizes[DRAWS_DIM]
+
+    def last_draw(self) -> Optional[int]:
+        """Iteration number of the last stored draw (None if empty)"""
+        if self.n_draws() == 0:
+            return None
+        with self.open_group("posterior") as ds:
+            return int(ds[DRAWS_DIM].values[-1])
+
+    def open_group(self, group: str) -> xr.Dataset:
+        return xr.open_zarr(self.path, group=group, consolidated=False)
+
+    def load(self) -> InferenceData:
+        """Lazily open the stored InferenceData"""
+        groups = GROUPS + [g for g in EXTRA_GROUPS if self._has_group(g)]
+        return InferenceData(**{group: self.open_group(group) for group in groups})
+
+    def _has_group(self, group: str) -> bool:
+        return os.path.isdir(os.path.join(self.path, group))
+
+    def _encoding(self, ds: xr.Dataset) -> Dict:
+        encoding = {}
+        for name, var in ds.data_vars.items():
+            if DRAWS_DIM in var.dims:
+                chunks = [
+                    min(self.chunk_draws, size) if dim == DRAWS_DIM else size
+                    for dim, size in zip(var.dims, var.shape)
+                ]
+                encoding[name] = dict(chunks=tuple(chunks))
+        return encoding
+
+
+def _serialisable(attrs: Dict) -> Dict:
+    return {
+        key: val.item() if isinstance(val, np.generic) else val
+        for key, val in attrs.items()
+    }
@@ -0,0 +1,125 @@
+"""Content-addressed cache of B-spline basis and penalty matrices.
+
+Building the basis and penalty with skfda dominates the set-up of small fits,
+and identical configurations (knots, degree, diffMatrixOrder, grid size) are
+rebuilt over and over in loops and batch jobs. Matrices are cached in memory
+as an LRU with a byte budget and, if a cache directory is configured (or
+$SLIPPER_CACHE_DIR is set), persisted as .npy files that are memory-mapped
+when loaded.
+"""
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+from typing import Callable, Optional, Tuple
+
+import numpy as np
+
+# bump when the basis/penalty construction changes, to invalidate disk caches
+_CACHE_VERSION = 1
+
+Matrices = Tuple[np.ndarray, np.ndarray]  # (basis, penalty_matrix)
+MATRIX_NAMES = ["basis", "penalty"]
+
+
+def matrix_key(
+    knots: np.ndarray, degree: int, diffMatrixOrder: int, n_grid_points: int
+) -> str:
+    h = hashlib.sha256()
+    h.update(np.ascontiguousarray(knots, dtype=float).tobytes())
+    h.update(f"{degree},{diffMatrixOrder},{n_grid_points},{_CACHE_VERSION}".encode())
+    return h.hexdigest()
+
+
+class SplineMatrixCache:
+    def __init__(self, max_bytes: int = 256 * 2**20, cache_dir: Optional[str] = None):
+        """
+        Parameters
+        ----------
+        max_bytes : int
+            Memory budget of the in-memory LRU (0 disables it)
+        cache_dir : str
+            Directory for the persistent .npy cache (None: memory only)
+        """
+        self.max_bytes = max_bytes
+        self.cache_dir = cache_dir
+        self._entries: "OrderedDict[str, Matrices]" = OrderedDict()
+        self._nbytes = 0
+        self._lock = threading.Lock()
+        self.stats = dict(hits=0, disk_hits=0, misses=0)
+
+    @property
+    def nbytes(self) -> int:
+        return self._nbytes
+
+    def get_or_build(self, key: str, build: Callable[[], Matrices]) -> Matrices:
+        """Cached matrices for `key`, calling `build()` on a miss"""
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self.stats["hits"] += 1
+                return self._entries[key]
+        matrices = self._load(key)
+        if matrices is not None:
+            self.stats["disk_hits"] += 1
+        else:
+            self.stats["misses"] += 1
+            matrices = build()
+            self._save(key, matrices)
+        self._add(key, matrices)
+        return matrices
+
+    def _add(self, key: str, matrices: Matrices):
+        size = sum(m.nbytes for m in matrices)
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._entries:
+                return
+            self._entries[key] = matrices
+            self._nbytes += size
+            while self._nbytes > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self._nbytes -= sum(m.nbytes for m in evicted)
+
+    def _paths(self, key: str):
+        return [os.path.join(self.cache_dir, f"{key}_{m}.npy") for m in MATRIX_NAMES]
+
+    def _load(self, key: str) -> Optional[Matrices]:
+        if self.cache_dir is None:
+            return None
+        paths = self._paths(key)
+        if not all(os.path.exists(p) for p in paths):
+            return None
+        return tuple(np.load(p, mmap_mode="r") for p in paths)
+
+    def _save(self, key: str, matrices: Matrices):
+        if self.cache_dir is None:
+            return
+        os.makedirs(self.cache_dir, exist_ok=True)
+        for path, matrix in zip(self._paths(key), matrices):
+            tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+            with open(tmp, "wb") as f:
+                np.save(f, matrix)
+            os.replace(tmp, path)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._nbytes = 0
+
+
+_DEFAULT_CACHE = SplineMatrixCache(cache_dir=os.environ.get("SLIPPER_CACHE_DIR"))
+
+
+def get_default_cache() -> SplineMatrixCache:
+    return _DEFAULT_CACHE
+
+
+def configure_cache(max_bytes: Optional[int] = None, cache_dir: Optional[str] = None):
+    """Change the memory budget and/or the persistent directory of the default cache"""
+    if max_bytes is not None:
+        _DEFAULT_CACHE.max_bytes = max_bytes
+        _DEFAULT_CACHE.clear()
+    if cache_dir is not None:
+        _DEFAULT_CACHE.cache_dir = cache_dir
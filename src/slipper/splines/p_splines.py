@@ -1,3 +1,6 @@
+import threading
+from collections import OrderedDict
+
 import matplotlib.pyplot as plt
 import numpy as np
 from matplotlib.colors import TwoSlopeNorm
@@ -8,7 +11,8 @@ from skfda.representation.basis import BSplineBasis
 
 from slipper.plotting.utils import hide_axes_spines
 
-from .utils import convert_v_to_weights, density_mixture, unroll_list_to_new_length
+from .cache import get_default_cache, matrix_key
+from .utils import convert_v_to_weights, density_mixture, unroll_index_map
 
 
 class PSplines:
@@ -22,10 +26,20 @@ class PSplines:
     The "P" in PSplines stands for "Penalised", which means that the spline model
     is penalised to avoid overfitting.
 
+    PSplines are immutable (the knots, basis and penalty matrix are read-only),
+    so one instance can be shared by fits running in different threads.
     """
 
+    # number of grid sizes whose evaluation artefacts are kept per instance
+    _MAX_CACHED_GRIDS = 8
+
     def __init__(
-        self, knots: np.array, degree: int, diffMatrixOrder: int = 2, n_grid_points=None
+        self,
+        knots: np.array,
+        degree: int,
+        diffMatrixOrder: int = 2,
+        n_grid_points=None,
+        use_cache: bool = True,
     ):
         """Initialise the PSplines class
 
@@ -41,31 +55,76 @@ class PSplines:
             The number of points to evaluate the basis functions at
             If None, then the number of grid points is set to the maximum
             between 501 and 10 times the number of basis elements.
+        use_cache : bool
+            Reuse the basis and penalty matrices of identical configurations
+            (see slipper.splines.cache)
         """
         assert degree > diffMatrixOrder
         assert degree in [0, 1, 2, 3, 4, 5]
         assert diffMatrixOrder in [0, 1, 2]
         assert len(knots) >= degree, f"#knots: {len(knots)}, degree: {degree}"
 
-        self.knots: np.array = knots
-        self.degree: int = degree
-
-        self.n_grid_points: int = (
-            n_grid_points  # number of points to evaluate the basis functions at
-        )
-        self.diffMatrixOrder: int = diffMatrixOrder
-        self.penalty_matrix: np.ndarray = self.__generate_penalty_matrix()
-        self.basis: np.ndarray = self.__generate_basis_matrix()
-
-    @property
-    def n_grid_points(self) -> int:
-        return self._n_grid_points
-
-    @n_grid_points.setter
-    def n_grid_points(self, n_grid_points: int):
+        self._init_state(knots, degree, diffMatrixOrder, n_grid_points)
+        if use_cache:
+            key = matrix_key(self.knots, degree, diffMatrixOrder, self.n_grid_points)
+            basis, penalty = get_default_cache().get_or_build(key, self.__build)
+        else:
+            basis, penalty = self.__build()
+        self._set("penalty_matrix", _read_only(penalty))
+        self._set("basis", _read_only(basis))
+
+    @classmethod
+    def from_matrices(
+        cls,
+        knots: np.array,
+        degree: int,
+        diffMatrixOrder: int,
+        basis: np.ndarray,
+        penalty_matrix: np.ndarray,
+    ) -> "PSplines":
+        """Build a PSplines from an already computed basis and penalty matrix
+
+        The matrices are used as-is (no copy), so they can be views onto
+        shared or memory-mapped buffers.
+        """
+        obj = cls.__new__(cls)
+        obj._init_state(knots, degree, diffMatrixOrder, basis.shape[0])
+        if basis.shape[1] != obj.n_basis:
+            raise ValueError(
+                f"Basis matrix has {basis.shape[1]} elements, expected {obj.n_basis}"
+            )
+        obj._set("penalty_matrix", _read_only(penalty_matrix))
+        obj._set("basis", _read_only(basis))
+        return obj
+
+    def _init_state(self, knots, degree, diffMatrixOrder, n_grid_points):
+        self._set("knots", _read_only(np.array(knots, dtype=float)))
+        self._set("degree", degree)
+        self._set("diffMatrixOrder", diffMatrixOrder)
         if n_grid_points is None:
-            n_grid_points = max(501, 10 * self.n_basis)
-        self._n_grid_points = n_grid_points
+            n_grid_points = default_n_grid_points(self.n_basis)
+        # number of points to evaluate the basis functions at
+        self._set("n_grid_points", n_grid_points)
+        grid_points = np.linspace(self.knots[0], self.knots[-1], n_grid_points)
+        self._set("grid_points", _read_only(grid_points))
+        self._set("_eval_cache", OrderedDict())
+        self._set("_eval_lock", threading.Lock())
+
+    def _set(self, name, value):
+        object.__setattr__(self, name, value)
+
+    def __setattr__(self, name, value):
+        raise AttributeError(f"PSplines is immutable (cannot set '{name}')")
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        del state["_eval_cache"], state["_eval_lock"]
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._set("_eval_cache", OrderedDict())
+        self._set("_eval_lock", threading.Lock())
 
     @property
     def n_knots(self):
@@ -82,13 +141,26 @@ class PSplines:
     def order(self) -> int:
         return self.degree + 1
 
-    @property
-    def grid_points(self) -> np.array:
-        if not hasattr(self, "_grid_points"):
-            self._grid_points = np.linspace(
-                self.knots[0], self.knots[-1], self.n_grid_points
-            )
-        return self._grid_points
+    def unroll_index(self, n: int) -> np.ndarray:
+        """Grid point used for each of `n` output points (nearest neighbour)
+
+        Cached per `n`, so repeated evaluations at the data length reduce to
+        a single fancy-index.
+        """
+        with self._eval_lock:
+            idx = self._eval_cache.get(n)
+            if idx is not None:
+                self._eval_cache.move_to_end(n)
+                return idx
+        idx = unroll_index_map(self.n_grid_points, n)
+        with self._eval_lock:
+            self._eval_cache[n] = idx
+            if len(self._eval_cache) > self._MAX_CACHED_GRIDS:
+                self._eval_cache.popitem(last=False)
+        return idx
+
+    def __build(self):
+        return self.__generate_basis_matrix(), self.__generate_penalty_matrix()
 
     def __get_fda_bspline_basis(self, knots=None):
         if knots is None:
@@ -176,11 +248,8 @@ class PSplines:
 
         spline = density_mixture(weights, self.basis.T)
 
-        if n is None:
-            n = self.n_grid_points
-
-        if len(spline) != n:
-            spline = unroll_list_to_new_length(spline, n)
+        if n is not None and n != self.n_grid_points:
+            spline = spline[self.unroll_index(n)]
 
         return spline
 
@@ -297,10 +366,8 @@ class PSplines:
         data = data[1:-1]
         n = len(data)
 
-        orig_grid_ln = self.n_grid_points
-        self.n_grid_points = n
         res = minimize(
-            lambda w: _mse(self(w), data),
+            lambda w: _mse(self(w, n=n), data),
             options=dict(
                 maxiter=self.n_basis * n_steps,
                 xatol=1e-30,
@@ -313,7 +380,6 @@ class PSplines:
         w = res.x
         w[w == 0] = 1e-50  # prevents log(0) errors
         w = w / np.sum(w)
-        self.n_grid_points = orig_grid_ln
         return w
 
     def guess_initial_v(self, data):
@@ -327,5 +393,16 @@ class PSplines:
         return v
 
 
+def _read_only(arr: np.ndarray) -> np.ndarray:
+    view = arr.view()
+    view.flags.writeable = False
+    return view
+
+
 def _mse(y, y_hat):
     return np.mean((y - y_hat) ** 2)
+
+
+def default_n_grid_points(n_basis: int) -> int:
+    """Number of grid points the basis is evaluated at, unless specified"""
+    return max(501, 10 * n_basis)
@@ -1,5 +1,6 @@
+from functools import lru_cache
+
 import numpy as np
-from scipy.interpolate import interp1d
 
 
 def density_mixture(
@@ -24,14 +25,29 @@ def density_mixture(
 
 def unroll_list_to_new_length(old_list, n):
     """unroll PSD from qPsd to psd of length n"""
-    newx = np.linspace(0, 1, n)
-    oldx = np.linspace(0, 1, len(old_list))
-    f = interp1d(oldx, old_list, kind="nearest")
-    q = f(newx)
+    q = np.asarray(old_list, dtype=float)[unroll_index_map(len(old_list), n)]
     assert np.all(q >= 0), f"q must be positive, but got {q}"
     return q
 
 
+@lru_cache(maxsize=32)
+def unroll_index_map(old_len: int, n: int) -> np.ndarray:
+    """Indices that unroll a list of length `old_len` to length `n`
+
+    Nearest-neighbour mapping of np.linspace(0, 1, n) onto
+    np.linspace(0, 1, old_len), with ties going to the lower index
+    (identical to interp1d(kind="nearest")). The returned array is read-only
+    as it is shared between callers.
+    """
+    oldx = np.linspace(0, 1, old_len)
+    newx = np.linspace(0, 1, n)
+    bounds = oldx / 2.0
+    bounds = bounds[1:] + bounds[:-1]
+    idx = np.searchsorted(bounds, newx, side="left").clip(0, old_len - 1)
+    idx.flags.writeable = False
+    return idx
+
+
 def build_spline_model(v: np.ndarray, db_list: np.ndarray, n: int):
     """Build a spline model from a vector of spline coefficients and a list of B-spline basis functions"""
     unorm_spline = __get_unscaled_spline(v, db_list)
@@ -73,6 +89,34 @@ def convert_v_to_weights(v: np.ndarray):
     return weight
 
 
+def convert_v_samples_to_weights(v_samples: np.ndarray) -> np.ndarray:
+    """Convert many vectors of spline coefficients to weights at once
+
+    Row by row identical to convert_v_to_weights.
+
+    Parameters
+    ----------
+    v_samples : np.ndarray
+        Spline coefficients (n_samples x n_basis-1)
+
+    Returns
+    -------
+    weights : np.ndarray
+        Weights (n_samples x n_basis)
+    """
+    v = np.atleast_2d(np.asarray(v_samples, dtype=float))
+    with np.errstate(over="ignore", invalid="ignore"):
+        expV = np.exp(v)
+        overflow = np.isinf(expV).any(axis=1, keepdims=True)
+        weight = np.where(
+            overflow,
+            np.exp(v - np.logaddexp(0, v)),
+            expV / (1 + np.sum(expV, axis=1, keepdims=True)),
+        )
+    s = 1 - np.sum(weight, axis=1, keepdims=True)
+    return np.hstack([weight, np.where(s < 0, 0, s)])
+
+
 def __get_unscaled_spline(v: np.ndarray, db_list: np.ndarray, epsilon=1e-20):
     """Compute unscaled spline using mixture of B-splines with weights from v
 
@@ -0,0 +1,38 @@
+"""Run fits from a filesystem work queue: `python -m slipper.worker QUEUE_DIR`
+
+Start as many of these as there are free cores on every node that can see
+the queue directory (see `slipper.parallel.work_queue`).
+"""
+import argparse
+
+from .parallel.work_queue import WorkQueue, run_worker
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(
+        prog="python -m slipper.worker", description=__doc__.splitlines()[0]
+    )
+    parser.add_argument("queue_dir", help="Directory of the work queue")
+    parser.add_argument(
+        "--manifest",
+        default=None,
+        help="Create the queue from this campaign manifest (JSON) first, "
+        "unless it already exists",
+    )
+    parser.add_argument(
+        "--lease",
+        type=float,
+        default=3600,
+        help="Seconds before an unresponsive task is reclaimed (with --manifest)",
+    )
+    parser.add_argument(
+        "--max-tasks", type=int, default=None, help="Stop after this many tasks"
+    )
+    args = parser.parse_args(args)
+    if args.manifest:
+        WorkQueue.create(args.queue_dir, args.manifest, lease=args.lease)
+    run_worker(args.queue_dir, max_tasks=args.max_tasks)
+
+
+if __name__ == "__main__":
+    main()
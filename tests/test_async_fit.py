@@ -0,0 +1,90 @@
+import asyncio
+import os
+import signal
+from concurrent.futures.process import BrokenProcessPool
+
+import numpy as np
+import pytest
+
+from slipper.parallel import AsyncSamplerPool, fit_async
+from slipper.sample.base_sampler import SamplingCancelled
+from slipper.sample.sampling_result import Result
+
+KWARGS = dict(sampler_kwargs=dict(Ntotal=150, burnin=50), spline_kwargs=dict(k=8))
+
+
+def test_fit_async(test_pdgrm, tmpdir):
+    async def main():
+        async with AsyncSamplerPool(max_workers=2, progress_every=50) as pool:
+            job = pool.submit(test_pdgrm, outdir=f"{tmpdir}/async", **KWARGS)
+            progress = [itr async for itr, _ in job.progress()]
+            return progress, await job
+
+    progress, result = asyncio.run(main())
+    assert progress == [50, 100, 149]
+    assert isinstance(result, Result)
+
+
+def test_fit_async_cancel(test_pdgrm, tmpdir):
+    async def main():
+        async with AsyncSamplerPool(progress_every=1) as pool:
+            kwargs = dict(KWARGS, sampler_kwargs=dict(Ntotal=10**5))
+            job = pool.submit(test_pdgrm, outdir=f"{tmpdir}/async", **kwargs)
+            async for itr, _ in job.progress():
+                job.cancel()
+            await job
+
+    with pytest.raises(SamplingCancelled):
+        asyncio.run(main())
+
+
+def test_fit_async_task_cancel(test_pdgrm, tmpdir):
+    async def main():
+        kwargs = dict(KWARGS, sampler_kwargs=dict(Ntotal=10**5))
+        task = asyncio.ensure_future(fit_async(test_pdgrm, outdir=tmpdir, **kwargs))
+        await asyncio.sleep(0.5)
+        task.cancel()
+        await task
+
+    with pytest.raises(asyncio.CancelledError):
+        asyncio.run(main())
+
+
+def test_concurrent_seeded_fits_match_serial_runs(test_pdgrm, tmpdir):
+    async def concurrent():
+        async with AsyncSamplerPool(max_workers=3) as pool:
+            jobs = [
+                pool.submit(
+                    test_pdgrm, outdir=f"{tmpdir}/seeded_{seed}", seed=seed, **KWARGS
+                )
+                for seed in [1, 2]
+            ]
+            # an unseeded fit must not draw from the seeded fits' RNG either
+            jobs.append(pool.submit(test_pdgrm, outdir=f"{tmpdir}/unseeded", **KWARGS))
+            return await asyncio.gather(*jobs)
+
+    async def serial(seed):
+        return await fit_async(
+            test_pdgrm, outdir=f"{tmpdir}/serial", seed=seed, **KWARGS
+        )
+
+    results = asyncio.run(concurrent())
+    for seed, result in zip([1, 2], results):
+        expected = asyncio.run(serial(seed))
+        np.testing.assert_array_equal(
+            result.idata.posterior["v"].values, expected.idata.posterior["v"].values
+        )
+
+
+def test_progress_ends_if_the_worker_dies(test_pdgrm, tmpdir):
+    async def main():
+        async with AsyncSamplerPool(max_workers=1, use_processes=True) as pool:
+            kwargs = dict(KWARGS, sampler_kwargs=dict(Ntotal=10**5))
+            job = pool.submit(test_pdgrm, outdir=f"{tmpdir}/killed", **kwargs)
+            async for _ in job.progress():
+                for pid in pool.executor._processes:
+                    os.kill(pid, signal.SIGKILL)
+            await job
+
+    with pytest.raises(BrokenProcessPool):
+        asyncio.run(asyncio.wait_for(main(), timeout=120))
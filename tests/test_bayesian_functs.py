@@ -5,9 +5,12 @@ from slipper.sample.pspline_sampler import PsplineSampler
 from slipper.sample.pspline_sampler.bayesian_functions import (
     _vPv,
     llike,
+    lpost,
     lprior,
     sample_φδτ,
 )
+from slipper.sample.pspline_sampler.whittle import CHUNKED_LLIKE_THRESHOLD
+from slipper.splines.p_splines import PSplines
 from slipper.splines.utils import unroll_list_to_new_length
 
 
@@ -98,3 +101,47 @@ def test_sample_prior(test_pdgrm, tmpdir):
         axes[i].set_xlabel(["φ'", "δ'", "τ'"][i])
     plt.tight_layout()
     plt.savefig(f"{tmpdir}/test_sample_prior.png")
+
+
+def test_chunked_llike_matches_direct():
+    knots = np.linspace(0, 1, 20)
+    spline_model = PSplines(knots=knots, degree=3, diffMatrixOrder=2)
+    v = np.random.normal(size=spline_model.n_basis - 1)
+    for n in [CHUNKED_LLIKE_THRESHOLD, CHUNKED_LLIKE_THRESHOLD + 1]:
+        data = np.random.exponential(size=n)
+        psd = spline_model(v=v, n=n) * 0.5
+        trim = slice(1, None) if n % 2 == 0 else slice(1, -1)
+        direct = -np.sum(np.log(psd[trim]) + data[trim] / (psd[trim] * 2 * np.pi)) / 2
+        assert np.isclose(llike(v, 0.5, data, spline_model), direct, rtol=1e-12)
+
+
+def test_stored_draws_are_from_one_iteration(test_pdgrm, tmpdir):
+    sampler = PsplineSampler(
+        test_pdgrm, f"{tmpdir}/one_iteration", dict(Ntotal=150, burnin=50), dict(k=8)
+    )
+    sampler.run(verbose=False)
+    posterior = sampler.result.idata.posterior
+    lp = sampler.result.idata.sample_stats["lp"].values.ravel()
+    sk = sampler.sampler_kwargs
+    # each step stores the log posterior of the draw it starts from, so the
+    # stored V must be that of the same iteration as the stored τ, φ and δ
+    for itr in [0, 10, 60, 148]:
+        draw = {
+            var: posterior[var].isel(draws=itr).values.squeeze() for var in posterior
+        }
+        expected = lpost(
+            sampler.n_basis,
+            draw["v"],
+            draw["tau"],
+            sk["τα"],
+            sk["τβ"],
+            draw["phi"],
+            sk["φα"],
+            sk["φβ"],
+            draw["delta"],
+            sk["δα"],
+            sk["δβ"],
+            sampler.data,
+            sampler.spline_model,
+        )
+        np.testing.assert_allclose(lp[itr + 1], expected)
@@ -0,0 +1,56 @@
+import os
+import sqlite3
+
+import pytest
+
+from slipper.catalog import Catalog
+from slipper.sample.checkpoint import seed_rngs
+from slipper.sample.pspline_sampler import PsplineSampler
+
+
+def test_catalog(test_pdgrm, tmpdir):
+    db = f"{tmpdir}/catalog.sqlite"
+    if os.path.exists(db):
+        os.remove(db)
+
+    paths = []
+    for i, Ntotal in enumerate([120, 150]):
+        seed_rngs(i)
+        kwargs = dict(Ntotal=Ntotal, burnin=40, catalog=db)
+        sampler = PsplineSampler(test_pdgrm, f"{tmpdir}/catalog_{i}", kwargs, dict(k=8))
+        sampler.run(verbose=False)
+        paths.append(os.path.abspath(sampler.result_path))
+
+    catalog = Catalog(db)
+    assert len(catalog) == 2
+    entries = catalog.query("n_draws > ?", (130,))
+    assert [e.path for e in entries] == [paths[1]]
+    entry = entries[0]
+    assert entry.k == 8 and entry.degree == 3 and entry.burn_in == 40
+    assert 0 < entry.acceptance < 1
+    with entry.load() as result:
+        assert not result.idata.posterior["v"].variable._in_memory
+        assert result.idata.posterior.sizes["draws"] == 150
+
+    # re-registering existing files replaces their rows
+    assert catalog.scan(f"{tmpdir}/catalog_*/result.nc") == 2
+    assert len(catalog) == 2
+    order = catalog.query(order_by="runtime DESC", limit=1)
+    assert len(order) == 1
+
+
+def test_catalog_closes_its_connections(tmpdir, monkeypatch):
+    connections = []
+    connect = sqlite3.connect
+
+    def tracked_connect(*args, **kwargs):
+        connections.append(connect(*args, **kwargs))
+        return connections[-1]
+
+    monkeypatch.setattr(sqlite3, "connect", tracked_connect)
+    catalog = Catalog(f"{tmpdir}/closed.sqlite")
+    assert len(catalog) == 0 and catalog.query() == []
+    assert len(connections) == 3
+    for conn in connections:
+        with pytest.raises(sqlite3.ProgrammingError):
+            conn.execute("SELECT 1")  # closed
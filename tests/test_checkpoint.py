@@ -0,0 +1,232 @@
+import glob
+import os
+import shutil
+import threading
+
+import numpy as np
+import pytest
+
+from slipper.sample.base_sampler import SamplingCancelled
+from slipper.sample.checkpoint import checkpoint_path, load_checkpoint, seed_rngs
+from slipper.sample.checkpoint_summary import (
+    CHECKPOINT_QUANTILES,
+    CheckpointSummary,
+    P2Quantiles,
+)
+from slipper.sample.pspline_sampler import PsplineSampler
+from slipper.sample.storage import TRACES_PREFIX
+
+SAMPLER_KWARGS = dict(Ntotal=120, burnin=40, checkpoint_every=25)
+
+
+def test_resume_matches_uninterrupted_run(test_pdgrm, tmpdir):
+    seed_rngs(0)
+    full = PsplineSampler(test_pdgrm, f"{tmpdir}/full", SAMPLER_KWARGS, dict(k=8))
+    full.run(verbose=False)
+    assert not os.path.exists(checkpoint_path(full.outdir))
+
+    outdir = f"{tmpdir}/resumed"
+    stop = threading.Event()
+
+    def stop_after_checkpoint(itr, n_steps):
+        if itr == 60:
+            stop.set()
+
+    seed_rngs(0)
+    killed = PsplineSampler(test_pdgrm, outdir, SAMPLER_KWARGS, dict(k=8))
+    with pytest.raises(SamplingCancelled):
+        killed.run(
+            verbose=False, stop_event=stop, progress_callback=stop_after_checkpoint
+        )
+    assert os.path.exists(checkpoint_path(outdir))
+
+    seed_rngs(123)  # the checkpoint restores the RNG states
+    resumed = PsplineSampler.resume(outdir, verbose=False)
+    assert not os.path.exists(checkpoint_path(outdir))
+    for var in ["phi", "delta", "tau", "v"]:
+        np.testing.assert_array_equal(
+            resumed.result.idata.posterior[var].values,
+            full.result.idata.posterior[var].values,
+        )
+
+
+@pytest.mark.parametrize(
+    "storage, retain, stop_at", [("memmap", "all", 60), ("memory", "post_burnin", 30)]
+)
+def test_resume_maps_the_checkpointed_traces(
+    test_pdgrm, tmpdir, storage, retain, stop_at
+):
+    kwargs = dict(SAMPLER_KWARGS, storage=storage, retain=retain, burnin_window=10)
+    seed_rngs(0)
+    full = PsplineSampler(test_pdgrm, f"{tmpdir}/full_{storage}", kwargs, dict(k=8))
+    full.run(verbose=False)
+
+    outdir = f"{tmpdir}/mapped_{storage}"
+    shutil.rmtree(outdir, ignore_errors=True)
+    stop = threading.Event()
+
+    def stop_after_checkpoint(itr, n_steps):
+        if itr == stop_at:
+            stop.set()
+
+    seed_rngs(0)
+    killed = PsplineSampler(test_pdgrm, outdir, kwargs, dict(k=8))
+    with pytest.raises(SamplingCancelled):
+        killed.run(
+            verbose=False, stop_event=stop, progress_callback=stop_after_checkpoint
+        )
+    # the checkpoint file only holds the rolling window, the kept rows are
+    # in the (single) traces directory it refers to
+    assert len(glob.glob(f"{outdir}/{TRACES_PREFIX}*")) == 1
+    with np.load(checkpoint_path(outdir)) as f:
+        windows = [f[key] for key in f.files if key.startswith("window/")]
+    assert all(len(rows) <= (0 if retain == "all" else 10) for rows in windows)
+    assert isinstance(load_checkpoint(outdir)["traces"]["V"], np.memmap)
+
+    resumed = PsplineSampler.resume(outdir, verbose=False)
+    assert not glob.glob(f"{outdir}/{TRACES_PREFIX}*")
+    assert not os.path.exists(checkpoint_path(outdir))
+    for var in ["phi", "delta", "tau", "v"]:
+        np.testing.assert_array_equal(
+            resumed.result.idata.posterior[var].values,
+            full.result.idata.posterior[var].values,
+        )
+
+    # a new run instead of a resume removes the traces of the old checkpoint
+    stop.clear()
+    with pytest.raises(SamplingCancelled):
+        PsplineSampler(test_pdgrm, outdir, kwargs, dict(k=8)).run(
+            verbose=False, stop_event=stop, progress_callback=stop_after_checkpoint
+        )
+    PsplineSampler(test_pdgrm, outdir, kwargs, dict(k=8)).run(verbose=False)
+    assert not glob.glob(f"{outdir}/{TRACES_PREFIX}*")
+
+
+def test_memmap_storage(test_pdgrm, tmpdir):
+    kwargs = dict(Ntotal=120, burnin=40)
+    seed_rngs(0)
+    in_memory = PsplineSampler(test_pdgrm, f"{tmpdir}/memory", kwargs, dict(k=8))
+    in_memory.run(verbose=False)
+
+    seed_rngs(0)
+    outdir = f"{tmpdir}/memmap"
+    # files of the user's in the output directory are left alone
+    os.makedirs(f"{outdir}/traces", exist_ok=True)
+    with open(f"{outdir}/traces/mydata.txt", "w") as f:
+        f.write("1 2 3")
+    memmap = PsplineSampler(
+        test_pdgrm, outdir, dict(kwargs, storage="memmap"), dict(k=8)
+    )
+    memmap.run(verbose=False)
+    assert not glob.glob(f"{outdir}/{TRACES_PREFIX}*")
+    assert os.path.exists(f"{outdir}/traces/mydata.txt")
+    for var in ["phi", "delta", "tau", "v"]:
+        np.testing.assert_array_equal(
+            memmap.result.idata.posterior[var].values,
+            in_memory.result.idata.posterior[var].values,
+        )
+
+
+def test_retain_post_burnin(test_pdgrm, tmpdir):
+    kwargs = dict(Ntotal=150, burnin=60)
+    seed_rngs(0)
+    full = PsplineSampler(test_pdgrm, f"{tmpdir}/all", kwargs, dict(k=8))
+    full.run(verbose=False)
+
+    seed_rngs(0)
+    kwargs = dict(kwargs, retain="post_burnin", burnin_window=20)
+    retained = PsplineSampler(test_pdgrm, f"{tmpdir}/retained", kwargs, dict(k=8))
+    retained.run(verbose=False)
+
+    draws = retained.result.idata.posterior.coords["draws"].values
+    np.testing.assert_array_equal(draws, np.arange(60, 150))
+    for var in ["phi", "delta", "tau", "v"]:
+        np.testing.assert_array_equal(
+            retained.result.idata.posterior[var].values,
+            full.result.idata.posterior[var].sel(draws=draws).values,
+        )
+    np.testing.assert_allclose(retained.result.psd_quantiles, full.result.psd_quantiles)
+
+
+def test_retain_post_burnin_without_burnin(test_pdgrm, tmpdir):
+    kwargs = dict(Ntotal=60, burnin=0)
+    seed_rngs(0)
+    full = PsplineSampler(test_pdgrm, f"{tmpdir}/all0", kwargs, dict(k=8))
+    full.run(verbose=False)
+
+    seed_rngs(0)
+    kwargs = dict(kwargs, retain="post_burnin", burnin_window=20)
+    retained = PsplineSampler(test_pdgrm, f"{tmpdir}/retained0", kwargs, dict(k=8))
+    retained.run(verbose=False)
+    for var in ["phi", "delta", "tau", "v"]:
+        np.testing.assert_array_equal(
+            retained.result.idata.posterior[var].values,
+            full.result.idata.posterior[var].values,
+        )
+
+
+def test_iter_samples(test_pdgrm, tmpdir):
+    kwargs = dict(Ntotal=120, burnin=40)
+    seed_rngs(0)
+    full = PsplineSampler(test_pdgrm, f"{tmpdir}/iter_full", kwargs, dict(k=8))
+    full.run(verbose=False)
+
+    for retain in [True, False]:
+        seed_rngs(0)
+        sampler = PsplineSampler(test_pdgrm, f"{tmpdir}/iter", kwargs, dict(k=8))
+        blocks = list(sampler.iter_samples(chunk_size=50, retain=retain))
+        assert [len(b["draws"]) for b in blocks] == [50, 50, 20]
+        tau = np.concatenate([b["τ"] for b in blocks])
+        v = np.concatenate([b["V"] for b in blocks])
+        np.testing.assert_array_equal(tau, full.result.idata.posterior["tau"])
+        np.testing.assert_array_equal(v, full.result.idata.posterior["v"])
+        assert (sampler.result is not None) == retain
+        assert sampler.sampler_kwargs["retain"] == "all"
+
+    # a later run keeps its draws
+    seed_rngs(0)
+    sampler.run(verbose=False)
+    np.testing.assert_array_equal(
+        sampler.result.idata.posterior["v"], full.result.idata.posterior["v"]
+    )
+
+
+def test_checkpoint_summary(test_pdgrm, tmpdir):
+    rng = np.random.default_rng(0)
+    x = rng.normal(size=(2000, 50)) * np.linspace(1, 2, 50)
+    sketch = P2Quantiles(CHECKPOINT_QUANTILES, 50)
+    for block in np.array_split(x, 7):
+        sketch.update(block)
+    exact = np.quantile(x, CHECKPOINT_QUANTILES, axis=0)
+    assert np.abs(sketch.quantiles - exact).mean() < 0.05
+
+    seed_rngs(0)
+    sampler = PsplineSampler(
+        test_pdgrm, f"{tmpdir}/summary", dict(Ntotal=400, burnin=100), dict(k=8)
+    )
+    sampler.run(verbose=False)
+    model = sampler.spline_model
+    summary = CheckpointSummary(400, 100, model.basis, test_pdgrm, model.knots)
+    posterior = sampler.result.idata.posterior
+    for itr in range(400):
+        draw = posterior.sel(draws=itr)
+        summary.add(itr, draw.tau, draw.v)
+        if itr % 150 == 0:
+            summary.update()
+    φδτ = np.stack([posterior[p].values.ravel() for p in ["phi", "delta", "tau"]], 1)
+    snapshot = summary.snapshot(φδτ, np.full(400, 0.5), np.arange(400))
+    assert set(snapshot).isdisjoint(summary.plot_kwargs)
+    np.testing.assert_array_equal(snapshot["draw_idx"], np.arange(400))
+    exact = sampler.result.get_model_quantiles(100)[0]
+    np.testing.assert_allclose(snapshot["model_quants"][0], exact, rtol=0.1)
+
+
+def test_checkpoint_plots_rendered_in_background(test_pdgrm, tmpdir):
+    outdir = f"{tmpdir}/checkpoint_plots"
+    shutil.rmtree(outdir, ignore_errors=True)
+    kwargs = dict(Ntotal=300, burnin=100, n_checkpoint_plts=4)
+    sampler = PsplineSampler(test_pdgrm, outdir, kwargs, dict(k=8))
+    sampler.run(verbose=False)
+    # the renderer is joined by run
+    assert sampler._renderer is None
+    assert len(glob.glob(f"{outdir}/checkpoint_*.png")) == 3
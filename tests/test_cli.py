@@ -0,0 +1,38 @@
+import json
+import os
+import shutil
+
+import numpy as np
+
+from slipper.cli import main
+from slipper.example_datasets.ar_data import generate_ar_timeseries
+
+
+def test_cli_fit(tmpdir):
+    datadir = f"{tmpdir}/cli_data"
+    outdir = f"{tmpdir}/cli_out"
+    shutil.rmtree(outdir, ignore_errors=True)
+    os.makedirs(datadir, exist_ok=True)
+    for i in range(2):
+        np.savetxt(
+            f"{datadir}/ts_{i}.txt", generate_ar_timeseries(order=2, n_samples=200)
+        )
+
+    args = [f"{datadir}/ts_*.txt", "--timeseries", "--outdir", outdir]
+    args += ["--Ntotal", "150", "--burnin", "50", "--k", "8", "--n-cores", "2"]
+    assert main(["fit"] + args) == 0
+    assert os.path.exists(f"{outdir}/ts_1/result.nc")
+
+    assert main(["fit"] + args) == 0  # completed outputs are skipped
+    with open(f"{outdir}/throughput.json") as f:
+        summary = json.load(f)
+    assert summary["n_skipped"] == 2 and summary["n_fitted"] == 0
+
+    # a failed fit gives a non-zero exit status
+    with open(f"{datadir}/ts_bad.txt", "w") as f:
+        f.write("not data")
+    assert main(["fit"] + args) == 1
+    with open(f"{outdir}/throughput.json") as f:
+        summary = json.load(f)
+    assert summary["failed"] == [f"{datadir}/ts_bad.txt"]
+    os.remove(f"{datadir}/ts_bad.txt")
@@ -0,0 +1,87 @@
+import os
+import stat
+import threading
+from multiprocessing import AuthenticationError
+
+import numpy as np
+import pytest
+
+from slipper.parallel import (
+    SharedArrays,
+    attach_array,
+    attach_psplines,
+    fit_chains,
+    plan_layout,
+)
+from slipper.parallel.service import FitClient, FitService, parse_address
+from slipper.sample.sampling_result import Result
+from slipper.splines.initialisation import knot_locator
+from slipper.splines.p_splines import PSplines
+
+
+def test_shared_arrays_are_views(test_pdgrm):
+    knots = knot_locator(test_pdgrm, k=10, degree=3)
+    psplines = PSplines(knots=knots, degree=3, diffMatrixOrder=2)
+    with SharedArrays() as shared:
+        handle = shared.share(test_pdgrm)
+        assert shared.share(test_pdgrm) == handle  # shared once
+        data = attach_array(handle)
+        assert np.array_equal(data, test_pdgrm)
+        assert not data.flags.writeable
+        assert np.shares_memory(data, attach_array(handle))
+
+        model = attach_psplines(shared.share_psplines(psplines))
+        assert np.array_equal(model.basis, psplines.basis)
+        assert np.array_equal(model(v=np.zeros(9)), psplines(v=np.zeros(9)))
+
+
+def test_plan_layout():
+    layout = plan_layout(n_chains=64, n=1000, k=30, n_cores=16)
+    assert layout.n_processes == 16 and layout.chains_per_process == 4
+    assert layout.blas_threads == 1
+    # a single large problem gets the spare cores as BLAS threads
+    layout = plan_layout(n_chains=2, n=10**6, k=200, n_cores=16)
+    assert layout.n_processes == 2 and layout.blas_threads == 8
+    assert layout.threads_per_process == 8
+
+
+def test_fit_chains(test_pdgrm, tmpdir):
+    paths = fit_chains(
+        test_pdgrm,
+        n_chains=2,
+        outdir=f"{tmpdir}/chains",
+        sampler_kwargs=dict(Ntotal=150, burnin=50),
+        spline_kwargs=dict(k=8),
+        n_cores=2,
+    )
+    for path in paths:
+        assert os.path.exists(path)
+    attrs = Result.load(paths[0]).idata.sample_stats.attrs
+    assert attrs["layout_n_processes"] == 2
+
+
+def test_fit_service(test_pdgrm, tmpdir):
+    for host in ["0.0.0.0", "192.168.1.1"]:
+        with pytest.raises(ValueError):
+            FitService(parse_address(f"{host}:0"))
+    assert parse_address("[::1]:6789") == ("::1", 6789)
+
+    address = f"{tmpdir}/slipper.sock"
+    service = FitService(address)
+    assert len(service.authkey) == 32  # random
+    assert stat.S_IMODE(os.stat(address).st_mode) == 0o600
+    thread = threading.Thread(target=service.serve_forever)
+    thread.start()
+    kwargs = dict(sampler_kwargs=dict(Ntotal=150, burnin=50), spline_kwargs=dict(k=8))
+    with pytest.raises(AuthenticationError):
+        FitClient(address, authkey=b"wrong")
+    with FitClient(address, authkey=service.authkey) as client:
+        for i in range(2):
+            result = client.fit(test_pdgrm, outdir=f"{tmpdir}/service_{i}", **kwargs)
+            assert isinstance(result, Result)
+        # without an outdir, the files are written to a removed temporary dir
+        assert isinstance(client.fit(test_pdgrm, **kwargs), Result)
+        assert client.stats()["matrix_cache"]["hits"] >= 1
+        client.shutdown()
+    thread.join()
+    assert not os.path.exists(address)
@@ -0,0 +1,36 @@
+from slipper.sample import planner
+from slipper.sample.pspline_sampler import PsplineSampler
+
+
+def test_plan_run(test_pdgrm, tmpdir):
+    kwargs = dict(Ntotal=300, burnin=100, storage="auto")
+    sampler = PsplineSampler(test_pdgrm, f"{tmpdir}/plan", kwargs, dict(k=10))
+    plan = sampler.plan(memory_limit=2**30)
+    assert plan.storage == "memory"
+    assert plan.trace_bytes == 300 * (9 + 6) * 8
+    assert plan.posterior_bytes == 200 * len(test_pdgrm) * 8
+    assert plan.warnings == ()
+
+    tight = sampler.plan(memory_limit=plan.trace_bytes)
+    assert tight.storage == "memmap"
+
+    tiny = sampler.plan(memory_limit=plan.posterior_bytes)
+    assert len(tiny.warnings) == 1
+    assert "PSD quantiles" in tiny.warnings[0]
+
+    sampler.sampler_kwargs = dict(kwargs, retain="post_burnin", burnin_window=10)
+    assert sampler.plan().n_rows == 10 + 200
+
+
+def test_available_memory(tmp_path, monkeypatch):
+    (tmp_path / "meminfo").write_text("MemTotal: 8000 kB\nMemAvailable: 4000 kB\n")
+    monkeypatch.setattr(planner, "_MEMINFO", str(tmp_path / "meminfo"))
+    monkeypatch.setattr(planner, "_CGROUP_ROOT", str(tmp_path))
+    assert planner._available_memory() == 4000 * 1024
+
+    (tmp_path / "memory.max").write_text("max\n")
+    assert planner._available_memory() == 4000 * 1024
+
+    (tmp_path / "memory.max").write_text(f"{3 * 2**20}\n")
+    (tmp_path / "memory.current").write_text(f"{2**20}\n")
+    assert planner._available_memory() == 2 * 2**20
@@ -0,0 +1,169 @@
+import glob
+import json
+import os
+import shutil
+import subprocess
+import sys
+
+import numpy as np
+import pytest
+from arviz import InferenceData
+
+from slipper.sample import plot_policy
+from slipper.sample.background import _PACKAGE_ROOT, start_function
+from slipper.sample.checkpoint import seed_rngs
+from slipper.sample.plot_policy import (
+    render_deferred,
+    render_in_background,
+    summary_path,
+    wait_for_background_plots,
+)
+from slipper.sample.pspline_sampler import PsplineSampler
+from slipper.sample.sampling_result import Result
+
+
+def test_lazy_load(test_pdgrm, tmpdir):
+    seed_rngs(0)
+    sampler = PsplineSampler(
+        test_pdgrm, f"{tmpdir}/lazy", dict(Ntotal=120, burnin=40), dict(k=8)
+    )
+    sampler.run(verbose=False)
+
+    eager = Result.load(sampler.result_path)
+    with Result.load(sampler.result_path, lazy=True) as lazy:
+        assert not lazy.idata.posterior["v"].variable._in_memory
+        assert not lazy.idata.constant_data["basis"].variable._in_memory
+        assert lazy.burn_in == 40
+        assert lazy.k == eager.k
+        np.testing.assert_array_equal(lazy.knots, eager.knots)
+        np.testing.assert_allclose(lazy.psd_quantiles, eager.psd_quantiles)
+
+
+def test_compact_save(test_pdgrm, tmpdir):
+    seed_rngs(0)
+    sampler = PsplineSampler(
+        test_pdgrm, f"{tmpdir}/compact", dict(Ntotal=120, burnin=40), dict(k=8)
+    )
+    sampler.run(verbose=False)
+    fname = f"{tmpdir}/compact/compact.nc"
+    sampler.result.save(fname, compact=True, float32=True)
+    assert os.path.getsize(fname) < os.path.getsize(sampler.result_path)
+
+    full, compact = Result.load(sampler.result_path), Result.load(fname)
+    assert "basis" not in compact.idata.constant_data
+    assert compact.idata.posterior["v"].dtype == np.float32
+    np.testing.assert_array_equal(compact.basis, full.basis)
+    np.testing.assert_allclose(compact.psd_quantiles, full.psd_quantiles, rtol=1e-4)
+
+
+def test_psd_products_are_stored(test_pdgrm, tmpdir, monkeypatch):
+    seed_rngs(0)
+    sampler = PsplineSampler(
+        test_pdgrm, f"{tmpdir}/products", dict(Ntotal=120, burnin=40), dict(k=8)
+    )
+    sampler.run(verbose=False)
+
+    loaded = Result.load(sampler.result_path)
+    assert "psd_products" in loaded.idata.groups()
+    monkeypatch.setattr(Result, "get_model_quantiles", None)  # must not recompute
+    np.testing.assert_array_equal(loaded.psd_quantiles, sampler.result.psd_quantiles)
+    monkeypatch.undo()
+
+    # products of different draws are recomputed
+    loaded = Result.load(sampler.result_path)
+    loaded.idata.posterior = loaded.idata.posterior.sel(draws=slice(None, 100))
+    assert loaded.psd_quantiles.shape == sampler.result.psd_quantiles.shape
+    assert not np.allclose(loaded.psd_quantiles, sampler.result.psd_quantiles)
+
+
+def test_plot_policies(test_pdgrm, tmpdir):
+    outdir = f"{tmpdir}/plot_policies"
+    shutil.rmtree(outdir, ignore_errors=True)
+    for policy in ["deferred", "background"]:
+        sampler = PsplineSampler(
+            test_pdgrm,
+            f"{outdir}/{policy}",
+            dict(Ntotal=120, burnin=40, plots=policy),
+            dict(k=8),
+        )
+        sampler.run(verbose=False)
+    assert not os.path.exists(summary_path(f"{outdir}/deferred/result.nc"))
+    wait_for_background_plots()
+    assert os.path.exists(summary_path(f"{outdir}/background/result.nc"))
+
+    assert render_deferred(f"{outdir}/*/result.nc") == 1
+    assert os.path.exists(summary_path(f"{outdir}/deferred/result.nc"))
+    for policy in ["deferred", "background"]:
+        result = Result.load(f"{outdir}/{policy}/result.nc")
+        assert "psd_products" in result.idata.groups()
+
+
+def test_background_renderers_are_capped(monkeypatch):
+    def start_function(module, function, args):
+        return subprocess.Popen(
+            [sys.executable, "-c", "import time; time.sleep(0.5)"] + args
+        )
+
+    monkeypatch.setattr(plot_policy, "start_function", start_function)
+    monkeypatch.setattr(plot_policy, "MAX_BACKGROUND_PLOTS", 2)
+    processes = [render_in_background(f"result_{i}.nc") for i in range(3)]
+    assert processes[0].poll() is not None  # waited for before the third
+    assert processes[2].poll() is None
+    wait_for_background_plots()
+    assert all(process.returncode == 0 for process in processes)
+
+
+def test_background_process_path(tmp_path):
+    # the package root must not shadow the stdlib (it is site-packages when
+    # slipper is installed)
+    script = tmp_path / "path.py"
+    script.write_text(
+        "import json, sys\n"
+        f"json.dump(sys.path, open({str(tmp_path / 'path.json')!r}, 'w'))\n"
+    )
+    assert start_function("runpy", "run_path", [str(script)]).wait() == 0
+    path = json.loads((tmp_path / "path.json").read_text())
+    stdlib = os.path.dirname(os.__file__)
+    assert path.index(stdlib) < len(path) - 1 - path[::-1].index(_PACKAGE_ROOT)
+
+
+def test_background_plot_from_unguarded_script(test_pdgrm, tmpdir):
+    # a script without an `if __name__ == "__main__"` guard must only run once
+    outdir = f"{tmpdir}/unguarded"
+    shutil.rmtree(outdir, ignore_errors=True)
+    os.makedirs(outdir)
+    np.save(f"{outdir}/data.npy", test_pdgrm)
+    with open(f"{outdir}/script.py", "w") as f:
+        f.write(
+            "import numpy as np\n"
+            "from slipper.sample.pspline_sampler import PsplineSampler\n"
+            f"open('{outdir}/runs.txt', 'a').write('run\\n')\n"
+            f"data = np.load('{outdir}/data.npy')\n"
+            "kwargs = dict(Ntotal=120, burnin=40, n_checkpoint_plts=3)\n"
+            "kwargs['plots'] = 'background'\n"
+            f"PsplineSampler(data, '{outdir}/fit', kwargs, dict(k=8)).run(verbose=False)\n"
+        )
+    subprocess.run([sys.executable, f"{outdir}/script.py"], check=True, timeout=300)
+    with open(f"{outdir}/runs.txt") as f:
+        assert f.read() == "run\n"
+    assert os.path.exists(summary_path(f"{outdir}/fit/result.nc"))
+    assert glob.glob(f"{outdir}/fit/checkpoint_*.png")
+
+
+def test_interrupted_save_leaves_no_result(test_pdgrm, tmpdir, monkeypatch):
+    outdir = f"{tmpdir}/interrupted_save"
+    shutil.rmtree(outdir, ignore_errors=True)
+    sampler = PsplineSampler(
+        test_pdgrm, outdir, dict(Ntotal=120, burnin=40, plots="none"), dict(k=8)
+    )
+    sampler.run(verbose=False)
+
+    def killed_mid_write(self, fname, **kwargs):
+        with open(fname, "w") as f:
+            f.write("truncated")
+        raise KeyboardInterrupt
+
+    monkeypatch.setattr(InferenceData, "to_netcdf", killed_mid_write)
+    with pytest.raises(KeyboardInterrupt):
+        sampler.result.save(f"{outdir}/copy.nc", plot=False)
+    assert os.listdir(outdir) == ["result.nc"]
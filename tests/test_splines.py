@@ -1,7 +1,26 @@
+import shutil
+from concurrent.futures import ThreadPoolExecutor
+
 import matplotlib.pyplot as plt
 import numpy as np
+import pytest
+from scipy import sparse
+from scipy.interpolate import interp1d
+from scipy.stats import median_abs_deviation
 
+from slipper.sample.post_processing import (
+    _band_statistics,
+    generate_spline_posterior,
+    generate_spline_quantiles,
+)
+from slipper.splines.cache import SplineMatrixCache, matrix_key
 from slipper.splines.p_splines import PSplines
+from slipper.splines.utils import (
+    build_spline_model,
+    convert_v_samples_to_weights,
+    convert_v_to_weights,
+    unroll_list_to_new_length,
+)
 
 
 def test_spline_creation(tmpdir):
@@ -26,3 +45,109 @@ def test_initial_guess(test_pdgrm, tmpdir):
     plt.plot(newx, test_pdgrm, ",k")
     plt.tight_layout()
     fig.savefig(f"{tmpdir}/test_spline_init_guess.png")
+
+
+def test_unroll_index_matches_interp1d():
+    for old_len, n in [(501, 500), (501, 1999), (10, 3), (7, 7), (400, 1001)]:
+        old = np.random.uniform(0, 1, old_len)
+        f = interp1d(np.linspace(0, 1, old_len), old, kind="nearest")
+        expected = f(np.linspace(0, 1, n))
+        assert np.array_equal(unroll_list_to_new_length(old, n), expected)
+
+
+def test_psplines_are_immutable_and_thread_safe(test_pdgrm):
+    pspline = PSplines(knots=np.linspace(0, 1, 10), degree=3, diffMatrixOrder=2)
+    with pytest.raises(AttributeError):
+        pspline.n_grid_points = 10
+    with pytest.raises(ValueError):
+        pspline.basis[0, 0] = 1.0
+    grid = pspline.grid_points.copy()
+    pspline.guess_weights(test_pdgrm)
+    assert np.array_equal(pspline.grid_points, grid)
+
+    v = np.random.normal(size=(16, pspline.n_basis - 1))
+    sizes = [len(test_pdgrm), 100, None, 2000]
+    expected = [pspline(v=v[i], n=sizes[i % 4]) for i in range(16)]
+    with ThreadPoolExecutor(4) as pool:
+        got = list(pool.map(lambda i: pspline(v=v[i], n=sizes[i % 4]), range(16)))
+    for e, g in zip(expected, got):
+        assert np.array_equal(e, g)
+
+
+def test_matrix_cache(tmpdir):
+    knots = np.linspace(0, 1, 12)
+    shutil.rmtree(f"{tmpdir}/matrix_cache", ignore_errors=True)
+    cache = SplineMatrixCache(cache_dir=f"{tmpdir}/matrix_cache")
+    key = matrix_key(knots, degree=3, diffMatrixOrder=2, n_grid_points=501)
+    build = lambda: PSplines(knots, degree=3, use_cache=False)  # noqa: E731
+    expected = build()
+    basis, penalty = cache.get_or_build(
+        key, lambda: (expected.basis, expected.penalty_matrix)
+    )
+    assert cache.get_or_build(key, None)[0] is basis
+    assert cache.stats == dict(hits=1, disk_hits=0, misses=1)
+
+    # a fresh process (empty memory cache) reads the memory-mapped files
+    cache = SplineMatrixCache(cache_dir=f"{tmpdir}/matrix_cache")
+    basis, penalty = cache.get_or_build(key, None)
+    assert isinstance(basis, np.memmap)
+    assert np.array_equal(basis, expected.basis)
+    assert np.array_equal(penalty, expected.penalty_matrix)
+    assert np.array_equal(PSplines(knots, degree=3).basis, expected.basis)
+
+
+def test_vectorised_spline_posterior():
+    pspline = PSplines(knots=np.linspace(0, 1, 12), degree=3, diffMatrixOrder=2)
+    v = np.random.normal(0, 3, size=(50, pspline.n_basis - 1))
+    v[0, 0] = 800  # overflows exp
+    tau = np.random.uniform(0.5, 2, 50)
+    weights = convert_v_samples_to_weights(v)
+    for i in range(50):
+        assert np.array_equal(weights[i], convert_v_to_weights(v[i]))
+
+    expected = [
+        build_spline_model(v[i], pspline.basis, 333) * tau[i] for i in range(50)
+    ]
+    dense = generate_spline_posterior(333, pspline.basis, tau, v)
+    np.testing.assert_allclose(dense, expected, rtol=1e-12)
+    sparse_basis = sparse.csr_matrix(pspline.basis)
+    np.testing.assert_allclose(
+        generate_spline_posterior(333, sparse_basis, tau, v), dense, rtol=1e-12
+    )
+
+
+def test_blocked_spline_quantiles():
+    pspline = PSplines(knots=np.linspace(0, 1, 12), degree=3, diffMatrixOrder=2)
+    v = np.random.normal(size=(200, pspline.n_basis - 1))
+    tau = np.random.uniform(0.5, 2, 200)
+    for n in [100, 1500]:
+        splines = generate_spline_posterior(n, pspline.basis, tau, v)
+        expected = np.quantile(splines, [0.5, 0.05, 0.95], axis=0)
+        quants = generate_spline_quantiles(
+            n, pspline.basis, tau, v, uniform_bands=False, max_bytes=10_000
+        )
+        np.testing.assert_allclose(quants, expected, rtol=1e-12)
+
+        # the uniform band does not depend on the blocks
+        uniform = generate_spline_quantiles(n, pspline.basis, tau, v)
+        blocked = generate_spline_quantiles(n, pspline.basis, tau, v, max_bytes=1)
+        np.testing.assert_allclose(blocked, uniform, rtol=1e-12)
+        assert np.all(uniform[1] <= uniform[0]) and np.all(uniform[0] <= uniform[2])
+
+
+def test_band_statistics_single_pass():
+    for n_draws in [7, 200]:
+        splines = np.random.lognormal(size=(n_draws, 30))
+        splines[:, 0] = 1.0  # MAD of 0
+        lnsplines = np.log(splines + 0.001) - 0.001 / (splines + 0.001)
+        mad = median_abs_deviation(lnsplines, axis=0)
+        deviation = np.abs(lnsplines - np.median(lnsplines, axis=0))
+        expected = np.vstack(
+            [
+                np.quantile(splines, [0.5, 0.05, 0.95], axis=0),
+                np.median(lnsplines, axis=0),
+                mad,
+                np.max(deviation, axis=0) / np.where(mad == 0, 1e-10, mad),
+            ]
+        )
+        np.testing.assert_allclose(_band_statistics(splines), expected, rtol=1e-12)
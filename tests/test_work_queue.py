@@ -0,0 +1,50 @@
+import os
+import shutil
+
+import numpy as np
+
+from slipper.parallel.work_queue import WorkQueue, run_worker
+
+
+def _make_queue(test_pdgrm, tmpdir, lease=3600):
+    qdir = f"{tmpdir}/queue"
+    shutil.rmtree(qdir, ignore_errors=True)
+    np.save(f"{tmpdir}/pdgrm.npy", test_pdgrm)
+    manifest = dict(
+        sampler_kwargs=dict(Ntotal=150, burnin=50),
+        spline_kwargs=dict(k=8),
+        tasks=[dict(data=f"{tmpdir}/pdgrm.npy", seed=i) for i in range(2)],
+    )
+    return WorkQueue.create(qdir, manifest, lease=lease)
+
+
+def test_worker_runs_queue(test_pdgrm, tmpdir):
+    queue = _make_queue(test_pdgrm, tmpdir)
+    assert queue.status()["pending"] == 2
+    assert run_worker(queue.queue_dir) == 2
+    assert queue.status() == dict(pending=0, running=0, done=2, failed=0)
+    assert os.path.exists(f"{queue.queue_dir}/results/task_000001/result.nc")
+
+    # workers started with the manifest do not re-enqueue the campaign
+    queue = WorkQueue.create(queue.queue_dir, dict(tasks=[dict(data="other.npy")]))
+    assert queue.status() == dict(pending=0, running=0, done=2, failed=0)
+
+
+def test_expired_lease_is_reclaimed(test_pdgrm, tmpdir):
+    queue = _make_queue(test_pdgrm, tmpdir, lease=0)
+    task = queue.claim()  # the worker 'crashes' after claiming
+    assert queue.status()["running"] == 1
+    assert queue.reclaim_expired() == 1
+    reclaimed = queue.claim()
+    assert reclaimed.id == task.id and reclaimed.spec["attempts"] == 2
+
+
+def test_reclaim_rechecks_the_lease(test_pdgrm, tmpdir, monkeypatch):
+    queue = _make_queue(test_pdgrm, tmpdir, lease=0)
+    queue.claim()
+    # the task is claimed afresh between the first check and the rename
+    checks = iter([True, False])
+    monkeypatch.setattr(queue, "_expired", lambda path: next(checks))
+    assert queue.reclaim_expired() == 0
+    assert queue.status()["running"] == 1
+    assert len(os.listdir(f"{queue.queue_dir}/running")) == 1
@@ -0,0 +1,51 @@
+import threading
+
+import numpy as np
+import pytest
+
+from slipper.sample.base_sampler import SamplingCancelled
+from slipper.sample.checkpoint import seed_rngs
+from slipper.sample.pspline_sampler import PsplineSampler
+from slipper.sample.sampling_result import Result
+
+pytest.importorskip("zarr")
+
+SAMPLER_KWARGS = dict(Ntotal=120, burnin=40, result_store="zarr", flush_every=25)
+
+
+def test_zarr_result_store(test_pdgrm, tmpdir):
+    seed_rngs(0)
+    sampler = PsplineSampler(test_pdgrm, f"{tmpdir}/zarr", SAMPLER_KWARGS, dict(k=8))
+    sampler.run(verbose=False)
+    assert sampler.result_path.endswith("result.zarr")
+
+    stored = Result.load(sampler.result_path)
+    for var in ["phi", "delta", "tau", "v"]:
+        np.testing.assert_array_equal(
+            stored.idata.posterior[var].values,
+            sampler.result.idata.posterior[var].values,
+        )
+    assert stored.idata.posterior.chunks["draws"][0] == 25
+    assert "psd_products" in stored.idata.groups()
+    assert stored.idata.sample_stats.attrs["runtime"] == pytest.approx(
+        sampler.result.idata.sample_stats.attrs["runtime"]
+    )
+    np.testing.assert_allclose(stored.psd_quantiles, sampler.result.psd_quantiles)
+
+
+def test_zarr_partial_result(test_pdgrm, tmpdir):
+    stop = threading.Event()
+
+    def stop_at_70(itr, n_steps):
+        if itr == 70:
+            stop.set()
+
+    kwargs = dict(SAMPLER_KWARGS, retain="post_burnin")
+    sampler = PsplineSampler(test_pdgrm, f"{tmpdir}/zarr_partial", kwargs, dict(k=8))
+    with pytest.raises(SamplingCancelled):
+        sampler.run(verbose=False, progress_callback=stop_at_70, stop_event=stop)
+
+    # the draws flushed before the run stopped can be read
+    partial = Result.load(sampler.result_path)
+    draws = partial.idata.posterior["draws"].values
+    np.testing.assert_array_equal(draws, np.arange(40, 65))